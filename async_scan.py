@@ -0,0 +1,302 @@
+# async_scan.py
+
+import asyncio
+import functools
+import inspect
+import os
+import queue
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import Executor, Future
+
+from folder_parser import natural_sort_key
+from scan_scheduler import DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS, DEFAULT_RETRY_DELAY, PERMANENT_ERRORS, StageTimeout, WalkTimeout
+from size_tree import DirectoryNode, scan_directory
+
+# Threads shared by every root for the blocking directory listing and stat calls
+DEFAULT_ASYNC_THREADS = 32
+
+# Minimal executor on daemon threads, started as calls arrive up to `threads`. A listing call that
+# hangs on a dead share keeps its thread but never holds up interpreter exit, unlike
+# ThreadPoolExecutor's workers; grow() raises the bound to make up for a thread that is stuck.
+class _DaemonExecutor(Executor):
+    # `_idle` counts idle threads less the calls queued for one
+    def __init__(self, threads, name):
+        self.name = name
+        self.limit = threads
+        self.threads = 0
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._jobs = queue.SimpleQueue()
+
+    def grow(self, count=1):
+        with self._lock:
+            self.limit += count
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, fn, args = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._idle += 1
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self._lock:
+            start = self._idle <= 0 and self.threads < self.limit
+            if start:
+                self.threads += 1
+            else:
+                self._idle -= 1
+        self._jobs.put((future, fn, args))
+        if start:
+            threading.Thread(target=self._work, name=f"{self.name}_{self.threads}", daemon=True).start()
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        for _ in range(self.threads):
+            self._jobs.put(None)
+
+# Function to order the paths of a subtree as size_tree.refresh_tree produces them, whatever order the
+# concurrent listings finished in: subdirectories in name order, each before (`children_first`) or
+# after its parent
+def _walk_order(root, children_first=False):
+    last = (1,) if children_first else (-1,)
+
+    def key(path):
+        parts = () if path == root else os.path.relpath(path, root).split(os.sep)
+        return tuple((0, part) for part in parts) + (last,)
+    return key
+
+# Function to stat a directory and list it again unless its mtime still matches its cached node, in
+# one call so each directory costs a single trip to the thread pool. Returns (mtime, own size,
+# subdirs, whether it was listed).
+def check_directory(path, node):
+    mtime_ns = os.stat(path).st_mtime_ns
+    if node is not None and node.mtime_ns == mtime_ns:
+        return mtime_ns, node.own_size, node.subdirs, False
+    own_size, subdirs = scan_directory(path)
+    return mtime_ns, own_size, subdirs, True
+
+# Function to bring a subtree up to date like size_tree.refresh_tree, with the subdirectories of each
+# directory checked concurrently. `run` runs a blocking call off the event loop. Returns the same
+# (node, changed nodes by path, paths listed again, directories checked).
+async def refresh_tree_async(path, cached_nodes, run):
+    changed = {}
+    listed = []
+    checked = 0
+
+    async def refresh(current):
+        nonlocal checked
+        node = cached_nodes.get(current)
+        mtime_ns, own_size, subdirs, relisted = await run(check_directory, current, node)
+        checked += 1
+        if relisted:
+            listed.append(current)
+        results = await asyncio.gather(*(refresh(os.path.join(current, name)) for name in subdirs), return_exceptions=True)
+        children = []
+        for name, result in zip(subdirs, results):
+            if isinstance(result, FileNotFoundError):
+                # Removed since the parent was listed; its parent's mtime changed too, so it is relisted next time
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            children.append((name, result))
+        new_node = DirectoryNode(mtime_ns, own_size, subdirs, own_size + sum(child.total for _, child in children))
+        if node != new_node:
+            changed[current] = new_node
+        return new_node
+
+    node = await refresh(path)
+    listed.sort(key=_walk_order(path))
+    children_first = _walk_order(path, children_first=True)
+    return node, dict(sorted(changed.items(), key=lambda item: children_first(item[0]))), listed, checked
+
+# Function to list one directory for a file list: its files as (name, size) and its subdirectory
+# names, both in natural name order. Like os.walk, symlinked directories are not descended into and a
+# directory that cannot be listed is skipped; a file whose size cannot be read raises, as getsize does.
+def list_directory(path):
+    files, subdirs = [], []
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return files, subdirs
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if not entry.is_symlink():
+                subdirs.append(entry.name)
+        else:
+            files.append((entry.name, entry.stat().st_size))
+    files.sort(key=lambda item: natural_sort_key(item[0]))
+    subdirs.sort(key=natural_sort_key)
+    return files, subdirs
+
+# Function to build a car folder's file list like get_file_list_for_folder, listing subdirectories
+# concurrently; the entries come out in the same top-down, natural name order
+async def file_list_async(folder_path, run):
+    async def walk(dirpath):
+        files, subdirs = await run(list_directory, dirpath)
+        entries = [(os.path.relpath(os.path.join(dirpath, name), folder_path), size) for name, size in files]
+        for child in await asyncio.gather(*(walk(os.path.join(dirpath, name)) for name in subdirs)):
+            entries.extend(child)
+        return entries
+
+    return await walk(folder_path)
+
+# Runs per-folder tasks on an asyncio event loop in a background thread. Coroutine tasks (the async
+# walkers above) are given `run`, which sends each blocking listing or stat call to a small shared pool
+# of `threads`; plain functions run whole on that pool. A semaphore per root (by default the folder's
+# parent, the game root) allows `max_workers` folders of that root in flight at once, so thousands of
+# queued folders cost a coroutine each rather than a thread. Timeouts, retries and the stage deadline
+# behave as in AdaptiveScheduler, but the per-root limit is fixed. submit() returns a
+# concurrent.futures.Future, so the scan stages use either scheduler the same way.
+class AsyncScheduler:
+    def __init__(self, name='scan', min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS, root_of=os.path.dirname, log=None,
+                 timeout=None, stage_timeout=None, retries=0, retry_delay=DEFAULT_RETRY_DELAY, threads=DEFAULT_ASYNC_THREADS):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.root_of = root_of
+        self.log = log
+        self.timeout = timeout
+        self.stage_timeout = stage_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.deadline = time.perf_counter() + stage_timeout if stage_timeout else None
+        self.timed_out = 0
+        self.retried = 0
+        self.roots = {}
+        self._futures = []
+        # Tasks of folders waiting for a slot of their root or for a retry, which a Ctrl-C cancels
+        self._waiting = set()
+        self._executor = _DaemonExecutor(threads, f"{name}-io")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=f"{name}-loop", daemon=True)
+        self._thread.start()
+
+    # Run a blocking call on the shared pool; awaited by the walkers
+    def run(self, fn, *args):
+        return self._loop.run_in_executor(self._executor, fn, *args)
+
+    def submit(self, fn, folder_path, *args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(self._folder(fn, folder_path, args, kwargs), self._loop)
+        self._futures.append(future)
+        return future
+
+    def _root(self, root):
+        state = self.roots.get(root)
+        if state is None:
+            state = self.roots[root] = {"semaphore": asyncio.Semaphore(self.max_workers), "in_flight": 0, "peak": 0, "completed": 0, "busy_seconds": 0.0}
+        return state
+
+    # Await `awaitable` within the folder timeout and the stage deadline, whichever is nearer
+    async def _within(self, awaitable, timeout, folder_path, attempt):
+        remaining = self.deadline - time.perf_counter() if self.deadline else None
+        # Whether the folder timeout is the nearer limit, rather than the stage deadline
+        folder_limited = remaining is None or (timeout is not None and timeout < remaining)
+        limit = timeout if folder_limited else remaining
+        try:
+            return await asyncio.wait_for(awaitable, max(limit, 0.0)) if limit is not None else await awaitable
+        except asyncio.TimeoutError:
+            if folder_limited:
+                self._executor.grow()
+                raise WalkTimeout(folder_path, timeout, attempt) from None
+            raise StageTimeout(folder_path, self.stage_timeout) from None
+
+    async def _call(self, fn, folder_path, args, kwargs):
+        if inspect.iscoroutinefunction(fn):
+            return await fn(folder_path, *args, run=self.run, **kwargs)
+        return await self.run(functools.partial(fn, folder_path, *args, **kwargs))
+
+    async def _folder(self, fn, folder_path, args, kwargs):
+        state = self._root(self.root_of(folder_path))
+        task = asyncio.current_task()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._waiting.add(task)
+                try:
+                    await self._within(state["semaphore"].acquire(), None, folder_path, attempt)
+                finally:
+                    self._waiting.discard(task)
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+                start = time.perf_counter()
+                try:
+                    result = await self._within(self._call(fn, folder_path, args, kwargs), self.timeout, folder_path, attempt)
+                finally:
+                    state["in_flight"] -= 1
+                    state["semaphore"].release()
+                state["completed"] += 1
+                state["busy_seconds"] += time.perf_counter() - start
+                return result
+            except OSError as error:
+                if isinstance(error, WalkTimeout):
+                    self.timed_out += 1
+                if isinstance(error, (StageTimeout,) + PERMANENT_ERRORS) or attempt > self.retries:
+                    if isinstance(error, WalkTimeout) and self.log:
+                        self.log(f"{self.name}: giving up on '{folder_path}': {error}")
+                    raise
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                self.retried += 1
+                if self.log:
+                    self.log(f"{self.name}: retrying '{folder_path}' in {delay:g}s (attempt {attempt + 1} of {self.retries + 1}) after: {error}")
+                self._waiting.add(task)
+                try:
+                    await self._within(asyncio.sleep(delay), None, folder_path, attempt)
+                finally:
+                    self._waiting.discard(task)
+
+    def snapshot(self):
+        return {root: {"limit": self.max_workers, "completed": state["completed"], "peak": state["peak"],
+                       "latency": round(state["busy_seconds"] / state["completed"], 6) if state["completed"] else None}
+                for root, state in list(self.roots.items())}
+
+    # One line per root with its folders, peak concurrency and mean time per folder
+    def summary_lines(self):
+        lines = []
+        for root, state in self.snapshot().items():
+            latency = "n/a" if state["latency"] is None else f"{state['latency'] * 1000:.1f} ms per folder"
+            lines.append(f"{self.name}: '{root}' walked {state['completed']} folders, at most {state['peak']} at once ({latency})")
+        if self.timed_out or self.retried:
+            lines.append(f"{self.name}: {self.timed_out} walks timed out, {self.retried} retries")
+        return lines
+
+    # Cancel the folders that have not started; walks already running finish, as in AdaptiveScheduler
+    async def _cancel_waiting(self, everything):
+        for task in asyncio.all_tasks() if everything else list(self._waiting):
+            if task is not asyncio.current_task():
+                task.cancel()
+
+    # The loop is only stopped once every task has settled. Without `wait`, running walks are cancelled
+    # too (their blocking calls still finish on the pool, unseen).
+    def shutdown(self, wait=True, cancel_futures=False):
+        if self._loop.is_running():
+            if cancel_futures or not wait:
+                asyncio.run_coroutine_threadsafe(self._cancel_waiting(everything=not wait), self._loop).result()
+            futures.wait(self._futures)
+        self._futures = []
+        if self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
@@ -0,0 +1,1188 @@
+# bench.py
+
+import argparse
+import filecmp
+import json
+import os
+import importlib
+import pickle
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from mappings_cache import MAPPINGS_SOURCE, compile_mappings, derive_indexes, load_mappings
+from progress import ProgressReporter
+from run_history import DEFAULT_HISTORY_FILE, append_run, compare_runs, format_comparison, format_history, load_runs, make_run_record, resolve_run
+
+# Subfolders and file names that every generated car folder gets, modelled on real car folders
+SYNTHETIC_LAYOUT = [
+    ("", "carattribs.xml"),
+    ("", "{name}_caliperlf.carbin"),
+    ("", "{name}_body.carbin"),
+    ("", "{name}_wheellf.carbin"),
+    ("physics", "maxdata.xml"),
+    ("physics", "physicsdefinition.xml"),
+    ("liverymasks", "back.tga"),
+    ("liverymasks", "front.tga"),
+    ("liverymasks", "side.tga"),
+    ("textures", "{name}_body_diffuse.xds"),
+    ("textures", "{name}_body_normal.xds"),
+    ("textures", "{name}_interior.xds"),
+]
+
+# Function to create a synthetic car tree: `roots` game roots with `folders_per_root` car folders each.
+# Files are sparse, so large sizes cost no disk space. Returns {root_path: [car folder paths]}.
+def create_synthetic_tree(base_dir, roots=4, folders_per_root=250, files_per_folder=12, seed=0):
+    rng = random.Random(seed)
+    names = sorted(load_mappings().car_overrides, key=str.lower)
+    layout = (SYNTHETIC_LAYOUT * (files_per_folder // len(SYNTHETIC_LAYOUT) + 1))[:files_per_folder]
+    tree = {}
+    for root_index in range(roots):
+        root_path = os.path.join(base_dir, f"game{root_index:02d}", "media", "cars")
+        tree[root_path] = []
+        for name in rng.sample(names, min(folders_per_root, len(names))):
+            folder_path = os.path.join(root_path, name)
+            for file_index, (subdir, pattern) in enumerate(layout):
+                file_dir = os.path.join(folder_path, subdir)
+                os.makedirs(file_dir, exist_ok=True)
+                file_name = pattern.format(name=name.lower())
+                if file_index >= len(SYNTHETIC_LAYOUT):
+                    file_name = f"{file_index}_{file_name}"
+                with open(os.path.join(file_dir, file_name), 'wb') as synthetic_file:
+                    synthetic_file.truncate(rng.randint(1, 4 * 1024 * 1024))
+            tree[root_path].append(folder_path)
+    return tree
+
+# Function to delete a shelve cache whatever files the dbm backend created for it
+def remove_shelve(cache_file):
+    for suffix in ("", ".db", ".dat", ".dir", ".bak"):
+        if os.path.exists(cache_file + suffix):
+            os.remove(cache_file + suffix)
+
+# Function to time fn() `repeat` times (each run preceded by setup()) and return the median seconds and last result
+def _time_stage(fn, repeat, setup=None):
+    timings, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+# Function to benchmark the scan and render stages on a synthetic tree, cold (empty caches) and warm
+def run_scan_benchmark(tree_dir, folders=1000, roots=4, files_per_folder=12, repeat=3, seed=0):
+    import forza_vehicle_db as db
+    from scan_options import ScanOptions
+
+    tree = create_synthetic_tree(tree_dir, roots=roots, folders_per_root=max(folders // roots, 1), files_per_folder=files_per_folder, seed=seed)
+    folder_paths = [path for paths in tree.values() for path in paths]
+    cache_dir = os.path.join(tree_dir, "_bench_cache")
+    sizes_cache = os.path.join(cache_dir, "folder_sizes_cache.db")
+    lists_cache = os.path.join(cache_dir, "file_lists_cache.db")
+    quiet = ProgressReporter(level='quiet')
+    options = ScanOptions(progress=quiet)
+    os.makedirs(cache_dir, exist_ok=True)
+    stages = {}
+
+    def record(name, elapsed, done, **counters):
+        stages[name] = {"elapsed": round(elapsed, 4), "done": done, "total": len(folder_paths), "counters": counters}
+
+    elapsed, _ = _time_stage(lambda: db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options), repeat, lambda: remove_shelve(sizes_cache))
+    record("folder_sizes_cold", elapsed, len(folder_paths), walked=len(folder_paths))
+    elapsed, file_lists = _time_stage(lambda: db.get_file_list_with_cache(folder_paths, lists_cache, options), repeat, lambda: remove_shelve(lists_cache))
+    record("file_lists_cold", elapsed, len(folder_paths), walked=len(folder_paths))
+    elapsed, _ = _time_stage(lambda: db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options), repeat)
+    record("folder_sizes_warm", elapsed, len(folder_paths), cached=len(folder_paths))
+    elapsed, _ = _time_stage(lambda: db.get_file_list_with_cache(folder_paths, lists_cache, options), repeat)
+    record("file_lists_warm", elapsed, len(folder_paths), cached=len(folder_paths))
+
+    elapsed, _ = _time_stage(lambda: [db.generate_file_list_html(file_lists[path], quiet) for path in folder_paths if path in file_lists], repeat)
+    record("render_file_lists", elapsed, len(file_lists))
+    elapsed, _ = _time_stage(lambda: [db.parse_folder_name(db.strip_slod_suffix(os.path.basename(path)).lower()) for path in folder_paths], repeat)
+    record("parse_names", elapsed, len(folder_paths))
+
+    counts = {"roots": len(tree), "folders": len(folder_paths), "files_per_folder": files_per_folder, "repeat": repeat}
+    return stages, counts
+
+# Function to microbenchmark the folder name parser over every car_overrides key
+def run_parse_benchmark(repeat=5):
+    from folder_parser import FolderNameParser
+
+    compiled = load_mappings()
+    names = list(compiled.car_overrides)
+    mappings = (compiled.car_overrides, compiled.manufacturer_codes, compiled.manufacturer_logos, compiled.variant_mappings, compiled.variant_logos)
+    stages = {}
+
+    def record(name, elapsed, done):
+        stages[name] = {"elapsed": round(elapsed, 6), "done": done, "total": len(names), "counters": {}}
+
+    elapsed, parser = _time_stage(lambda: FolderNameParser(*mappings), repeat)
+    record("parse_index_build", elapsed, len(parser.overrides))
+    elapsed, _ = _time_stage(lambda: [parser.parse_uncached(name) for name in names], repeat)
+    record("parse_uncached", elapsed, len(names))
+    elapsed, _ = _time_stage(lambda: [parser.parse(name) for name in names], repeat, parser.clear)
+    record("parse_cold", elapsed, len(names))
+    elapsed, _ = _time_stage(lambda: [parser.parse(name) for name in names], repeat)
+    record("parse_warm", elapsed, len(names))
+
+    counts = {"names": len(names), "distinct_names": len(parser.overrides), "repeat": repeat}
+    return stages, counts
+
+# Function to import mappings.py the way the script used to (from its .pyc) and derive the indexes
+def _import_mappings_source():
+    sys.modules.pop('mappings', None)
+    module = importlib.import_module('mappings')
+    tables = {name: value for name, value in vars(module).items() if not name.startswith('_')}
+    return derive_indexes(tables)
+
+# Function to time a fresh interpreter running `code`, which includes interpreter startup
+def _time_subprocess(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(MAPPINGS_SOURCE))
+    return time.perf_counter() - start
+
+# Function to measure startup cost before (importing mappings.py and deriving the indexes) and after
+# (loading the compiled artifact, either just the small tables or every table)
+def run_startup_benchmark(repeat=5):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        artifact_path = os.path.join(temp_dir, "mappings.compiled")
+        stages = {}
+
+        def record(name, elapsed):
+            stages[name] = {"elapsed": round(elapsed, 6), "done": 1, "total": 1, "counters": {}}
+
+        record("import_mappings_source", _time_stage(_import_mappings_source, repeat)[0])
+        record("compile_artifact", _time_stage(lambda: compile_mappings(artifact_path=artifact_path), repeat)[0])
+        record("load_artifact_startup", _time_stage(lambda: load_mappings(artifact_path=artifact_path).parent_folders, repeat)[0])
+
+        def load_everything():
+            compiled = load_mappings(artifact_path=artifact_path)
+            return [getattr(compiled, name) for name in compiled.section_names]
+        record("load_artifact_all", _time_stage(load_everything, repeat)[0])
+
+    record("python_startup", _time_stage(lambda: _time_subprocess("pass"), repeat)[0])
+    record("import_forza_vehicle_db", _time_stage(lambda: _time_subprocess("import forza_vehicle_db"), repeat)[0])
+    return stages, {"repeat": repeat}
+
+# Function to generate (root, folder name) pairs for `folders` car folders spread over `roots` game
+# roots, with most cars present in more than one game like the real catalog
+def synthetic_folder_names(folders, roots=12, games_per_car=2, seed=0):
+    rng = random.Random(seed)
+    codes = sorted(load_mappings().manufacturer_codes)
+    root_paths = [os.path.join("W:", f"game{index:02d}", "media", "cars") for index in range(roots)]
+    entries = []
+    car = 0
+    while len(entries) < folders:
+        name = f"{rng.choice(codes).upper()}_Model{car}_{rng.randint(0, 99):02d}"
+        for root in rng.sample(root_paths, min(rng.randint(1, 2 * games_per_car - 1), roots)):
+            entries.append((root, name if rng.random() < 0.5 else name.lower()))
+        car += 1
+    return entries[:folders]
+
+# Function to compare the memory and grouping time of the old subfolders_dict layout (7-tuple keys,
+# lists of (folder_path, original_name) tuples) with Vehicle/Occurrence records
+def run_records_benchmark(folders=100000, repeat=3, seed=0):
+    from folder_parser import normalize_folder_name
+    from memprofile import deep_sizeof
+    from vehicle_records import Occurrence, add_occurrence
+    import forza_vehicle_db as db
+
+    entries = synthetic_folder_names(folders, seed=seed)
+
+    def group_legacy():
+        groups = {}
+        for root, name in entries:
+            key = tuple(db.parse_folder_name(normalize_folder_name(name)))
+            if key not in groups:
+                groups[key] = [(root, name)]
+            elif (root, name) not in groups[key]:
+                groups[key].append((root, name))
+        return groups
+
+    def group_records():
+        vehicles = {}
+        for root, name in entries:
+            add_occurrence(vehicles, db.parse_folder_name(normalize_folder_name(name)), Occurrence(root, name))
+        return vehicles
+
+    legacy_elapsed, legacy = _time_stage(group_legacy, repeat)
+    records_elapsed, vehicles = _time_stage(group_records, repeat)
+
+    # Strings and parsed records are shared by both layouts, so only the grouping structures are measured
+    shared = {id(value) for pair in entries for value in pair}
+    shared.update(id(value) for record in db.get_folder_name_parser()._records.values() for value in (record, *record))
+    legacy_bytes = deep_sizeof(legacy, set(shared))
+    records_bytes = deep_sizeof(vehicles, set(shared))
+
+    stages = {
+        "group_legacy": {"elapsed": round(legacy_elapsed, 4), "done": folders, "total": folders, "counters": {"bytes": legacy_bytes}},
+        "group_records": {"elapsed": round(records_elapsed, 4), "done": folders, "total": folders, "counters": {"bytes": records_bytes}},
+    }
+    counts = {
+        "folders": folders,
+        "cars": len(vehicles),
+        "legacy_bytes_per_folder": round(legacy_bytes / folders, 1),
+        "records_bytes_per_folder": round(records_bytes / folders, 1),
+        "repeat": repeat,
+    }
+    return stages, counts
+
+# Function to generate file lists shaped like a cache built on Windows: the SYNTHETIC_LAYOUT files
+# per car, repeated in 'lodN' subfolders up to files_per_folder
+def synthetic_file_lists(folders, files_per_folder=36, seed=0):
+    rng = random.Random(seed)
+    names = sorted({name.lower() for name in load_mappings().car_overrides})
+    file_lists = {}
+    for folder_index in range(folders):
+        name = names[folder_index % len(names)]
+        if folder_index >= len(names):
+            name = f"{name}_{folder_index // len(names)}"
+        file_list = []
+        for file_index in range(files_per_folder):
+            subdir, pattern = SYNTHETIC_LAYOUT[file_index % len(SYNTHETIC_LAYOUT)]
+            lod = file_index // len(SYNTHETIC_LAYOUT)
+            subdir = "\\".join(part for part in (f"lod{lod}" if lod else "", subdir) if part)
+            file_name = pattern.format(name=name)
+            file_list.append((f"{subdir}\\{file_name}" if subdir else file_name, rng.randint(1, 4 * 1024 * 1024)))
+        file_lists[f"W:\\Forza\\game\\media\\cars\\{name}"] = file_list
+    return file_lists
+
+# Function to compare lists of (path, size) tuples with CompactFileList records: memory held,
+# bytes written to the cache, and the time to load them back
+def run_file_list_benchmark(folders=10000, files_per_folder=36, repeat=3, seed=0):
+    from file_list_store import CompactFileList, StringTable
+    from memprofile import deep_sizeof
+
+    legacy = synthetic_file_lists(folders, files_per_folder, seed)
+    files = sum(len(file_list) for file_list in legacy.values())
+    table = StringTable()
+    compact_elapsed, compact = _time_stage(lambda: {path: CompactFileList.from_list(file_list, table) for path, file_list in legacy.items()}, repeat)
+
+    legacy_blobs = [pickle.dumps(file_list, protocol=pickle.DEFAULT_PROTOCOL) for file_list in legacy.values()]
+    compact_blobs = [pickle.dumps(file_list.to_record(), protocol=pickle.DEFAULT_PROTOCOL) for file_list in compact.values()]
+    table_blob = pickle.dumps((table.stamp, table.strings), protocol=pickle.DEFAULT_PROTOCOL)
+
+    load_legacy_elapsed, _ = _time_stage(lambda: [pickle.loads(blob) for blob in legacy_blobs], repeat)
+    def load_compact():
+        loaded_table = StringTable(*reversed(pickle.loads(table_blob)))
+        return [CompactFileList.from_record(pickle.loads(blob), loaded_table) for blob in compact_blobs]
+    load_compact_elapsed, _ = _time_stage(load_compact, repeat)
+    iterate_elapsed, _ = _time_stage(lambda: [sum(size for _, size in file_list) for file_list in compact.values()], repeat)
+
+    # Directory keys are shared by both layouts and not counted
+    shared = {id(path) for path in legacy}
+    legacy_bytes = deep_sizeof(legacy, set(shared))
+    compact_bytes = deep_sizeof(compact, set(shared))
+    legacy_disk = sum(map(len, legacy_blobs))
+    compact_disk = sum(map(len, compact_blobs)) + len(table_blob)
+
+    stages = {
+        "compact_build": {"elapsed": round(compact_elapsed, 4), "done": files, "total": files, "counters": {}},
+        "load_legacy": {"elapsed": round(load_legacy_elapsed, 4), "done": files, "total": files, "counters": {"bytes": legacy_disk}},
+        "load_compact": {"elapsed": round(load_compact_elapsed, 4), "done": files, "total": files, "counters": {"bytes": compact_disk}},
+        "iterate_compact": {"elapsed": round(iterate_elapsed, 4), "done": files, "total": files, "counters": {}},
+    }
+    counts = {
+        "folders": folders,
+        "files": files,
+        "strings": len(table),
+        "legacy_memory_bytes": legacy_bytes,
+        "compact_memory_bytes": compact_bytes,
+        "legacy_disk_bytes": legacy_disk,
+        "compact_disk_bytes": compact_disk,
+        "repeat": repeat,
+    }
+    return stages, counts
+
+# Function to compare reading file lists from the shelve cache (unpickling every entry) with opening a
+# scan manifest and reading folders from it on demand
+def run_manifest_benchmark(tree_dir, folders=100000, files_per_folder=12, lookups=1000, repeat=3, seed=0, compress=False):
+    from cache_stats import CacheStats, InstrumentedCache
+    from file_list_store import FileListStore
+    from scan_manifest import ScanManifest, write_manifest
+
+    file_lists = synthetic_file_lists(folders, files_per_folder, seed)
+    files = sum(len(file_list) for file_list in file_lists.values())
+    cache_file = os.path.join(tree_dir, "file_lists_cache.db")
+    manifest_file = os.path.join(tree_dir, "scan.fzm")
+    remove_shelve(cache_file)
+    with InstrumentedCache(cache_file, CacheStats('file_lists')) as cache:
+        store = FileListStore(cache)
+        for folder_path, file_list in file_lists.items():
+            store.store(folder_path, file_list)
+        store.close()
+    entries = [(folder_path, sum(size for _, size in file_list), 0, file_list) for folder_path, file_list in file_lists.items()]
+    write_elapsed, _ = _time_stage(lambda: write_manifest(manifest_file, entries, compress=compress), repeat)
+    del entries
+    sample = random.Random(seed).sample(sorted(file_lists), min(lookups, len(file_lists)))
+    del file_lists
+
+    def load_shelve():
+        with InstrumentedCache(cache_file, CacheStats('file_lists')) as cache:
+            store = FileListStore(cache)
+            return {key: store.lookup(key)[1] for key in cache.shelf.keys() if key != "__file_list_strings__"}
+
+    def open_manifest():
+        with ScanManifest(manifest_file) as manifest:
+            return manifest.folder_count
+
+    def lookup_manifest():
+        with ScanManifest(manifest_file) as manifest:
+            return [list(manifest.files(folder_path)) for folder_path in sample]
+
+    def iterate_manifest():
+        with ScanManifest(manifest_file) as manifest:
+            return sum(len(list(files)) for _, _, _, files in manifest)
+
+    stages = {}
+    for name, fn, done in (("shelve_load_all", load_shelve, folders), ("manifest_write", None, folders),
+                           ("manifest_open", open_manifest, 1), ("manifest_lookup", lookup_manifest, len(sample)),
+                           ("manifest_iterate", iterate_manifest, folders)):
+        elapsed = write_elapsed if fn is None else _time_stage(fn, repeat)[0]
+        stages[name] = {"elapsed": round(elapsed, 6), "done": done, "total": done, "counters": {}}
+    counts = {
+        "folders": folders,
+        "files": files,
+        "lookups": len(sample),
+        "compressed": compress,
+        "manifest_bytes": os.path.getsize(manifest_file),
+        "repeat": repeat,
+    }
+    return stages, counts
+
+# Simulated storage for the scheduler benchmark: fixed per-folder latency, how many requests the
+# device serves at once, and the extra seek time each additional queued request adds (head thrashing)
+SIMULATED_DEVICES = {
+    "nvme": {"latency": 0.002, "parallel": 32, "seek_penalty": 0.0},
+    "hdd": {"latency": 0.004, "parallel": 1, "seek_penalty": 0.003},
+    "smb": {"latency": 0.025, "parallel": 64, "seek_penalty": 0.0},
+}
+
+# A drive that is asleep takes `spin_up` seconds to answer its first request; requests arriving
+# meanwhile wait for it too
+class _SimulatedDevice:
+    def __init__(self, latency, parallel, seek_penalty, spin_up=0.0):
+        self.latency = latency
+        self.seek_penalty = seek_penalty
+        self.slots = threading.Semaphore(parallel)
+        self.lock = threading.Lock()
+        self.spin_lock = threading.Lock()
+        self.spin_up = spin_up
+        self.queued = 0
+
+    def walk(self, folder_path):
+        with self.spin_lock:
+            if self.spin_up:
+                time.sleep(self.spin_up)
+                self.spin_up = 0.0
+        with self.lock:
+            self.queued += 1
+        try:
+            with self.slots:
+                with self.lock:
+                    waiting = self.queued - 1
+                time.sleep(self.latency + self.seek_penalty * waiting)
+        finally:
+            with self.lock:
+                self.queued -= 1
+        return folder_path
+
+# Function to compare a fixed thread pool with the adaptive per-root scheduler on simulated devices
+def run_scheduler_benchmark(folders_per_root=200, repeat=1, min_workers=None, max_workers=None):
+    from concurrent.futures import ThreadPoolExecutor
+    from scan_scheduler import AdaptiveScheduler, DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS
+
+    folder_paths = [os.path.join(root, f"car{index:04d}") for root in SIMULATED_DEVICES for index in range(folders_per_root)]
+
+    def walk(folder_path, devices):
+        return devices[os.path.dirname(folder_path)].walk(folder_path)
+
+    def fixed_pool():
+        devices = {root: _SimulatedDevice(**model) for root, model in SIMULATED_DEVICES.items()}
+        # What the scan stages used: ThreadPoolExecutor() with its default worker count
+        with ThreadPoolExecutor() as executor:
+            return [future.result() for future in [executor.submit(walk, path, devices) for path in folder_paths]]
+
+    limits = {}
+    def adaptive():
+        devices = {root: _SimulatedDevice(**model) for root, model in SIMULATED_DEVICES.items()}
+        with AdaptiveScheduler('bench', min_workers or DEFAULT_MIN_WORKERS, max_workers or DEFAULT_MAX_WORKERS) as scheduler:
+            results = [future.result() for future in [scheduler.submit(walk, path, devices) for path in folder_paths]]
+        limits.update(scheduler.snapshot())
+        return results
+
+    fixed_elapsed, _ = _time_stage(fixed_pool, repeat)
+    adaptive_elapsed, _ = _time_stage(adaptive, repeat)
+    total = len(folder_paths)
+    stages = {
+        "fixed_pool": {"elapsed": round(fixed_elapsed, 4), "done": total, "total": total, "counters": {}},
+        "adaptive": {"elapsed": round(adaptive_elapsed, 4), "done": total, "total": total, "counters": {}},
+    }
+    for root, state in limits.items():
+        stages[f"adaptive_{root}"] = {"elapsed": round(state["completed"] / state["throughput"], 4) if state["throughput"] else 0.0,
+                                     "done": state["completed"], "total": folders_per_root, "counters": {"final_limit": state["limit"]}}
+    counts = {"folders": total, "roots": len(SIMULATED_DEVICES), "fixed_workers": min(32, (os.cpu_count() or 1) + 4), "repeat": repeat,
+              "final_limits": {root: state["limit"] for root, state in limits.items()}}
+    return stages, counts
+
+# Function to read the recorded car folder sizes from a folder size cache, opened read-only: plain byte
+# counts from older caches and the totals of car folder nodes (those directly under a game root).
+# Cached paths may come from another OS, so they are split with ntpath when they use backslashes.
+def load_recorded_sizes(cache_file, parent_folders):
+    import ntpath
+    import shelve
+    from size_tree import GAME_KEY_PREFIX, is_valid_node
+
+    sizes = {}
+    with shelve.open(cache_file, 'r') as cache:
+        for key in cache.keys():
+            if key.startswith(GAME_KEY_PREFIX):
+                continue
+            try:
+                value = cache[key]
+            except Exception:
+                continue
+            root = (ntpath if '\\' in key else os.path).dirname(key)
+            if isinstance(value, int) and value >= 0:
+                sizes[key] = value
+            elif is_valid_node(value) and root in parent_folders:
+                sizes[key] = value[3]
+    return sizes
+
+# Function to simulate one stage with the scheduler's per-root limits: each root's folders start in
+# `order` on `workers` slots (roots are independent devices), and the stage ends with its slowest root.
+# Returns the makespan in seconds.
+def simulate_makespan(order, durations, root_of, workers):
+    import heapq
+
+    slots = {}
+    makespan = 0.0
+    for path in order:
+        root_slots = slots.setdefault(root_of(path), [0.0] * workers)
+        end = heapq.heappop(root_slots) + durations[path]
+        heapq.heappush(root_slots, end)
+        makespan = max(makespan, end)
+    return makespan
+
+# Function to replay the recorded folder sizes through the walk stage in folder order (what the
+# stages did) and largest first, with all sizes known and with a fraction of folders treated as new,
+# and the same for an incremental rescan of a random fraction of the folders (`changed`). A walk is modelled as `overhead_ms` plus `ms_per_mb` per MB, its size standing in for its file count.
+# The recorded folders are too many and too even for the order to matter much, so a skewed root is
+# simulated too: `skew_folders` folders of the median recorded size followed, last in folder order, by
+# `skew_large` folders `skew_factor` times as large (like a late batch of big DLC cars).
+def run_order_benchmark(cache_file='folder_sizes_cache.db', workers=8, unknown=0.1, changed=0.05, overhead_ms=2.0, ms_per_mb=2.0, seed=0,
+                        skew_folders=200, skew_large=4, skew_factor=50):
+    import ntpath
+    from folder_parser import natural_sort_key
+    from scan_scheduler import estimate_costs, largest_first
+
+    parent_folders = load_mappings().parent_folders
+    sizes = load_recorded_sizes(cache_file, parent_folders)
+    if not sizes:
+        raise ValueError(f"No recorded folder sizes in '{cache_file}'")
+
+    def root_of(path):
+        return (ntpath if '\\' in path else os.path).dirname(path)
+
+    root_order = {root: index for index, root in enumerate(parent_folders)}
+    folder_order = sorted(sizes, key=lambda path: (root_order.get(root_of(path), len(root_order)), root_of(path),
+                                                   natural_sort_key((ntpath if '\\' in path else os.path).basename(path))))
+    durations = {path: (overhead_ms + ms_per_mb * size / (1024 * 1024)) / 1000 for path, size in sizes.items()}
+    rng = random.Random(seed)
+    hidden = set(rng.sample(folder_order, int(len(folder_order) * unknown)))
+    rescanned = set(rng.sample(folder_order, max(1, int(len(folder_order) * changed))))
+    changed_order = [path for path in folder_order if path in rescanned]
+    partial_sizes = {path: size for path, size in sizes.items() if path not in hidden}
+
+    orders = {
+        "folder_order": folder_order,
+        "largest_first": largest_first(folder_order, estimate_costs(folder_order, sizes)),
+        "largest_first_partial": largest_first(folder_order, estimate_costs(folder_order, partial_sizes)),
+        "changed_folder_order": changed_order,
+        "changed_largest_first": largest_first(changed_order, estimate_costs(changed_order, sizes)),
+    }
+    total = len(folder_order)
+    stages = {name: {"elapsed": round(simulate_makespan(order, durations, root_of, workers), 4), "done": len(order), "total": len(order), "counters": {}}
+              for name, order in orders.items()}
+
+    # No schedule can beat the busiest root's work spread over its slots, or its largest walk
+    def lower_bound(durations):
+        per_root = {}
+        for path, duration in durations.items():
+            per_root.setdefault(root_of(path), []).append(duration)
+        return max(max(sum(values) / workers, max(values)) for values in per_root.values())
+
+    median_size = sorted(sizes.values())[len(sizes) // 2]
+    skew_sizes = {os.path.join("skewed", f"car{index:04d}"): median_size * (skew_factor if index >= skew_folders else 1)
+                  for index in range(skew_folders + skew_large)}
+    skew_order = list(skew_sizes)
+    skew_durations = {path: (overhead_ms + ms_per_mb * size / (1024 * 1024)) / 1000 for path, size in skew_sizes.items()}
+    for name, order in (("skewed_folder_order", skew_order), ("skewed_largest_first", largest_first(skew_order, estimate_costs(skew_order, skew_sizes)))):
+        stages[name] = {"elapsed": round(simulate_makespan(order, skew_durations, root_of, workers), 4), "done": len(order), "total": len(order), "counters": {}}
+
+    counts = {"folders": total, "roots": len(set(map(root_of, folder_order))), "workers": workers, "unknown_folders": len(hidden),
+              "changed_folders": len(changed_order), "overhead_ms": overhead_ms, "ms_per_mb": ms_per_mb, "lower_bound": round(lower_bound(durations), 4),
+              "skew_folders": skew_folders, "skew_large": skew_large, "skew_factor": skew_factor, "skew_median_mb": round(median_size / (1024 * 1024), 1),
+              "skewed_lower_bound": round(lower_bound(skew_durations), 4), "cache_file": cache_file}
+    return stages, counts
+
+# Function to measure how the walk throughput of healthy roots scales with their number while one
+# more root, listed first like Motorsport 2, sits on a sleeping spinning disk: the old fixed thread
+# pool against the per-root scheduler. Each healthy root is a separate network share.
+def run_isolation_benchmark(device_counts=(1, 2, 4, 8), folders_per_root=100, spin_up=1.0, repeat=1, max_workers=None):
+    from concurrent.futures import ThreadPoolExecutor
+    from scan_scheduler import AdaptiveScheduler, DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS
+
+    def walk(folder_path, devices):
+        devices[os.path.dirname(folder_path)].walk(folder_path)
+        return os.path.dirname(folder_path), time.perf_counter()
+
+    def make_devices(count):
+        devices = {"sleeping": _SimulatedDevice(**SIMULATED_DEVICES["hdd"], spin_up=spin_up)}
+        devices.update((f"share{index}", _SimulatedDevice(**SIMULATED_DEVICES["smb"])) for index in range(count))
+        return devices
+
+    # Seconds until every folder on the healthy roots was walked
+    def healthy_elapsed(results, start):
+        return max(end for root, end in results if root != "sleeping") - start
+
+    def fixed_pool(folder_paths, devices):
+        start = time.perf_counter()
+        with ThreadPoolExecutor() as executor:
+            results = [future.result() for future in [executor.submit(walk, path, devices) for path in folder_paths]]
+        return healthy_elapsed(results, start)
+
+    def isolated(folder_paths, devices):
+        start = time.perf_counter()
+        with AdaptiveScheduler('bench', DEFAULT_MIN_WORKERS, max_workers or DEFAULT_MAX_WORKERS) as scheduler:
+            results = [future.result() for future in [scheduler.submit(walk, path, devices) for path in folder_paths]]
+        return healthy_elapsed(results, start)
+
+    stages = {}
+    for count in device_counts:
+        roots = ["sleeping"] + [f"share{index}" for index in range(count)]
+        folder_paths = [os.path.join(root, f"car{index:04d}") for root in roots for index in range(folders_per_root)]
+        healthy = count * folders_per_root
+        for name, run in (("fixed_pool", fixed_pool), ("per_root", isolated)):
+            elapsed = statistics.median(run(folder_paths, make_devices(count)) for _ in range(repeat))
+            stages[f"{name}_{count}_devices"] = {"elapsed": round(elapsed, 4), "done": healthy, "total": healthy, "counters": {}}
+    counts = {"device_counts": list(device_counts), "folders_per_root": folders_per_root, "spin_up": spin_up, "repeat": repeat,
+              "fixed_workers": min(32, (os.cpu_count() or 1) + 4)}
+    return stages, counts
+
+# Samples the number of live threads while a block runs; `peak` excludes the sampling thread
+class _ThreadCounter:
+    def __enter__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(0.001):
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+# Function to compare the scan backends on a synthetic tree: the size and file list stages, cold and
+# warm, with each backend in turn, recording the most threads alive during each stage
+def run_backend_benchmark(tree_dir, folders=1000, roots=4, files_per_folder=12, repeat=3, seed=0, max_workers=None):
+    import forza_vehicle_db as db
+    from scan_options import ScanOptions
+    from scan_scheduler import DEFAULT_MAX_WORKERS, SCAN_BACKENDS
+
+    tree = create_synthetic_tree(tree_dir, roots=roots, folders_per_root=max(folders // roots, 1), files_per_folder=files_per_folder, seed=seed)
+    folder_paths = [path for paths in tree.values() for path in paths]
+    cache_dir = os.path.join(tree_dir, "_bench_cache")
+    max_workers = max_workers or DEFAULT_MAX_WORKERS
+    os.makedirs(cache_dir, exist_ok=True)
+    stages = {}
+
+    for backend in SCAN_BACKENDS:
+        sizes_cache = os.path.join(cache_dir, f"{backend}_folder_sizes_cache.db")
+        lists_cache = os.path.join(cache_dir, f"{backend}_file_lists_cache.db")
+        options = ScanOptions(progress=ProgressReporter(level='quiet'), scan_backend=backend, max_workers=max_workers)
+        runs = (
+            ("folder_sizes_cold", lambda: db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options), lambda: remove_shelve(sizes_cache)),
+            ("file_lists_cold", lambda: db.get_file_list_with_cache(folder_paths, lists_cache, options), lambda: remove_shelve(lists_cache)),
+            ("folder_sizes_warm", lambda: db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options), None),
+            ("file_lists_warm", lambda: db.get_file_list_with_cache(folder_paths, lists_cache, options), None),
+        )
+        for name, run, setup in runs:
+            with _ThreadCounter() as threads:
+                elapsed, _ = _time_stage(run, repeat, setup)
+            stages[f"{backend}_{name}"] = {"elapsed": round(elapsed, 4), "done": len(folder_paths), "total": len(folder_paths),
+                                           "counters": {"peak_threads": threads.peak}}
+
+    counts = {"roots": len(tree), "folders": len(folder_paths), "files_per_folder": files_per_folder, "repeat": repeat,
+              "max_workers": max_workers, "backends": list(SCAN_BACKENDS), "cpus": os.cpu_count()}
+    return stages, counts
+
+# Function to compare the sequential stages with the --pipeline build on a synthetic tree, cold: the two
+# scan stages alone (the I/O floor), then sizes, file lists, details pages and index rows one after
+# the other, then all of them as a pipeline. `latency_ms` adds a sleep to every folder walk, standing
+# in for a network share, where the overlap matters most.
+def run_pipeline_benchmark(tree_dir, folders=1000, roots=4, files_per_folder=12, repeat=3, seed=0, latency_ms=0.0, queue_depth=None):
+    import forza_vehicle_db as db
+    from pipeline import DEFAULT_QUEUE_DEPTH
+    from scan_options import ScanOptions
+    from vehicle_records import Occurrence, add_occurrence
+
+    tree = create_synthetic_tree(tree_dir, roots=roots, folders_per_root=max(folders // roots, 1), files_per_folder=files_per_folder, seed=seed)
+    folder_paths = [path for paths in tree.values() for path in paths]
+    vehicles = {}
+    for folder_path in folder_paths:
+        name = os.path.basename(folder_path)
+        add_occurrence(vehicles, db.parse_folder_name(db.strip_slod_suffix(name).lower()), Occurrence(os.path.dirname(folder_path), name))
+    cache_dir = os.path.join(tree_dir, "_bench_cache")
+    output_dir = os.path.join(tree_dir, "_bench_details")
+    sizes_cache = os.path.join(cache_dir, "folder_sizes_cache.db")
+    lists_cache = os.path.join(cache_dir, "file_lists_cache.db")
+    quiet = ProgressReporter(level='quiet')
+    options = ScanOptions(progress=quiet)
+    queue_depth = queue_depth or DEFAULT_QUEUE_DEPTH
+    os.makedirs(cache_dir, exist_ok=True)
+
+    def cold():
+        remove_shelve(sizes_cache)
+        remove_shelve(lists_cache)
+
+    def scan_only():
+        folder_sizes = db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options)
+        return folder_sizes, db.get_file_list_with_cache(folder_paths, lists_cache, options, size_hints=folder_sizes)
+
+    def sequential():
+        folder_sizes, file_lists = scan_only()
+        for folder_path in folder_paths:
+            if folder_path in file_lists:
+                db.write_car_details(folder_path, file_lists[folder_path], quiet, output_dir)
+        rows = [db.render_index_row(occurrences, {path: db.generate_file_list_html(file_lists[path], quiet) for path in db.occurrence_paths(occurrences) if path in file_lists},
+                                    folder_sizes) for _, occurrences in sorted(vehicles.items(), key=lambda item: item[1].first.name.lower())]
+        return "".join(rows)
+
+    channels = []
+    def pipelined():
+        _, _, rows, used = db.run_pipeline(vehicles, len(folder_paths),
+                                           lambda on_result: db.calculate_folder_sizes_with_cache(folder_paths, sizes_cache, options, on_result=on_result),
+                                           lambda ready, on_result: db.get_file_list_with_cache(folder_paths, lists_cache, options, ready=ready, on_result=on_result),
+                                           progress=quiet, queue_depth=queue_depth, output_dir=output_dir)
+        channels[:] = used
+        return rows
+
+    # The walks look their functions up on the module as each stage starts, so a slower walk can be swapped in
+    walks = {"refresh_folder_size": db.refresh_folder_size, "get_file_list_for_folder": db.get_file_list_for_folder}
+    def slowed(walk):
+        def walk_with_latency(*args):
+            time.sleep(latency_ms / 1000)
+            return walk(*args)
+        return walk_with_latency
+
+    stages = {}
+    try:
+        if latency_ms:
+            for name, walk in walks.items():
+                setattr(db, name, slowed(walk))
+        for name, run in (("scan_only", scan_only), ("sequential", sequential), ("pipeline", pipelined)):
+            elapsed, _ = _time_stage(run, repeat, cold)
+            stages[name] = {"elapsed": round(elapsed, 4), "done": len(folder_paths), "total": len(folder_paths), "counters": {}}
+    finally:
+        for name, walk in walks.items():
+            setattr(db, name, walk)
+    for channel in channels:
+        stages["pipeline"]["counters"][f"{channel.name}_peak"] = channel.peak
+        stages["pipeline"]["counters"][f"{channel.name}_stalls"] = channel.stalls
+
+    counts = {"roots": len(tree), "folders": len(folder_paths), "cars": len(vehicles), "files_per_folder": files_per_folder, "repeat": repeat,
+              "latency_ms": latency_ms, "queue_depth": queue_depth, "cpus": os.cpu_count()}
+    return stages, counts
+
+# Script a build check runs in a fresh interpreter: forza_vehicle_db.main over the synthetic roots in
+# place of the game roots. With a walk log, each folder walk is appended to it as "stage<TAB>folder
+# path", and the build is interrupted (as by Ctrl-C) after `interrupt_after` walks.
+_BUILD_SCRIPT = """
+import _thread, json, sys, threading
+config = json.loads(sys.argv[1])
+sys.path.insert(0, config["repo"])
+import forza_vehicle_db as db
+games = config["games"]
+db.parent_folders = {root: game["name"] for root, game in games.items()}
+db.game_folder_codes = {root: game["code"] for root, game in games.items()}
+db.folder_to_image = {root: game["image"] for root, game in games.items()}
+lock = threading.Lock()
+walks = [0]
+
+def logged(stage_name, walk):
+    def logged_walk(folder_path, *args):
+        result = walk(folder_path, *args)
+        with lock:
+            with open(config["walk_log"], "a", encoding="utf-8") as log:
+                log.write(f"{stage_name}\\t{folder_path}\\n")
+            walks[0] += 1
+            if walks[0] == config["interrupt_after"]:
+                _thread.interrupt_main()
+        return result
+    return logged_walk
+
+if config["walk_log"]:
+    db.refresh_folder_size = logged("folder_sizes", db.refresh_folder_size)
+    db.get_file_list_for_folder = logged("file_lists", db.get_file_list_for_folder)
+try:
+    db.main(config["args"])
+except KeyboardInterrupt:
+    sys.exit(130)
+"""
+
+# Exit code of a build check's build that was interrupted
+INTERRUPTED = 130
+
+# Function to give the synthetic roots of `tree` the names, codes and images of the first game roots
+def _synthetic_games(tree):
+    mappings = load_mappings()
+    return {root: {"name": mappings.parent_folders[game_root], "code": mappings.game_folder_codes[game_root], "image": mappings.folder_to_image[game_root]}
+            for root, game_root in zip(tree, mappings.parent_folders)}
+
+# Function to build the synthetic `games` in a fresh `work_dir` in a new interpreter with PYTHONHASHSEED
+# set to `hash_seed`; returns its exit code
+def _run_build(work_dir, games, args=(), hash_seed=0, walk_log=None, interrupt_after=0):
+    config = {"repo": os.path.dirname(os.path.abspath(__file__)), "games": games, "args": ['--log-level', 'quiet', '--no-history', *args],
+              "walk_log": walk_log, "interrupt_after": interrupt_after}
+    os.makedirs(work_dir, exist_ok=True)
+    env = dict(os.environ, PYTHONHASHSEED=str(hash_seed))
+    return subprocess.run([sys.executable, "-c", _BUILD_SCRIPT, json.dumps(config)], cwd=work_dir, env=env).returncode
+
+# Function to list the files a build wrote, index.html and the details pages: {path relative to `work_dir`: path}
+def _build_outputs(work_dir):
+    outputs = {"index.html": os.path.join(work_dir, "index.html")}
+    for dirpath, _, filenames in os.walk(os.path.join(work_dir, "car_details")):
+        for file_name in filenames:
+            outputs[os.path.relpath(os.path.join(dirpath, file_name), work_dir)] = os.path.join(dirpath, file_name)
+    return outputs
+
+# Function to compare the output of two builds byte for byte; returns the files that differ or that only one of them has
+def compare_build_outputs(expected_dir, actual_dir):
+    expected, actual = _build_outputs(expected_dir), _build_outputs(actual_dir)
+    differing = []
+    for name in sorted(set(expected) | set(actual), key=str.lower):
+        if name not in expected or name not in actual or not (os.path.exists(expected[name]) and os.path.exists(actual[name])) \
+                or not filecmp.cmp(expected[name], actual[name], shallow=False):
+            differing.append(name)
+    return differing
+
+# Function to check that the output does not depend on hash order or on the scan backend: the same
+# synthetic tree, with a `_slod` twin next to one car folder in five, is built once with each backend,
+# each in a fresh directory under its own PYTHONHASHSEED, and every build's index.html and details
+# pages are compared byte for byte with the first one's. Returns {build: differing files, or None when
+# the build failed} and the counts.
+def run_determinism_check(tree_dir, folders=200, roots=4, files_per_folder=4, seed=0):
+    from scan_scheduler import SCAN_BACKENDS
+
+    tree = create_synthetic_tree(os.path.join(tree_dir, "tree"), roots=roots, folders_per_root=max(folders // roots, 1), files_per_folder=files_per_folder, seed=seed)
+    twins = 0
+    for paths in tree.values():
+        for folder_path in paths[::5]:
+            os.makedirs(folder_path + "_slod", exist_ok=True)
+            with open(os.path.join(folder_path + "_slod", "carattribs.xml"), 'wb') as twin_file:
+                twin_file.truncate(1024)
+            twins += 1
+    games = _synthetic_games(tree)
+    results = {}
+    first_dir = None
+    for hash_seed, backend in enumerate(SCAN_BACKENDS, start=1):
+        name = f"{backend}, PYTHONHASHSEED={hash_seed}"
+        work_dir = os.path.join(tree_dir, f"build_{backend}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if _run_build(work_dir, games, ['--scan-backend', backend], hash_seed=hash_seed) != 0:
+            results[name] = None
+            continue
+        first_dir = first_dir or work_dir
+        results[name] = compare_build_outputs(first_dir, work_dir)
+    counts = {"roots": len(tree), "folders": sum(len(paths) for paths in tree.values()), "twins": twins, "outputs": len(_build_outputs(first_dir)) if first_dir else 0}
+    return results, counts
+
+# Function to check that an interrupted build resumes without walking a folder twice and ends with the
+# output of an uninterrupted one. A cold --checkpoint build of a synthetic tree is interrupted (as by
+# Ctrl-C) after a third of its walks, in the size stage, resumed with --resume and interrupted again
+# after another third, in the file list stage, then resumed to the end. Its output is compared byte for
+# byte with a fresh build's. Returns the exit codes of the runs, the (stage, folder) walks made more
+# than once, the differing files and the counts.
+def run_resume_check(tree_dir, folders=400, roots=4, files_per_folder=4, seed=0, checkpoint_every=20):
+    tree = create_synthetic_tree(os.path.join(tree_dir, "tree"), roots=roots, folders_per_root=max(folders // roots, 1), files_per_folder=files_per_folder, seed=seed)
+    games = _synthetic_games(tree)
+    folder_count = sum(len(paths) for paths in tree.values())
+    fresh_dir, resumed_dir = os.path.join(tree_dir, "build_fresh"), os.path.join(tree_dir, "build_resumed")
+    walk_log = os.path.join(tree_dir, "walks.log")
+    for path in (fresh_dir, resumed_dir):
+        shutil.rmtree(path, ignore_errors=True)
+    if os.path.exists(walk_log):
+        os.remove(walk_log)
+
+    # Both stages walk every folder of a cold build once
+    interrupt_after = max(2 * folder_count // 3, 1)
+    runs = [(['--checkpoint', '--checkpoint-every', str(checkpoint_every)], interrupt_after), (['--resume'], interrupt_after), (['--resume'], 0)]
+    statuses = [_run_build(resumed_dir, games, args, walk_log=walk_log, interrupt_after=interrupt) for args, interrupt in runs]
+    fresh_status = _run_build(fresh_dir, games)
+
+    walks = {}
+    if os.path.exists(walk_log):
+        with open(walk_log, encoding='utf-8') as log:
+            for line in log:
+                walk = tuple(line.rstrip('\n').split('\t', 1))
+                walks[walk] = walks.get(walk, 0) + 1
+    repeated = sorted(walk for walk, count in walks.items() if count > 1)
+    differing = compare_build_outputs(fresh_dir, resumed_dir) if fresh_status == 0 and statuses[-1] == 0 else None
+    counts = {"roots": len(tree), "folders": folder_count, "interrupt_after": interrupt_after, "checkpoint_every": checkpoint_every,
+              "walks": sum(walks.values()), "expected_walks": 2 * folder_count}
+    return statuses, repeated, differing, counts
+
+def format_stages(stages):
+    lines = [f"{'stage':<24}{'median':>10}{'items/s':>12}"]
+    for name, metrics in stages.items():
+        rate = metrics["done"] / metrics["elapsed"] if metrics["elapsed"] else 0
+        lines.append(f"{name:<24}{metrics['elapsed']:>9.4f}s{rate:>12.0f}")
+    return "\n".join(lines)
+
+def _bench_run(args):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        tree_dir = args.tree or temp_dir
+        stages, counts = run_scan_benchmark(tree_dir, folders=args.folders, roots=args.roots, files_per_folder=args.files, repeat=args.repeat, seed=args.seed)
+    return _report_bench(args, stages, counts)
+
+def _bench_parse(args):
+    stages, counts = run_parse_benchmark(repeat=args.repeat)
+    return _report_bench(args, stages, counts)
+
+def _bench_records(args):
+    stages, counts = run_records_benchmark(folders=args.folders, repeat=args.repeat, seed=args.seed)
+    status = _report_bench(args, stages, counts)
+    print(f"Grouping structures for {counts['folders']} folders / {counts['cars']} cars: "
+          f"{counts['legacy_bytes_per_folder']:.0f} B per folder before, {counts['records_bytes_per_folder']:.0f} B with Vehicle/Occurrence records")
+    return status
+
+def _bench_file_lists(args):
+    stages, counts = run_file_list_benchmark(folders=args.folders, files_per_folder=args.files_per_folder, repeat=args.repeat, seed=args.seed)
+    status = _report_bench(args, stages, counts)
+    mb = 1024 * 1024
+    print(f"{counts['files']} files in {counts['folders']} folders, {counts['strings']} interned strings")
+    print(f"  memory: {counts['legacy_memory_bytes'] / mb:.1f} MB as tuples, {counts['compact_memory_bytes'] / mb:.1f} MB compact "
+          f"({counts['legacy_memory_bytes'] / counts['compact_memory_bytes']:.1f}x)")
+    print(f"  cache:  {counts['legacy_disk_bytes'] / mb:.1f} MB as tuples, {counts['compact_disk_bytes'] / mb:.1f} MB compact "
+          f"({counts['legacy_disk_bytes'] / counts['compact_disk_bytes']:.1f}x)")
+    return status
+
+def _bench_manifest(args):
+    with tempfile.TemporaryDirectory(prefix="forza-bench-") as tree_dir:
+        stages, counts = run_manifest_benchmark(tree_dir, folders=args.folders, files_per_folder=args.files_per_folder, lookups=args.lookups,
+                                                repeat=args.repeat, seed=args.seed, compress=args.compress)
+    status = _report_bench(args, stages, counts)
+    print(f"Manifest for {counts['folders']} folders / {counts['files']} files: {counts['manifest_bytes'] / (1024 * 1024):.1f} MB"
+          f"{' (compressed)' if counts['compressed'] else ''}; opened in {stages['manifest_open']['elapsed'] * 1000:.2f} ms "
+          f"versus {stages['shelve_load_all']['elapsed']:.2f} s to load every shelve entry")
+    return status
+
+def _bench_scheduler(args):
+    stages, counts = run_scheduler_benchmark(folders_per_root=args.folders_per_root, repeat=args.repeat, min_workers=args.min_workers, max_workers=args.max_workers)
+    status = _report_bench(args, stages, counts)
+    limits = ", ".join(f"{root} {limit}" for root, limit in counts["final_limits"].items())
+    print(f"{counts['folders']} simulated folders: fixed pool of {counts['fixed_workers']} {stages['fixed_pool']['elapsed']:.2f}s, "
+          f"adaptive {stages['adaptive']['elapsed']:.2f}s; final per-root limits: {limits}")
+    return status
+
+def _bench_order(args):
+    stages, counts = run_order_benchmark(cache_file=args.cache, workers=args.workers, unknown=args.unknown, changed=args.changed, overhead_ms=args.overhead_ms,
+                                         ms_per_mb=args.ms_per_mb, seed=args.seed, skew_folders=args.skew_folders, skew_large=args.skew_large,
+                                         skew_factor=args.skew_factor)
+    status = _report_bench(args, stages, counts)
+    baseline = stages["folder_order"]["elapsed"]
+    print(f"{counts['folders']} recorded folders in {counts['roots']} roots, {counts['workers']} walks per root (simulated): "
+          f"makespan {baseline:.2f}s in folder order, {stages['largest_first']['elapsed']:.2f}s largest first, "
+          f"{stages['largest_first_partial']['elapsed']:.2f}s with {counts['unknown_folders']} folders unknown; lower bound {counts['lower_bound']:.2f}s")
+    print(f"Rescan of {counts['changed_folders']} changed folders: {stages['changed_folder_order']['elapsed']:.2f}s in folder order, "
+          f"{stages['changed_largest_first']['elapsed']:.2f}s largest first")
+    print(f"Skewed root of {counts['skew_folders']} folders of {counts['skew_median_mb']:g} MB and {counts['skew_large']} of {counts['skew_factor']:g}x that last: "
+          f"{stages['skewed_folder_order']['elapsed']:.2f}s in folder order, {stages['skewed_largest_first']['elapsed']:.2f}s largest first; "
+          f"lower bound {counts['skewed_lower_bound']:.2f}s")
+    return status
+
+def _bench_isolation(args):
+    stages, counts = run_isolation_benchmark(device_counts=args.devices, folders_per_root=args.folders_per_root, spin_up=args.spin_up,
+                                             repeat=args.repeat, max_workers=args.max_workers)
+    status = _report_bench(args, stages, counts)
+    print(f"Healthy roots walked per second with a sleeping disk ({counts['spin_up']:g}s spin-up) listed first:")
+    for count in counts["device_counts"]:
+        fixed, per_root = stages[f"fixed_pool_{count}_devices"], stages[f"per_root_{count}_devices"]
+        print(f"  {count} device(s): fixed pool of {counts['fixed_workers']} {fixed['done'] / fixed['elapsed']:.0f} folders/s, "
+              f"per-root scheduler {per_root['done'] / per_root['elapsed']:.0f} folders/s")
+    return status
+
+def _bench_backends(args):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        stages, counts = run_backend_benchmark(args.tree or temp_dir, folders=args.folders, roots=args.roots, files_per_folder=args.files,
+                                               repeat=args.repeat, seed=args.seed, max_workers=args.max_workers)
+    status = _report_bench(args, stages, counts)
+    print(f"{counts['folders']} synthetic folders in {counts['roots']} roots, {counts['max_workers']} walks per root, {counts['cpus']} CPUs:")
+    for name in ("folder_sizes_cold", "file_lists_cold", "folder_sizes_warm", "file_lists_warm"):
+        results = ", ".join(f"{backend} {stages[f'{backend}_{name}']['elapsed']:.3f}s / {stages[f'{backend}_{name}']['counters']['peak_threads']} threads"
+                            for backend in counts["backends"])
+        print(f"  {name}: {results}")
+    return status
+
+def _bench_pipeline(args):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        stages, counts = run_pipeline_benchmark(args.tree or temp_dir, folders=args.folders, roots=args.roots, files_per_folder=args.files, repeat=args.repeat,
+                                                seed=args.seed, latency_ms=args.latency_ms, queue_depth=args.queue_depth)
+    status = _report_bench(args, stages, counts)
+    floor = stages["scan_only"]["elapsed"]
+    print(f"{counts['folders']} synthetic folders, {counts['latency_ms']:g} ms added per walk, queue depth {counts['queue_depth']}, {counts['cpus']} CPUs:")
+    for name in ("sequential", "pipeline"):
+        print(f"  {name}: {stages[name]['elapsed']:.3f}s, {stages[name]['elapsed'] / floor if floor else 0:.2f}x the scan stages alone ({floor:.3f}s)")
+    return status
+
+def _bench_determinism(args):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        results, counts = run_determinism_check(args.tree or temp_dir, folders=args.folders, roots=args.roots, files_per_folder=args.files, seed=args.seed)
+    print(f"{counts['folders']} synthetic folders and {counts['twins']} _slod twins in {counts['roots']} roots, {counts['outputs']} output files per build:")
+    status = 0
+    for name, differing in results.items():
+        if differing is None:
+            print(f"  {name}: the build failed")
+        elif differing:
+            print(f"  {name}: {len(differing)} files differ from the first build: {', '.join(differing[:10])}")
+        else:
+            print(f"  {name}: identical")
+        status = status or int(differing != [])
+    return status
+
+def _bench_resume(args):
+    with tempfile.TemporaryDirectory(prefix="forza_bench_") as temp_dir:
+        statuses, repeated, differing, counts = run_resume_check(args.tree or temp_dir, folders=args.folders, roots=args.roots, files_per_folder=args.files,
+                                                                 seed=args.seed, checkpoint_every=args.checkpoint_every)
+    print(f"{counts['folders']} synthetic folders in {counts['roots']} roots, checkpointed every {counts['checkpoint_every']} folders, "
+          f"interrupted twice after {counts['interrupt_after']} walks:")
+    failures = []
+    if statuses[:2] != [INTERRUPTED, INTERRUPTED]:
+        failures.append(f"the build was not interrupted twice (exit codes {statuses[0]} and {statuses[1]})")
+    if repeated:
+        failures.append(f"{len(repeated)} folders walked twice: {', '.join(f'{stage} {folder_path}' for stage, folder_path in repeated[:10])}")
+    if differing is None:
+        failures.append("a build failed")
+    elif differing:
+        failures.append(f"{len(differing)} files differ from a fresh build: {', '.join(differing[:10])}")
+    print(f"  {counts['walks']} folder walks in all, {counts['expected_walks']} in a cold build")
+    for failure in failures:
+        print(f"  FAILED: {failure}")
+    if not failures:
+        print("  no folder walked twice; the output is the same as a fresh build's")
+    return 1 if failures else 0
+
+def _bench_startup(args):
+    stages, counts = run_startup_benchmark(repeat=args.repeat)
+    return _report_bench(args, stages, counts)
+
+# Function to print a benchmark result, record it in the history and optionally export it
+def _report_bench(args, stages, counts):
+    print(format_stages(stages))
+    record = make_run_record('bench', stages, counts=counts, label=args.label)
+    if not args.no_history:
+        append_run(record, args.history)
+        print(f"Recorded bench run {record['id']} in '{args.history}'")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(record, output_file, indent=2)
+        print(f"Bench results written to '{args.output}'")
+    return 0
+
+def _bench_compare(args):
+    try:
+        baseline = resolve_run(args.baseline, args.history, kind=args.kind)
+        candidate = resolve_run(args.candidate, args.history, kind=args.kind)
+        rows = compare_runs(baseline, candidate, threshold=args.threshold / 100, min_delta=args.min_delta)
+    except (LookupError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    print(format_comparison(baseline, candidate, rows))
+    regressions = [row["stage"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed by more than {args.threshold:g}%: {', '.join(regressions)}")
+        return 1
+    print(f"\nNo stage regressed by more than {args.threshold:g}%")
+    return 0
+
+def _bench_history(args):
+    runs = [run for run in load_runs(args.history) if args.kind is None or run.get("kind") == args.kind]
+    print(format_history(runs[-args.limit:]) if runs else f"No runs recorded in '{args.history}'")
+    return 0
+
+# Function to register the `bench` command (run / compare / history) on the main argument parser
+def add_bench_parser(subparsers):
+    bench_parser = subparsers.add_parser('bench', help="Benchmark the scan stages and compare recorded runs")
+    bench_commands = bench_parser.add_subparsers(dest='bench_command', metavar='bench_command')
+    bench_commands.required = True
+
+    history_option = argparse.ArgumentParser(add_help=False)
+    history_option.add_argument('--history', metavar='FILE', default=argparse.SUPPRESS, help=f"Run history store (default: {DEFAULT_HISTORY_FILE})")
+
+    run_parser = bench_commands.add_parser('run', parents=[history_option], help="Benchmark the scan and render stages on a synthetic tree")
+    run_parser.add_argument('--folders', type=int, default=1000, help="Number of synthetic car folders (default: 1000)")
+    run_parser.add_argument('--roots', type=int, default=4, help="Number of synthetic game roots (default: 4)")
+    run_parser.add_argument('--files', type=int, default=12, help="Files per car folder (default: 12)")
+    run_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    run_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tree (default: 0)")
+    run_parser.add_argument('--tree', metavar='DIR', help="Build the synthetic tree in DIR instead of a temporary directory")
+    run_parser.add_argument('--label', help="Free-form label stored with the run")
+    run_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE (e.g. to compare branches)")
+    run_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    run_parser.set_defaults(bench_handler=_bench_run)
+
+    parse_parser = bench_commands.add_parser('parse', parents=[history_option], help="Microbenchmark the folder name parser over every car_overrides key")
+    parse_parser.add_argument('--repeat', type=int, default=5, help="Repetitions per stage, the median is reported (default: 5)")
+    parse_parser.add_argument('--label', help="Free-form label stored with the run")
+    parse_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    parse_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    parse_parser.set_defaults(bench_handler=_bench_parse)
+
+    startup_parser = bench_commands.add_parser('startup', parents=[history_option], help="Measure import/startup time with mappings.py versus the compiled mappings")
+    startup_parser.add_argument('--repeat', type=int, default=5, help="Repetitions per stage, the median is reported (default: 5)")
+    startup_parser.add_argument('--label', help="Free-form label stored with the run")
+    startup_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    startup_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    startup_parser.set_defaults(bench_handler=_bench_startup)
+
+    records_parser = bench_commands.add_parser('records', parents=[history_option], help="Compare memory and grouping time of tuple-keyed lists versus Vehicle/Occurrence records")
+    records_parser.add_argument('--folders', type=int, default=100000, help="Number of synthetic folder names (default: 100000)")
+    records_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    records_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic names (default: 0)")
+    records_parser.add_argument('--label', help="Free-form label stored with the run")
+    records_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    records_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    records_parser.set_defaults(bench_handler=_bench_records)
+
+    file_lists_parser = bench_commands.add_parser('filelists', parents=[history_option], help="Compare memory and cache size of tuple file lists versus compact file lists")
+    file_lists_parser.add_argument('--folders', type=int, default=10000, help="Number of synthetic car folders (default: 10000)")
+    file_lists_parser.add_argument('--files-per-folder', type=int, default=36, help="Files in each synthetic car folder (default: 36)")
+    file_lists_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    file_lists_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic file sizes (default: 0)")
+    file_lists_parser.add_argument('--label', help="Free-form label stored with the run")
+    file_lists_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    file_lists_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    file_lists_parser.set_defaults(bench_handler=_bench_file_lists)
+
+    manifest_parser = bench_commands.add_parser('manifest', parents=[history_option], help="Compare loading the file list cache with opening a scan manifest")
+    manifest_parser.add_argument('--folders', type=int, default=100000, help="Number of synthetic car folders (default: 100000)")
+    manifest_parser.add_argument('--files-per-folder', type=int, default=12, help="Files in each synthetic car folder (default: 12)")
+    manifest_parser.add_argument('--lookups', type=int, default=1000, help="Random folders read from the manifest (default: 1000)")
+    manifest_parser.add_argument('--compress', action='store_true', help="Write the manifest with zlib-compressed blocks")
+    manifest_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    manifest_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic file sizes (default: 0)")
+    manifest_parser.add_argument('--label', help="Free-form label stored with the run")
+    manifest_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    manifest_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    manifest_parser.set_defaults(bench_handler=_bench_manifest)
+
+    scheduler_parser = bench_commands.add_parser('scheduler', parents=[history_option], help="Compare a fixed thread pool with the adaptive per-root scheduler on simulated NVMe, HDD and SMB roots")
+    scheduler_parser.add_argument('--folders-per-root', type=int, default=200, help="Simulated folders per root (default: 200)")
+    scheduler_parser.add_argument('--min-workers', type=int, help="Lowest concurrency per root")
+    scheduler_parser.add_argument('--max-workers', type=int, help="Highest concurrency per root")
+    scheduler_parser.add_argument('--repeat', type=int, default=1, help="Repetitions per stage, the median is reported (default: 1)")
+    scheduler_parser.add_argument('--label', help="Free-form label stored with the run")
+    scheduler_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    scheduler_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    scheduler_parser.set_defaults(bench_handler=_bench_scheduler)
+
+    isolation_parser = bench_commands.add_parser('isolation', parents=[history_option], help="Measure healthy-root throughput against the number of devices with one sleeping disk, fixed pool versus per-root scheduler")
+    isolation_parser.add_argument('--devices', type=int, nargs='+', default=[1, 2, 4, 8], help="Numbers of healthy simulated shares to try (default: 1 2 4 8)")
+    isolation_parser.add_argument('--folders-per-root', type=int, default=100, help="Simulated folders per root (default: 100)")
+    isolation_parser.add_argument('--spin-up', type=float, default=1.0, help="Seconds the sleeping disk takes to answer its first request (default: 1)")
+    isolation_parser.add_argument('--max-workers', type=int, help="Highest concurrency per root")
+    isolation_parser.add_argument('--repeat', type=int, default=1, help="Repetitions per stage, the median is reported (default: 1)")
+    isolation_parser.add_argument('--label', help="Free-form label stored with the run")
+    isolation_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    isolation_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    isolation_parser.set_defaults(bench_handler=_bench_isolation)
+
+    backends_parser = bench_commands.add_parser('backends', parents=[history_option], help="Compare the threads, asyncio and processes scan backends on a synthetic tree: stage times and peak threads")
+    backends_parser.add_argument('--folders', type=int, default=1000, help="Number of synthetic car folders (default: 1000)")
+    backends_parser.add_argument('--roots', type=int, default=4, help="Number of synthetic game roots (default: 4)")
+    backends_parser.add_argument('--files', type=int, default=12, help="Files per car folder (default: 12)")
+    backends_parser.add_argument('--max-workers', type=int, help="Concurrent folder walks per root")
+    backends_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    backends_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tree (default: 0)")
+    backends_parser.add_argument('--tree', metavar='DIR', help="Build the synthetic tree in DIR instead of a temporary directory")
+    backends_parser.add_argument('--label', help="Free-form label stored with the run")
+    backends_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    backends_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    backends_parser.set_defaults(bench_handler=_bench_backends)
+
+    pipeline_parser = bench_commands.add_parser('pipeline', parents=[history_option], help="Compare the sequential stages with the --pipeline build on a synthetic tree, against the scan stages alone")
+    pipeline_parser.add_argument('--folders', type=int, default=1000, help="Number of synthetic car folders (default: 1000)")
+    pipeline_parser.add_argument('--roots', type=int, default=4, help="Number of synthetic game roots (default: 4)")
+    pipeline_parser.add_argument('--files', type=int, default=12, help="Files per car folder (default: 12)")
+    pipeline_parser.add_argument('--latency-ms', type=float, default=0.0, help="Milliseconds added to every folder walk, to stand in for a network share (default: 0)")
+    pipeline_parser.add_argument('--queue-depth', type=int, help="Folders queued between two pipeline stages")
+    pipeline_parser.add_argument('--repeat', type=int, default=3, help="Repetitions per stage, the median is reported (default: 3)")
+    pipeline_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tree (default: 0)")
+    pipeline_parser.add_argument('--tree', metavar='DIR', help="Build the synthetic tree in DIR instead of a temporary directory")
+    pipeline_parser.add_argument('--label', help="Free-form label stored with the run")
+    pipeline_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    pipeline_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    pipeline_parser.set_defaults(bench_handler=_bench_pipeline)
+
+    determinism_parser = bench_commands.add_parser('determinism', help="Build a synthetic tree with each scan backend under different PYTHONHASHSEEDs and check the output is byte for byte the same")
+    determinism_parser.add_argument('--folders', type=int, default=200, help="Number of synthetic car folders (default: 200)")
+    determinism_parser.add_argument('--roots', type=int, default=4, help="Number of synthetic game roots, at most one per game root (default: 4)")
+    determinism_parser.add_argument('--files', type=int, default=4, help="Files per car folder (default: 4)")
+    determinism_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tree (default: 0)")
+    determinism_parser.add_argument('--tree', metavar='DIR', help="Build the synthetic tree and keep the builds in DIR instead of a temporary directory")
+    determinism_parser.set_defaults(bench_handler=_bench_determinism)
+
+    resume_parser = bench_commands.add_parser('resume', help="Interrupt a --checkpoint build of a synthetic tree twice, resume it and check no folder is walked twice and the output matches a fresh build")
+    resume_parser.add_argument('--folders', type=int, default=400, help="Number of synthetic car folders (default: 400)")
+    resume_parser.add_argument('--roots', type=int, default=4, help="Number of synthetic game roots, at most one per game root (default: 4)")
+    resume_parser.add_argument('--files', type=int, default=4, help="Files per car folder (default: 4)")
+    resume_parser.add_argument('--checkpoint-every', type=int, default=20, help="Folders per checkpoint batch (default: 20)")
+    resume_parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic tree (default: 0)")
+    resume_parser.add_argument('--tree', metavar='DIR', help="Build the synthetic tree and keep the builds in DIR instead of a temporary directory")
+    resume_parser.set_defaults(bench_handler=_bench_resume)
+
+    order_parser = bench_commands.add_parser('order', parents=[history_option], help="Replay recorded folder sizes to compare the walk makespan in folder order and largest first")
+    order_parser.add_argument('--cache', default='folder_sizes_cache.db', help="Folder size cache to replay (default: folder_sizes_cache.db)")
+    order_parser.add_argument('--workers', type=int, default=8, help="Concurrent walks per root (default: 8)")
+    order_parser.add_argument('--unknown', type=float, default=0.1, help="Fraction of folders treated as new, without a recorded size (default: 0.1)")
+    order_parser.add_argument('--changed', type=float, default=0.05, help="Fraction of folders in the simulated incremental rescan (default: 0.05)")
+    order_parser.add_argument('--overhead-ms', type=float, default=2.0, help="Simulated fixed cost per folder walk in ms (default: 2)")
+    order_parser.add_argument('--ms-per-mb', type=float, default=2.0, help="Simulated walk cost per MB of folder size in ms (default: 2)")
+    order_parser.add_argument('--seed', type=int, default=0, help="Seed for picking the unknown and changed folders (default: 0)")
+    order_parser.add_argument('--skew-folders', type=int, default=200, help="Folders of the median recorded size in the simulated skewed root (default: 200)")
+    order_parser.add_argument('--skew-large', type=int, default=4, help="Large folders at the end of the skewed root (default: 4)")
+    order_parser.add_argument('--skew-factor', type=float, default=50, help="Size of each large folder as a multiple of the median (default: 50)")
+    order_parser.add_argument('--label', help="Free-form label stored with the run")
+    order_parser.add_argument('--output', metavar='FILE', help="Also write the results as JSON to FILE")
+    order_parser.add_argument('--no-history', action='store_true', help="Do not append the run to the history store")
+    order_parser.set_defaults(bench_handler=_bench_order)
+
+    compare_parser = bench_commands.add_parser('compare', parents=[history_option], help="Diff the stage timings of two runs and flag regressions")
+    compare_parser.add_argument('baseline', help="Run id/prefix, 'latest', 'previous', 'branch:NAME' or a results JSON file")
+    compare_parser.add_argument('candidate', help="Run id/prefix, 'latest', 'previous', 'branch:NAME' or a results JSON file")
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help="Flag stages that got slower by more than this percentage (default: 10)")
+    compare_parser.add_argument('--min-delta', type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds (default: 0.05)")
+    compare_parser.add_argument('--kind', choices=['build', 'bench'], help="Only consider runs of this kind when resolving selectors")
+    compare_parser.set_defaults(bench_handler=_bench_compare)
+
+    history_parser = bench_commands.add_parser('history', parents=[history_option], help="List recorded runs")
+    history_parser.add_argument('-n', '--limit', type=int, default=20, help="Number of most recent runs to show (default: 20)")
+    history_parser.add_argument('--kind', choices=['build', 'bench'], help="Only list runs of this kind")
+    history_parser.set_defaults(bench_handler=_bench_history)
+    return bench_parser
+
+def run_bench_command(args):
+    return args.bench_handler(args)
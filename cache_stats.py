@@ -0,0 +1,170 @@
+# cache_stats.py
+
+import functools
+import inspect
+import os
+import pickle
+import shelve
+import threading
+import time
+
+# Counters for one cache: hits, misses, stale invalidations, bytes read/written and the time
+# spent in cache I/O (shelve reads, writes, open/close) versus filesystem I/O (folder walks)
+class CacheStats:
+    FIELDS = ('hits', 'misses', 'stale', 'errors', 'bytes_read', 'bytes_written', 'cache_io_seconds', 'fs_io_seconds')
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, **values):
+        with self._lock:
+            for field, value in values.items():
+                setattr(self, field, getattr(self, field) + value)
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses + self.stale
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else None
+
+    def as_dict(self):
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values['cache_io_seconds'] = round(values['cache_io_seconds'], 4)
+        values['fs_io_seconds'] = round(values['fs_io_seconds'], 4)
+        values['hit_rate'] = None if self.hit_rate is None else round(self.hit_rate, 4)
+        return values
+
+    def format(self):
+        hit_rate = "n/a" if self.hit_rate is None else f"{self.hit_rate:.1%}"
+        return (f"{self.name}: {self.hits} hits, {self.misses} misses, {self.stale} stale ({hit_rate} hit rate), "
+                f"{self.bytes_read / (1024 * 1024):.2f} MB read, {self.bytes_written / (1024 * 1024):.2f} MB written, "
+                f"cache I/O {self.cache_io_seconds:.2f}s vs filesystem I/O {self.fs_io_seconds:.2f}s")
+
+    # Wrap a per-folder task so the time it spends walking the filesystem is counted; with `durations`,
+    # each folder's walk time is also kept there by folder path
+    def time_fs(self, func, durations=None):
+        def done(folder_path, start):
+            seconds = time.perf_counter() - start
+            self.add(fs_io_seconds=seconds)
+            if durations is not None:
+                durations[folder_path] = seconds
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(folder_path, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(folder_path, *args, **kwargs)
+                finally:
+                    done(folder_path, start)
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(folder_path, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(folder_path, *args, **kwargs)
+            finally:
+                done(folder_path, start)
+        return timed
+
+# Function to flush a file to disk; best effort, some platforms refuse fsync on some files
+def fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# dbm imports its backend module on the first open, so two caches opened at once from different threads
+# (the stages of --pipeline) could find it half imported
+_open_lock = threading.Lock()
+
+# A shelve cache that records bytes and time in a CacheStats. Values are pickled exactly as
+# shelve does, so existing cache files keep working. `flag` is shelve's ('r' opens it read-only).
+class InstrumentedCache:
+    def __init__(self, cache_file, stats, flag='c'):
+        self.stats = stats
+        self.cache_file = cache_file
+        start = time.perf_counter()
+        with _open_lock:
+            self.shelf = shelve.open(cache_file, flag, protocol=pickle.DEFAULT_PROTOCOL)
+        self.stats.add(cache_io_seconds=time.perf_counter() - start)
+
+    def __contains__(self, key):
+        start = time.perf_counter()
+        found = key in self.shelf
+        self.stats.add(cache_io_seconds=time.perf_counter() - start)
+        return found
+
+    def __getitem__(self, key):
+        start = time.perf_counter()
+        raw = self.shelf.dict[key.encode(self.shelf.keyencoding)]
+        value = pickle.loads(raw)
+        self.stats.add(bytes_read=len(raw), cache_io_seconds=time.perf_counter() - start)
+        return value
+
+    def __setitem__(self, key, value):
+        start = time.perf_counter()
+        raw = pickle.dumps(value, protocol=pickle.DEFAULT_PROTOCOL)
+        self.shelf.dict[key.encode(self.shelf.keyencoding)] = raw
+        self.stats.add(bytes_written=len(raw), cache_io_seconds=time.perf_counter() - start)
+
+    def __delitem__(self, key):
+        start = time.perf_counter()
+        del self.shelf[key]
+        self.stats.add(cache_io_seconds=time.perf_counter() - start)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # Look a key up and count it as a hit, a miss, or stale (unreadable, or rejected by validate)
+    def lookup(self, key, validate=None):
+        try:
+            value = self[key]
+        except KeyError:
+            self.stats.add(misses=1)
+            return 'miss', None
+        except Exception:
+            self.stats.add(stale=1)
+            return 'stale', None
+        if validate and not validate(value):
+            self.stats.add(stale=1)
+            return 'stale', None
+        self.stats.add(hits=1)
+        return 'hit', value
+
+    # Write all changes through to disk: the dbm index and data (dbm.dumb only rewrites its index on
+    # sync or close), then fsync the files backing the cache
+    def sync(self):
+        start = time.perf_counter()
+        self.shelf.sync()
+        for suffix in ('', '.db', '.dat', '.dir', '.pag'):
+            if os.path.isfile(self.cache_file + suffix):
+                fsync_path(self.cache_file + suffix)
+        self.stats.add(cache_io_seconds=time.perf_counter() - start)
+
+    def close(self):
+        start = time.perf_counter()
+        self.shelf.close()
+        self.stats.add(cache_io_seconds=time.perf_counter() - start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
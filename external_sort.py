@@ -0,0 +1,109 @@
+# external_sort.py
+
+import heapq
+import pickle
+import sys
+import tempfile
+
+# Megabytes of records a streaming build (--streaming) keeps in memory before spilling them to disk
+DEFAULT_MEMORY_BUDGET = 256
+# Runs of a tier merged into one run of the next tier
+MERGE_FAN_IN = 16
+
+# Function to estimate the memory a buffered record takes: the tuple, nested tuples (such as a
+# ParsedName) and their fields. Strings shared between records are counted for each, so the estimate
+# errs on the high side.
+def record_size(record):
+    size = sys.getsizeof(record)
+    for field in record:
+        size += record_size(field) if isinstance(field, tuple) else sys.getsizeof(field)
+    return size
+
+# Function to read back the records pickled to a run file, in the order they were written
+def _read_run(run):
+    run.seek(0)
+    while True:
+        try:
+            yield pickle.load(run)
+        except EOFError:
+            return
+
+# Sorts more records (tuples) than fit in memory. Records are buffered until their estimated size
+# reaches `budget` bytes; the buffer is then sorted by `key` and spilled to a temporary run file in
+# `directory` (the system temp directory by default). sorted() merges the runs and what is still
+# buffered into one stream, holding a single record per run. Runs are merged in tiers as they pile up
+# (MERGE_FAN_IN of a tier into one of the next), so a record is rewritten a few times at most and few
+# files stay open however small the budget. Keys should be unique (give ties a sequence number), so
+# the order does not depend on how the records were split into runs. The run files are deleted on
+# close().
+class ExternalSorter:
+    def __init__(self, key, budget, directory=None, name='sort'):
+        self.key = key
+        self.budget = max(1, budget)
+        self.directory = directory
+        self.name = name
+        self.count = 0
+        self.spilled = 0
+        self.peak_buffered = 0
+        self._buffer = []
+        self._buffered = 0
+        self._runs = []
+
+    def add(self, record):
+        self._buffer.append(record)
+        self._buffered += record_size(record)
+        self.count += 1
+        self.peak_buffered = max(self.peak_buffered, self._buffered)
+        if self._buffered >= self.budget:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort(key=self.key)
+        self._runs.append((self._write_run(self._buffer), 0))
+        self.spilled += len(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        tier = 0
+        while True:
+            merging = [run for run, run_tier in self._runs if run_tier == tier]
+            if len(merging) < MERGE_FAN_IN:
+                break
+            merged = self._write_run(heapq.merge(*(_read_run(run) for run in merging), key=self.key), close=merging)
+            self._runs = [(run, run_tier) for run, run_tier in self._runs if run_tier != tier] + [(merged, tier + 1)]
+            tier += 1
+
+    def _write_run(self, records, close=()):
+        run = tempfile.TemporaryFile(prefix=f"{self.name}-", suffix='.run', dir=self.directory)
+        pickler = pickle.Pickler(run, pickle.HIGHEST_PROTOCOL)
+        for record in records:
+            pickler.dump(record)
+            # The memo would keep every record written alive
+            pickler.clear_memo()
+        for old_run in close:
+            old_run.close()
+        return run
+
+    @property
+    def runs(self):
+        return len(self._runs)
+
+    # Iterate over every record added, in key order
+    def sorted(self):
+        self._buffer.sort(key=self.key)
+        if not self._runs:
+            return iter(self._buffer)
+        return heapq.merge(*(_read_run(run) for run, _ in self._runs), self._buffer, key=self.key)
+
+    def close(self):
+        for run, _ in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,248 @@
+# file_list_store.py
+
+import threading
+import uuid
+from array import array
+from collections import Counter
+from itertools import chain
+
+# Shelve key holding the string table shared by every compact file list in the cache
+STRINGS_KEY = '__file_list_strings__'
+RECORD_FORMAT = 'compact-file-list-1'
+# Tag of an entry whose folder could not be listed again; the previous entry is kept inside it
+STALE_MARKER = 'stale-file-list'
+# Stamp of the table of a new, empty cache; fixed so that two cold runs write identical cache files
+INITIAL_STAMP = '0' * 32
+# Array typecodes tried in order when packing ids and sizes; each record uses the narrowest that fits
+_TYPECODES = ('B', 'H', 'I', 'Q')
+
+# Append-only table of interned strings. Directory names ('liverymasks\\') and file name tails
+# ('back.tga', '_caliperlf.carbin') repeat across thousands of cars and are stored once.
+# The stamp identifies one table, so cached records are only trusted against the table they were written with.
+class StringTable:
+    def __init__(self, strings=(), stamp=None):
+        self.strings = list(strings)
+        self.stamp = stamp or uuid.uuid4().hex
+        self._ids = {string: index for index, string in enumerate(self.strings)}
+        self._lock = threading.Lock()
+        self.saved_length = len(self.strings)
+
+    def intern(self, string):
+        index = self._ids.get(string)
+        if index is None:
+            with self._lock:
+                index = self._ids.get(string)
+                if index is None:
+                    index = self._ids[string] = len(self.strings)
+                    self.strings.append(string)
+        return index
+
+    def __getitem__(self, index):
+        return self.strings[index]
+
+    def __len__(self):
+        return len(self.strings)
+
+    @property
+    def dirty(self):
+        return len(self.strings) != self.saved_length
+
+# Function to split a relative path into its directory part (separator included, so the path is
+# rebuilt exactly whichever separator the scan used) and its file name
+def split_relative_path(path):
+    cut = max(path.rfind('\\'), path.rfind('/')) + 1
+    return path[:cut], path[cut:]
+
+# Function to find the prefix a car's own files share, e.g. 'acu_42_nsx_02_' in
+# 'acu_42_nsx_02_caliperlf.carbin': the most common file name stem up to its last underscore
+def common_name_prefix(file_names):
+    stems = Counter(name[:name.rfind('_') + 1] for name in file_names if '_' in name)
+    candidates = [stem for stem, count in stems.items() if count > 1]
+    if not candidates:
+        return ''
+    prefix = max(candidates, key=lambda stem: (stems[stem], -len(stem)))
+    # Shorter stems the longer ones extend (the prefix itself) cover more files
+    return min((stem for stem in candidates if prefix.startswith(stem)), key=len)
+
+# Function to pack integers into the narrowest array type that holds them all
+def pack_array(values):
+    largest = max(values, default=0)
+    for typecode in _TYPECODES:
+        if largest < 1 << (8 * array(typecode).itemsize):
+            return array(typecode, values)
+    raise OverflowError(f"value {largest} does not fit in 64 bits")
+
+# A car's file list: per file a directory id, a name id and a size, in flat arrays as narrow as the
+# values allow, plus the car's name prefix. Name ids are doubled, with the low bit set when the name is
+# stored without the prefix. Iterates as (relative_path, size) like the lists of tuples it replaces.
+class CompactFileList:
+    __slots__ = ('table', 'prefix', 'dir_ids', 'name_ids', 'sizes')
+
+    def __init__(self, table, prefix, dir_ids, name_ids, sizes):
+        self.table = table
+        self.prefix = prefix
+        self.dir_ids = dir_ids
+        self.name_ids = name_ids
+        self.sizes = sizes
+
+    @classmethod
+    def from_list(cls, file_list, table):
+        parts = [split_relative_path(path) for path, _ in file_list]
+        prefix = common_name_prefix([name for _, name in parts])
+        dir_ids, name_ids = [], []
+        for directory, name in parts:
+            dir_ids.append(table.intern(directory))
+            if prefix and name.startswith(prefix):
+                name_ids.append(table.intern(name[len(prefix):]) << 1 | 1)
+            else:
+                name_ids.append(table.intern(name) << 1)
+        return cls(table, prefix, pack_array(dir_ids), pack_array(name_ids), pack_array([size for _, size in file_list]))
+
+    # Compact form stored in the cache; the strings live once in the cache's StringTable
+    def to_record(self):
+        typecodes = self.dir_ids.typecode + self.name_ids.typecode + self.sizes.typecode
+        return (RECORD_FORMAT, self.table.stamp, self.prefix, typecodes, self.dir_ids.tobytes(), self.name_ids.tobytes(), self.sizes.tobytes())
+
+    @classmethod
+    def from_record(cls, record, table):
+        _, _, prefix, typecodes, *blobs = record
+        dir_ids, name_ids, sizes = (array(typecode, blob) for typecode, blob in zip(typecodes, blobs))
+        return cls(table, prefix, dir_ids, name_ids, sizes)
+
+    # Re-express the list against another table, e.g. one built in a scan worker process. Strings are
+    # interned in the order from_list would intern them, so the table grows exactly as if it were built here.
+    def rebase(self, table):
+        strings = self.table.strings
+        ids = {local: table.intern(strings[local]) for local in dict.fromkeys(chain.from_iterable(zip(self.dir_ids, (name_id >> 1 for name_id in self.name_ids))))}
+        dir_ids = pack_array([ids[local] for local in self.dir_ids])
+        name_ids = pack_array([ids[name_id >> 1] << 1 | name_id & 1 for name_id in self.name_ids])
+        return CompactFileList(table, self.prefix, dir_ids, name_ids, self.sizes)
+
+    def path(self, index):
+        name_id = self.name_ids[index]
+        strings = self.table.strings
+        if name_id & 1:
+            return strings[self.dir_ids[index]] + self.prefix + strings[name_id >> 1]
+        return strings[self.dir_ids[index]] + strings[name_id >> 1]
+
+    def total_size(self):
+        return sum(self.sizes)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        for index, size in enumerate(self.sizes):
+            yield self.path(index), size
+
+    def __eq__(self, other):
+        if isinstance(other, (CompactFileList, list)):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CompactFileList({len(self)} files, prefix={self.prefix!r})"
+
+# Function to check that a cached record is a compact file list written against `table` and only
+# references strings the table holds (a run that stopped before saving the table leaves some out)
+def is_current_record(value, table):
+    if not (isinstance(value, tuple) and len(value) == 7 and value[0] == RECORD_FORMAT and value[1] == table.stamp
+            and isinstance(value[3], str) and len(value[3]) == 3 and all(typecode in _TYPECODES for typecode in value[3])):
+        return False
+    try:
+        dir_ids, name_ids, sizes = (memoryview(blob).cast(typecode) for typecode, blob in zip(value[3], value[4:]))
+    except (TypeError, ValueError):
+        return False
+    if not len(dir_ids) == len(name_ids) == len(sizes):
+        return False
+    return not dir_ids or (max(dir_ids) < len(table) and max(name_ids) >> 1 < len(table))
+
+# File lists in a shelve cache (an InstrumentedCache) in compact form. The string table is loaded
+# once on open and written back on close if it grew. Entries in the old list-of-tuples format
+# are still read and are rewritten compactly.
+class FileListStore:
+    def __init__(self, cache, table=None):
+        self.cache = cache
+        self.table = table or self._load_table()
+
+    def _load_table(self):
+        value = self.cache.get(STRINGS_KEY) if STRINGS_KEY in self.cache else None
+        if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], list):
+            return StringTable(value[1], stamp=value[0])
+        # A cache that already holds entries but lost its table gets a fresh random stamp, so none of
+        # its compact records are read against the wrong strings
+        return StringTable(stamp=None if len(self.cache.shelf) else INITIAL_STAMP)
+
+    def _is_valid(self, value):
+        if isinstance(value, list):
+            return all(isinstance(item, tuple) and len(item) == 2 for item in value)
+        return is_current_record(value, self.table)
+
+    # Look a folder up; returns ('hit'|'miss'|'stale', CompactFileList or None)
+    def lookup(self, key):
+        status, value = self.cache.lookup(key, self._is_valid)
+        if status != 'hit':
+            return status, None
+        if isinstance(value, list):
+            file_list = CompactFileList.from_list(value, self.table)
+            self.cache[key] = file_list.to_record()
+            return status, file_list
+        return status, CompactFileList.from_record(value, self.table)
+
+    # Read an entry, unwrapping a stale marker; None when it is missing or unreadable
+    def _previous(self, key):
+        try:
+            value = self.cache.get(key)
+        except Exception:
+            return None
+        if isinstance(value, tuple) and len(value) == 2 and value[0] == STALE_MARKER:
+            return value[1]
+        return value
+
+    # Number of files in a cached entry without building its list, or None
+    def file_count(self, key):
+        value = self._previous(key)
+        if isinstance(value, list):
+            return len(value)
+        if is_current_record(value, self.table):
+            return len(value[6]) // array(value[3][2]).itemsize
+        return None
+
+    # Whether a folder's entry was marked stale after a failed walk, so the next run lists it again
+    def is_stale(self, key):
+        try:
+            value = self.cache.get(key)
+        except Exception:
+            return False
+        return isinstance(value, tuple) and len(value) == 2 and value[0] == STALE_MARKER
+
+    # Store a file list (a list of (path, size) or a CompactFileList) and return the compact form
+    def store(self, key, file_list):
+        if not isinstance(file_list, CompactFileList):
+            file_list = CompactFileList.from_list(list(file_list), self.table)
+        elif file_list.table is not self.table:
+            file_list = file_list.rebase(self.table)
+        self.cache[key] = file_list.to_record()
+        return file_list
+
+    # Mark a folder's entry stale after its walk failed, so the next run lists it again whatever the
+    # scan mode, but keep the previous list; returns that list (or None) for this run to show
+    def mark_stale(self, key):
+        value = self._previous(key)
+        if value is None:
+            return None
+        self.cache[key] = (STALE_MARKER, value)
+        if isinstance(value, list) and self._is_valid(value):
+            return CompactFileList.from_list(value, self.table)
+        if is_current_record(value, self.table):
+            return CompactFileList.from_record(value, self.table)
+        return None
+
+    # Save the string table if it grew, so the records stored so far can be read back
+    def flush(self):
+        if self.table.dirty or STRINGS_KEY not in self.cache:
+            self.cache[STRINGS_KEY] = (self.table.stamp, self.table.strings)
+            self.table.saved_length = len(self.table)
+
+    def close(self):
+        self.flush()
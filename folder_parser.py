@@ -0,0 +1,103 @@
+# folder_parser.py
+
+import re
+from collections import namedtuple
+from datetime import datetime
+
+# Precompiled patterns used for every folder name
+SLOD_SUFFIX_PATTERN = re.compile(r'(_?slod)$', re.IGNORECASE)
+CAR_FOLDER_PATTERN = re.compile(r'^[a-z]{2,3}_')
+DIGITS_PATTERN = re.compile(r'(\d+)')
+
+UNKNOWN_LOGO = "_images/brands/Unknown_Logo.png"
+
+# The parsed identity of a car folder. It is a tuple, so it can still be unpacked like the
+# 7-tuple parse_folder_name always returned and used as a grouping key.
+ParsedName = namedtuple('ParsedName', ['manufacturer', 'manufacturer_logo', 'model', 'year', 'variant', 'variant_logo', 'race_number'])
+
+# Function to strip '_slod' or 'slod' from the folder name
+def strip_slod_suffix(folder_name):
+    return SLOD_SUFFIX_PATTERN.sub('', folder_name)
+
+# Function to normalize a folder name for lookups: no SLOD suffix, lowercase
+def normalize_folder_name(folder_name):
+    return strip_slod_suffix(folder_name).lower()
+
+# Function to sort names naturally ('car2' before 'car10') and case-insensitively; names that only
+# differ in case or leading zeros are ordered by the exact name, so the order is total
+def natural_sort_key(name):
+    parts = DIGITS_PATTERN.split(name.lower())
+    parts[1::2] = map(int, parts[1::2])
+    return parts, name
+
+# Function to build the case-normalized car_overrides index. mappings.py carries many keys twice
+# ('acu_42_nsx_02' / 'ACU_42_NSX_02') and some with a '_SLOD' suffix; they all collapse to one entry.
+# When duplicates disagree, the key that is already normalized wins, since that is the form the
+# folder grouping has always looked up.
+def build_override_index(car_overrides):
+    index = {}
+    for key, values in sorted(car_overrides.items(), key=lambda item: item[0] == normalize_folder_name(item[0])):
+        index[normalize_folder_name(key)] = tuple(values)
+    return index
+
+# Parses car folder names into ParsedName records. Each distinct normalized name is parsed once;
+# later calls (other games holding the same car, the table rows) reuse the record.
+# A prebuilt override_index (e.g. from the compiled mappings) replaces car_overrides.
+class FolderNameParser:
+    def __init__(self, car_overrides, manufacturer_codes, manufacturer_logos, variant_mappings, variant_logos, current_year=None, override_index=None):
+        self.overrides = override_index if override_index is not None else build_override_index(car_overrides)
+        self.manufacturer_codes = manufacturer_codes
+        self.manufacturer_logos = manufacturer_logos
+        self.variant_mappings = variant_mappings
+        self.variant_logos = variant_logos
+        # Two-digit years above this are 19xx, the rest 20xx
+        self.century_pivot = (current_year or datetime.now().year) % 100
+        self._records = {}
+
+    def parse(self, folder_name):
+        normalized = normalize_folder_name(folder_name)
+        record = self._records.get(normalized)
+        if record is None:
+            record = self._records[normalized] = self.parse_uncached(normalized)
+        return record
+
+    # Function to parse folder name into Manufacturer, Model, Year, Variant, and Race Number (if present)
+    def parse_uncached(self, folder_name):
+        normalized = normalize_folder_name(folder_name)
+        manufacturer, model, year, variant, race_number = 'Unknown', 'Unknown', 'Unknown', 'Unknown', 'Unknown'
+        parts = normalized.split('_')
+        manufacturer_code = parts[0] if len(parts) >= 3 else 'unknown'
+
+        override = self.overrides.get(normalized)
+        if override is not None:
+            manufacturer, model, year, variant, race_number = override
+            # Check if manufacturer is directly in the logos dictionary
+            if manufacturer.lower() in self.manufacturer_logos:
+                manufacturer_code = manufacturer.lower()
+        elif len(parts) >= 3:
+            manufacturer = self.manufacturer_codes.get(manufacturer_code, 'Unknown')
+
+            # Check for a race number before the model
+            race_number = ''
+            model_start_index = 1
+            if parts[1].isdigit():
+                race_number = parts[1]
+                model_start_index = 2
+            model = parts[model_start_index].title()
+
+            # Handle year, which should be the last segment
+            year = parts[-1]
+            if len(year) == 2:
+                year = ('19' if int(year) > self.century_pivot else '20') + year
+
+            # Variant may include the segments between model and year
+            variant_parts = parts[model_start_index + 1:-1]
+            variant = ' '.join(variant_parts).title() if variant_parts else ''
+            variant = self.variant_mappings.get(variant, variant)  # Map the variant code to friendly name
+
+        manufacturer_logo = self.manufacturer_logos.get(manufacturer_code, UNKNOWN_LOGO)
+        variant_logo = self.variant_logos.get(variant, variant)  # This will return the image path or plain text
+        return ParsedName(manufacturer, manufacturer_logo, model, year, variant, variant_logo, race_number)
+
+    def clear(self):
+        self._records.clear()
@@ -1,18 +1,52 @@
 import os
-import re
-import shelve
 # import csv
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-from mappings import parent_folders, folder_to_image, game_folder_codes, manufacturer_logos, manufacturer_codes, variant_mappings, car_overrides, variant_logos
+import argparse
+import dbm
+import queue
+import sys
+from itertools import groupby
+from mappings_cache import compile_mappings, load_mappings
+from folder_parser import FolderNameParser, CAR_FOLDER_PATTERN, natural_sort_key, strip_slod_suffix
+from vehicle_records import Occurrence, Vehicle, add_occurrence, identity_key
+from file_list_store import CompactFileList, FileListStore
+from scan_manifest import ScanManifest, write_manifest
+from size_tree import GAME_KEY_PREFIX, aggregate_node, cached_total, collect_cached_nodes, is_valid_node, load_node, refresh_tree
+from scan_scheduler import (DEFAULT_FOLDER_TIMEOUT, DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS, DEFAULT_RETRIES, DEFAULT_SCAN_BACKEND, DEFAULT_STAGE_TIMEOUT,
+                            SCAN_BACKENDS, StageTimeout, WalkTimeout, estimate_costs, largest_first)
+from scan_checkpoint import DEFAULT_BATCH_SIZE, DEFAULT_CHECKPOINT_FILE, ScanCheckpoint
+from scan_trace import TaskTracer
+from pipeline import DEFAULT_QUEUE_DEPTH, POLL_INTERVAL, Channel, PipelineClosed, StageThread
+from live_data import DEFAULT_LIVE_DATA_FILE, LiveDataFile
+from external_sort import DEFAULT_MEMORY_BUDGET, ExternalSorter
+from scan_scope import ScanScope, split_values
+from scan_options import ScanOptions
+from scan_catalog import DEFAULT_CATALOG_FILE, CatalogWriter, load_catalog
+from scan_plan import format_plan, inspect_root, plan_scan
+from progress import ProgressReporter, LOG_LEVELS, OUTPUT_FORMATS
+from memprofile import MemoryProfiler
+from cache_stats import CacheStats, InstrumentedCache
+from run_history import DEFAULT_HISTORY_FILE, RootThroughput, append_run, get_output_sizes, load_runs, make_run_record, stage_metrics, walk_rates
 
 # Excluded subfolders
 excluded_subfolders = ["_library", "appearancepresets", "driver", "shadersettings", "shared", "tex"]
 
-# Function to strip '_slod' or 'slod' from the folder name
-def strip_slod_suffix(folder_name):
-    return re.sub(r'(_?slod)$', '', folder_name, flags=re.IGNORECASE)
+# Mapping tables come from the compiled mappings artifact (rebuilt whenever mappings.py changes).
+# The large tables are only unpacked on first use.
+mappings = load_mappings()
+parent_folders = mappings.parent_folders
+folder_to_image = mappings.folder_to_image
+game_folder_codes = mappings.game_folder_codes
+
+# Folder name parser using the prebuilt case-normalized car_overrides index, created on first use
+folder_name_parser = None
+
+def get_folder_name_parser():
+    global folder_name_parser
+    if folder_name_parser is None:
+        folder_name_parser = FolderNameParser(None, mappings.manufacturer_codes, mappings.manufacturer_logos, mappings.variant_mappings,
+                                              mappings.variant_logos, override_index=mappings.override_index)
+    return folder_name_parser
 
 # Function to calculate the size of a single folder
 def get_folder_size(folder_path):
@@ -24,33 +58,237 @@ def get_folder_size(folder_path):
                 total_size += os.path.getsize(fp)
     return total_size
 
+# Function to check that cached file lists have the expected shape; anything else (older formats,
+# corrupt entries) is counted as stale and recomputed
+def is_valid_file_list(value):
+    if isinstance(value, CompactFileList):
+        return True
+    return isinstance(value, list) and all(isinstance(item, tuple) and len(item) == 2 for item in value)
+
+# Scan modes: 'cached' trusts cached sizes and file lists without touching the disk; 'fast' checks each car folder's directory and
+# subdirectory mtimes and skips unchanged folders entirely, relisting the others in both scan stages;
+# 'full' ignores the caches and walks every folder again
+SCAN_MODES = ('cached', 'fast', 'full')
+
+# Function to bring one car folder's size tree up to date (see size_tree.refresh_tree)
+def refresh_folder_size(folder_path, cached_nodes):
+    return refresh_tree(folder_path, cached_nodes)
+
+# Function to pick a scan stage's per-folder task for the scan backend. The asyncio backend runs the
+# coroutine walkers of async_scan, which list a folder's subdirectories concurrently and return the
+# same results; the processes backend sends the plain walks to its worker processes.
+def stage_task(stage_name, scan_backend):
+    if scan_backend == 'asyncio':
+        from async_scan import file_list_async, refresh_tree_async
+        return {'folder_sizes': refresh_tree_async, 'file_lists': file_list_async}[stage_name]
+    return {'folder_sizes': refresh_folder_size, 'file_lists': get_file_list_for_folder}[stage_name]
+
+# Function to take a scan stage's results as the walks finish, checkpointing finished folders in
+# batches; on Ctrl-C the walks already running are let finish and kept before the exception is raised
+def collect_results(stage_name, folder_paths, futures, executor, take, checkpoint=None, sync=None, report=None):
+    # Submitted folders not taken yet, and those of them whose walk finished, in the order they did
+    waiting = {}
+    finished = queue.SimpleQueue()
+
+    def done(folder_path, changed, stopping=False):
+        if checkpoint and changed is not None:
+            checkpoint.add(stage_name, folder_path, changed)
+        if report and not stopping:
+            report(folder_path)
+
+    # The folder stays in `waiting` until it is done, so a Ctrl-C while it is taken takes it again
+    def take_next(folder_path):
+        done(folder_path, take(folder_path, futures[folder_path]))
+        del waiting[folder_path]
+        if checkpoint and checkpoint.due(stage_name):
+            sync()
+            checkpoint.commit(stage_name)
+
+    def take_finished(timeout=None):
+        while waiting:
+            try:
+                folder_path = finished.get(timeout=timeout) if timeout else finished.get_nowait()
+            except queue.Empty:
+                return
+            take_next(folder_path)
+            timeout = None
+
+    try:
+        for folder_path in folder_paths:
+            if folder_path is not None:
+                waiting[folder_path] = True
+                futures[folder_path].add_done_callback(lambda _, folder_path=folder_path: finished.put(folder_path))
+            take_finished()
+        while waiting:
+            take_finished(POLL_INTERVAL)
+    except (KeyboardInterrupt, PipelineClosed):
+        executor.shutdown(wait=True, cancel_futures=True)
+        for folder_path in list(waiting):
+            future = futures[folder_path]
+            if future.done() and not future.cancelled() and future.exception() is None:
+                done(folder_path, take(folder_path, future), stopping=True)
+        raise
+    finally:
+        if checkpoint:
+            sync()
+            checkpoint.commit(stage_name)
+
 # Function to concurrently calculate folder sizes and update the cache
-def calculate_folder_sizes_with_cache(folder_paths, cache_file='folder_sizes_cache.db'):
+def calculate_folder_sizes_with_cache(folder_paths, cache_file='folder_sizes_cache.db', options=None, stats=None, games=None, game_totals=None,
+                                      changed_folders=None, on_result=None):
+    options = options or ScanOptions()
+    progress, checkpoint, skipped = options.progress, options.checkpoint, options.skipped
+    stats = stats or CacheStats('folder_sizes')
     folder_sizes = {}
-    with ThreadPoolExecutor() as executor, shelve.open(cache_file) as cache:
-        futures = {executor.submit(get_folder_size, path): path for path in folder_paths}
-        for future in as_completed(futures):
-            folder_path = futures[future]
+    folder_nodes = {}
+    task = options.trace('folder_sizes', stats.time_fs(stage_task('folder_sizes', options.scan_backend)))
+    with options.create_scheduler('folder_sizes') as executor, \
+            InstrumentedCache(cache_file, stats) as cache, progress.stage('folder_sizes', len(folder_paths)) as stage:
+        # Cached nodes are read here, the workers only stat and list directories
+        pending = {}
+        size_hints = {}
+        resumed = checkpoint.finished('folder_sizes') if checkpoint else ()
+        for folder_path in folder_paths:
+            if folder_path in options.kept or options.scan_mode == 'cached':
+                value = cache.get(folder_path)
+                if is_valid_node(value):
+                    # Outside the scope, or in cached mode, the size of the last scan stands without an mtime check
+                    node = load_node(value)
+                    folder_nodes[folder_path] = node
+                    folder_sizes[folder_path] = node.total / (1024 * 1024)
+                    stats.add(hits=1)
+                    if folder_path in options.kept:
+                        stage.advance(kept=1)
+                    else:
+                        stage.detail(f"Using cached size for '{folder_path}': {folder_sizes[folder_path]:.2f} MB")
+                        stage.advance(cached=1)
+                    if on_result:
+                        on_result(folder_path, folder_sizes[folder_path])
+                    continue
+            cached_nodes = {} if options.scan_mode == 'full' and folder_path not in resumed else collect_cached_nodes(folder_path, cache)
+            if folder_path in resumed and folder_path in cached_nodes:
+                # Scanned before the interrupted run stopped; its nodes were synced with the checkpoint
+                node = cached_nodes[folder_path]
+                folder_nodes[folder_path] = node
+                folder_sizes[folder_path] = node.total / (1024 * 1024)
+                if changed_folders is not None and folder_path in checkpoint.changed:
+                    changed_folders.add(folder_path)
+                stats.add(hits=1)
+                stage.detail(f"Resumed: size of '{folder_path}' was scanned by the interrupted run")
+                stage.advance(resumed=1)
+                if on_result:
+                    on_result(folder_path, folder_sizes[folder_path])
+                continue
+            if folder_path in cached_nodes:
+                size_hints[folder_path] = cached_nodes[folder_path].total
+            elif folder_path in cache:
+                stage.detail(f"Discarding stale cached size for '{folder_path}'")
+                size_hints[folder_path] = cached_total(cache, folder_path)
+            pending[folder_path] = cached_nodes
+
+        # The largest folders by recorded size start first, new ones are interleaved. Walks are submitted
+        # as collect_results asks for them, so a Ctrl-C while they are still going in keeps the finished ones.
+        futures = {}
+
+        def submissions():
+            for folder_path in largest_first(list(pending), estimate_costs(pending, size_hints)):
+                futures[folder_path] = executor.submit(task, folder_path, pending[folder_path])
+                yield folder_path
+
+        # Store one folder's result; returns whether its directories changed, or None if it has no result
+        def take(folder_path, future):
+            cached_nodes = pending[folder_path]
             try:
-                if folder_path in cache:
-                    size = cache[folder_path]
-                    print(f"Using cached size for '{folder_path}': {size / (1024 * 1024):.2f} MB")
+                node, changed, listed, checked = future.result()
+                for path, changed_node in changed.items():
+                    cache[path] = tuple(changed_node)
+                folder_nodes[folder_path] = node
+                folder_sizes[folder_path] = node.total / (1024 * 1024)
+                if listed and changed_folders is not None:
+                    changed_folders.add(folder_path)
+                if folder_path not in cached_nodes:
+                    # A folder the cache had an entry for (discarded in full mode, or unreadable) is stale, not a miss
+                    if folder_path in size_hints:
+                        stats.add(stale=1)
+                    else:
+                        stats.add(misses=1)
+                    if options.scan_mode == 'fast':
+                        stage.detail(f"Fast path: scanning '{folder_path}', not in the size cache")
+                    stage.detail(f"Size of '{folder_path}': {node.total / (1024 * 1024):.2f} MB")
+                    stage.advance(walked=1)
+                elif listed:
+                    stats.add(stale=1)
+                    if options.scan_mode == 'fast':
+                        changed_dirs = ', '.join(os.path.relpath(path, folder_path) for path in listed)
+                        stage.detail(f"Fast path: rescanning '{folder_path}', mtime changed for {changed_dirs} ({len(listed)} of {checked} directories)")
+                    stage.detail(f"Size of '{folder_path}': {node.total / (1024 * 1024):.2f} MB ({len(listed)} changed directories listed again)")
+                    stage.advance(refreshed=1)
+                elif options.scan_mode == 'fast':
+                    stats.add(hits=1)
+                    stage.detail(f"Fast path: skipping '{folder_path}', {checked} directory mtimes unchanged")
+                    stage.advance(skipped=1)
                 else:
-                    size = future.result()
-                    cache[folder_path] = size
-                    print(f"Size of '{folder_path}': {size / (1024 * 1024):.2f} MB")
-                
-                folder_sizes[folder_path] = size / (1024 * 1024)
+                    stats.add(hits=1)
+                    stage.detail(f"Using cached size for '{folder_path}': {node.total / (1024 * 1024):.2f} MB")
+                    stage.advance(cached=1)
+                return bool(listed)
+            except (WalkTimeout, StageTimeout) as e:
+                progress.warning(f"Skipping folder {folder_path}: {e}")
+                skipped[folder_path] = str(e)
+                if size_hints.get(folder_path) is not None:
+                    folder_sizes[folder_path] = size_hints[folder_path] / (1024 * 1024)
+                if changed_folders is not None:
+                    changed_folders.add(folder_path)
+                stats.add(errors=1)
+                stage.advance(timed_out=1)
             except Exception as e:
-                print(f"Exception occurred for folder {folder_path}: {e}")
+                progress.warning(f"Exception occurred for folder {folder_path}: {e}")
+                stats.add(errors=1)
+                stage.advance(errors=1)
+            return None
+
+        collect_results('folder_sizes', submissions(), futures, executor, take, checkpoint=checkpoint, sync=cache.sync,
+                        report=on_result and (lambda folder_path: on_result(folder_path, folder_sizes.get(folder_path))))
+        # Walks in worker processes are timed there rather than by the time_fs wrapper
+        stats.add(fs_io_seconds=getattr(executor, 'worker_seconds', 0.0))
+        for line in executor.summary_lines():
+            stage.detail(line)
+
+        if games is not None:
+            totals = update_size_totals(cache, folder_nodes, games)
+            if game_totals is not None:
+                game_totals.update(totals)
     return folder_sizes
 
-# Function to Get File List for a Single Folder
+# Function to maintain the per-root and per-game aggregate nodes from the car folder nodes. Only their
+# totals are read, so the subtrees below them are never touched. Returns {game name: bytes}.
+def update_size_totals(cache, folder_nodes, games):
+    # Walks finish in any order; the roots keep the order of `games`
+    roots = {root: {} for root in games}
+    for folder_path, node in folder_nodes.items():
+        roots.setdefault(os.path.dirname(folder_path), {})[os.path.basename(folder_path)] = node
+    game_roots = {}
+    for root, children in roots.items():
+        if not children:
+            continue
+        node = aggregate_node(children)
+        if cache.get(root) != tuple(node):
+            cache[root] = tuple(node)
+        game_roots.setdefault(games.get(root, "Unknown Game"), {})[root] = node
+    totals = {}
+    for game, children in game_roots.items():
+        node = aggregate_node(children)
+        if cache.get(GAME_KEY_PREFIX + game) != tuple(node):
+            cache[GAME_KEY_PREFIX + game] = tuple(node)
+        totals[game] = node.total
+    return totals
+
+# Function to Get File List for a Single Folder, in natural name order whatever order the filesystem lists it in
 def get_file_list_for_folder(folder_path):
-    print(f"Generating file list for folder: {folder_path}")
     file_list = []
     for dirpath, dirnames, filenames in os.walk(folder_path):
-        for filename in filenames:
+        dirnames.sort(key=natural_sort_key)
+        for filename in sorted(filenames, key=natural_sort_key):
             file_path = os.path.join(dirpath, filename)
             file_size = os.path.getsize(file_path)
 
@@ -61,33 +299,149 @@ def get_file_list_for_folder(folder_path):
     return file_list
 
 # Function to Get File List with Cache and Multithreading
-def get_file_list_with_cache(folder_paths, cache_file='file_lists_cache.db'):
+def get_file_list_with_cache(folder_paths, cache_file='file_lists_cache.db', options=None, stats=None, refresh=None, size_hints=None, ready=None,
+                             on_result=None, retain=True):
+    options = options or ScanOptions()
+    progress, checkpoint, skipped = options.progress, options.checkpoint, options.skipped
+    stats = stats or CacheStats('file_lists')
     file_lists = {}
-    with ThreadPoolExecutor() as executor, shelve.open(cache_file) as cache:
-        futures = {}
-        for folder_path in folder_paths:
-            if folder_path in cache:
-                print(f"Using cached file list for '{folder_path}'")
-                file_lists[folder_path] = cache[folder_path]
-            else:
-                print(f"Cache miss, generating file list for '{folder_path}'")
-                futures[executor.submit(get_file_list_for_folder, folder_path)] = folder_path
-
-        for future in as_completed(futures):
-            folder_path = futures[future]
+    durations = {}
+    task = options.trace('file_lists', stats.time_fs(stage_task('file_lists', options.scan_backend), durations))
+    with options.create_scheduler('file_lists') as executor, \
+            InstrumentedCache(cache_file, stats) as cache, progress.stage('file_lists', len(folder_paths)) as stage:
+        store = FileListStore(cache)
+        file_counts = {}
+        resumed = checkpoint.finished('file_lists') if checkpoint else ()
+
+        # Hand a settled folder's list to on_result
+        def settle(folder_path):
+            file_list = file_lists.get(folder_path) if retain else file_lists.pop(folder_path, None)
+            if on_result:
+                on_result(folder_path, file_list)
+
+        # Take a folder's list from the cache when it can be; returns whether it has to be walked
+        def lookup(folder_path):
+            if folder_path in options.kept:
+                status, file_list = store.lookup(folder_path)
+                if status == 'hit':
+                    file_lists[folder_path] = file_list
+                    stage.advance(kept=1)
+                    settle(folder_path)
+                    return False
+            if folder_path in resumed:
+                status, file_list = store.lookup(folder_path)
+                if status == 'hit':
+                    # Listed before the interrupted run stopped; the list was synced with the checkpoint
+                    stage.detail(f"Resumed: file list of '{folder_path}' was generated by the interrupted run")
+                    file_lists[folder_path] = file_list
+                    stage.advance(resumed=1)
+                    settle(folder_path)
+                    return False
+            if refresh is not None and folder_path in refresh:
+                # Only an entry this walk replaces is stale; a folder with none is a miss
+                if folder_path in store.cache:
+                    stats.add(stale=1)
+                    stage.detail(f"Folder changed, generating file list for '{folder_path}'")
+                else:
+                    stats.add(misses=1)
+                    stage.detail(f"Cache miss, generating file list for '{folder_path}'")
+                file_counts[folder_path] = store.file_count(folder_path)
+                return True
+            status, file_list = store.lookup(folder_path)
+            if status == 'hit':
+                stage.detail(f"Using cached file list for '{folder_path}'")
+                file_lists[folder_path] = file_list
+                stage.advance(cached=1)
+                settle(folder_path)
+                return False
+            stage.detail(f"Cache {status}, generating file list for '{folder_path}'")
+            return True
+
+        # Store one folder's list; returns False once stored, or None if it has no result
+        def take(folder_path, future):
             try:
                 file_list = future.result()
-                print(f"File list generated for '{folder_path}', updating cache")
-                cache[folder_path] = file_list
-                file_lists[folder_path] = file_list
+                stage.detail(f"File list generated for '{folder_path}', updating cache")
+                file_lists[folder_path] = store.store(folder_path, file_list)
+                stage.advance(walked=1)
+                if options.throughput:
+                    # Walks in worker processes are timed there
+                    seconds = durations.pop(folder_path, None)
+                    if seconds is None:
+                        seconds = getattr(executor, 'folder_seconds', {}).pop(folder_path, 0.0)
+                    options.throughput.add(folder_path, len(file_lists[folder_path]), file_lists[folder_path].total_size(), seconds)
+                return False
+            except (WalkTimeout, StageTimeout) as e:
+                progress.warning(f"Skipping folder {folder_path}: {e}")
+                skipped[folder_path] = str(e)
+                previous = store.mark_stale(folder_path)
+                if previous is not None:
+                    file_lists[folder_path] = previous
+                stats.add(errors=1)
+                stage.advance(timed_out=1)
             except Exception as e:
-                print(f"Exception for folder {folder_path}: {e}")
+                progress.warning(f"Exception for folder {folder_path}: {e}")
+                stats.add(errors=1)
+                stage.advance(errors=1)
+            return None
+
+        def sync():
+            store.flush()
+            cache.sync()
+
+        # Walks are submitted as collect_results asks for them, as in the size stage
+        futures = {}
+        if ready is None:
+            pending = [folder_path for folder_path in folder_paths if lookup(folder_path)]
+            # The folders with the most files (by their previous list, or their size) start first
+            costs = estimate_costs(pending, size_hints or {}, file_counts)
+
+            def submissions():
+                for folder_path in largest_first(pending, costs):
+                    futures[folder_path] = executor.submit(task, folder_path)
+                    yield folder_path
+        else:
+            # Folders arrive in the order the size stage settles them, which is close to largest first
+            def submissions():
+                for folder_path in ready:
+                    if folder_path is not None and lookup(folder_path):
+                        futures[folder_path] = executor.submit(task, folder_path)
+                        yield folder_path
+                    else:
+                        yield None
+
+        collect_results('file_lists', submissions(), futures, executor, take, checkpoint=checkpoint, sync=sync, report=settle)
+        # Walks in worker processes are timed there rather than by the time_fs wrapper
+        stats.add(fs_io_seconds=getattr(executor, 'worker_seconds', 0.0))
+        for line in executor.summary_lines():
+            stage.detail(line)
+        store.close()
     return file_lists
 
-def generate_file_list_html(file_list):
+# Function to write the scanned folders (size, mtime, files) to a memory-mappable scan manifest
+def write_scan_manifest(manifest_file, folder_paths, folder_sizes, file_lists, compress=False, progress=None):
+    progress = progress or ProgressReporter()
+    with progress.stage('manifest', len(folder_paths)) as stage:
+        folders = []
+        for folder_path in folder_paths:
+            file_list = file_lists.get(folder_path, [])
+            if folder_path in folder_sizes:
+                size = round(folder_sizes[folder_path] * 1024 * 1024)
+            else:
+                size = sum(file_size for _, file_size in file_list)
+            try:
+                mtime_ns = os.stat(folder_path).st_mtime_ns
+            except OSError:
+                mtime_ns = 0
+            folders.append((folder_path, size, mtime_ns, file_list))
+            stage.advance()
+        folder_count, file_count = write_manifest(manifest_file, folders, compress=compress)
+    progress.info(f"Scan manifest with {folder_count} folders and {file_count} files written to '{manifest_file}'")
+
+def generate_file_list_html(file_list, progress=None):
     file_list_html = ""
-    if not isinstance(file_list, list) or not all(isinstance(item, tuple) and len(item) == 2 for item in file_list):
-        print(f"Invalid file list format for path: {file_list}")
+    if not is_valid_file_list(file_list):
+        (progress or ProgressReporter()).warning(f"Invalid file list format for path: {file_list}")
         return "<tr class='file_row'><td class='align-middle text-center' colspan='2'>No file details available</td></tr>"
 
     for file_name, file_size in file_list:
@@ -95,11 +449,15 @@ def generate_file_list_html(file_list):
         file_list_html += f"<tr class='file_row'><td class='align-middle text-left file'>{file_name}</td><td class='align-middle text-right file_size'>{file_size_mb:.2f} MB</td></tr>"
     return file_list_html
 
+# Function to name a car folder's details page after the folder and its game code
+def details_page_name(parent_folder_path, original_name, game_folder_codes):
+    game_code = game_folder_codes.get(parent_folder_path, "unknown")
+    return f"{original_name.replace(' ', '_').replace('.', '_')}_{game_code}.html"
+
 # Function to generate partial HTML file for car details
 def generate_car_details_html(subfolder_path, original_name, file_list_html, game_folder_codes, parent_folder_path, output_dir='car_details'):
     # Retrieve the game code using the parent folder path
-    game_code = game_folder_codes.get(parent_folder_path, "unknown")
-    file_name = f"{original_name.replace(' ', '_').replace('.', '_')}_{game_code}.html"
+    file_name = details_page_name(parent_folder_path, original_name, game_folder_codes)
     image_path = folder_to_image.get(parent_folder_path, "_images/unknown.png")
     game_name = parent_folders.get(parent_folder_path, "Unknown Game")
 
@@ -147,6 +505,96 @@ def generate_car_details_html(subfolder_path, original_name, file_list_html, gam
 
     return file_name
 
+# Function to write a car folder's details page from its file list; returns the file list HTML
+def write_car_details(folder_path, file_list, progress=None, output_dir='car_details'):
+    original_name = os.path.basename(folder_path)  # Extract the folder name
+    file_list_html = generate_file_list_html(file_list, progress)
+
+    # Extract parent folder path from the full subfolder path
+    parent_folder_path = os.path.dirname(folder_path)
+    generate_car_details_html(folder_path, original_name, file_list_html, game_folder_codes, parent_folder_path, output_dir)
+
+    # Print the debug information
+    # debug_game_code = game_folder_codes.get(parent_folder_path, "unknown")
+    # print(f"Debug: Parent Folder Path - {parent_folder_path}, Game Code - {debug_game_code}")
+    return file_list_html
+
+# Function to list the car folder paths of a car's occurrences
+def occurrence_paths(occurrences):
+    return [os.path.join(folder_path, original_name) for folder_path, original_name in occurrences]
+
+# Function to render a car's row of the index table. `file_list_htmls` holds the file list HTML of its
+# occurrences that have a file list, by folder path; the others are left out of the row. `pending`
+# renders the occurrences with their sizes pending (see format_full_path_and_image).
+def render_index_row(occurrences, file_list_htmls, folder_sizes, pending=False):
+    ## color_class = get_cell_color(occurrences)
+    
+    # Assuming the first occurrence's path determines the game
+    first_folder_path = occurrences.first.root
+    game_name = parent_folders.get(first_folder_path, "Unknown Game")
+
+    # Add game classes to each row
+    game_classes = [get_game_id(folder_path) for folder_path, _ in occurrences]
+    game_class_str = " ".join(game_classes)
+
+    # Reuse the record parse_folder_name produced for this car during the scan
+    first_folder_path, first_original_name = occurrences.first
+    manufacturer, manufacturer_logo, model, year, variant, variant_logo, race_number = occurrences.parsed
+
+    # Format first occurrence for display with image
+    first_occurrence_display = format_game_image(first_folder_path, first_original_name)
+    
+    # Replace first_original_name with stripped version
+    first_original_name = strip_slod_suffix(first_original_name)
+    
+    # Get the badge class and text based on occurrences
+    badge_class, badge_text = assign_badge(occurrences)
+
+    # Wrap the first_original_name with the badge span tag
+    first_original_name_display = f'<span class="{badge_class}" data-filter-type="{badge_text}" title="{badge_text}">{first_original_name}</span>'
+
+    # Format all occurrences for display with images and full paths, image left-aligned and path right-aligned
+    # Generate and format all occurrences
+    all_occurrences_display = ""
+    for occ_path, occ_name in occurrences:
+        full_subfolder_path = os.path.join(occ_path, occ_name)
+        if full_subfolder_path in file_list_htmls:
+            file_list_html = file_list_htmls[full_subfolder_path]
+
+            # Format the occurrence for display
+            occurrence_display = format_full_path_and_image(
+                full_subfolder_path, occ_name, parent_folders.get(occ_path, "Unknown Game"), 
+                folder_sizes, file_list_html, game_folder_codes, pending
+            )
+            all_occurrences_display += occurrence_display
+
+    # This line checks if race_number is not empty or None and includes circlebehind
+    race_number_html = f'<span class="circlebehind"><span class="circle">{race_number}</span></span>' if race_number else f'<span class="circle">{race_number}</span>'
+
+    row_class = "unique-row" if badge_text == "Unique" else ("duplicate-row" if badge_text == "Duplicated" else "multi-duplicate-row")
+
+    # Determine if variant_logo is an image path or plain text
+    if variant_logo.endswith('.png'):
+        variant_display = f'<img src="{variant_logo}" alt="{variant}" title="{variant}" class="img-fluid" width="150" height="50"><span class="d-none">{variant}</span>  <!-- Hidden text for search -->'
+    else:
+        variant_display = variant  # Plain text
+
+    return f"""
+    <tr class="{row_class} {game_class_str}">
+      <td class="align-middle text-center manufacturer-logo">
+          <img src="{manufacturer_logo}" alt="{manufacturer}" title="{manufacturer}" class="img-fluid">
+          <span class="d-none">{manufacturer}</span>  <!-- Hidden text for search -->
+      </td>
+      <td class="align-middle" style="text-align:center;">{race_number_html}</td>
+      <td class="align-middle" style="text-align:center;">{model}</td>
+      <td class="align-middle" style="text-align:center;">{year}</td>
+      <td class="align-middle" style="text-align:center;">{variant_display}</td>
+      <td class="align-middle" style="text-align:center;">{first_original_name_display}</td>
+      <td class="align-middle" style="text-align:left;">{first_occurrence_display}</td>
+      <td class="align-middle" style="text-align:left;"><ul class="list-unstyled align-items-center mb-0 car-list">{all_occurrences_display}</ul></td>
+    </tr>
+    """
+
 def generate_and_format_all_occurrences(occurrences, folder_to_image, parent_folders, file_lists, folder_sizes):
     all_occurrences_display = ""
     for occ_index, (occ_path, occ_name) in enumerate(occurrences):
@@ -163,8 +611,10 @@ def generate_and_format_all_occurrences(occurrences, folder_to_image, parent_fol
 
     return all_occurrences_display
 
-# Function to format the occurrences with the full path and image, including detailed file list modal 
-def format_full_path_and_image(folder_path, original_name, game_name, folder_sizes, file_list_html, game_folder_codes):
+# Function to format the occurrences with the full path and image, including detailed file list modal. With
+# `pending` (the first index of a progressive build) the size reads pending and the File Details button
+# is disabled, both tagged with the details page name for the page to fill in from the live data file.
+def format_full_path_and_image(folder_path, original_name, game_name, folder_sizes, file_list_html, game_folder_codes, pending=False):
     
     # Extract parent folder path from the full subfolder path
     parent_folder_path = os.path.dirname(folder_path)
@@ -176,7 +626,14 @@ def format_full_path_and_image(folder_path, original_name, game_name, folder_siz
     folder_size_mb = folder_sizes.get(full_path, 0)  # Now using the full path of the car subfolder
 
     # Use the same naming convention to determine the details file name
-    details_file_name = f"{original_name.replace(' ', '_').replace('.', '_')}_{game_code}.html"
+    details_file_name = details_page_name(parent_folder_path, original_name, game_folder_codes)
+
+    if pending:
+        size_html = f'<span class="ml-auto folder-size" data-page="{details_file_name}">Folder Size: pending</span>'
+        button_state = ' disabled title="File details pending"'
+    else:
+        size_html = f'<span class="ml-auto">Folder Size: {folder_size_mb:.2f} MB</span>'
+        button_state = ''
 
     # print("DEBUG: -------------------------------")
     # print(f"DEBUG: Folder path: {folder_path}")
@@ -194,10 +651,10 @@ def format_full_path_and_image(folder_path, original_name, game_name, folder_siz
         <div class="media-body col-sm-8">
             <h5 class="mt-0 mb-1">{original_name}</h5>
             <span class="font-weight-light small ml-auto">{full_path}</span></br>
-            <span class="ml-auto">Folder Size: {folder_size_mb:.2f} MB</span>
+            {size_html}
         </div>
         <div class="media-body col-sm-4 text-right">
-            <button type="button" class="btn btn-secondary details-button" data-details-url="car_details/{details_file_name}">
+            <button type="button" class="btn btn-secondary details-button" data-details-url="car_details/{details_file_name}"{button_state}>
                 File Details
             </button>
             
@@ -209,60 +666,10 @@ def format_full_path_and_image(folder_path, original_name, game_name, folder_siz
     </li>
     '''
 
-# Function to parse folder name into Manufacturer, Model, Year, Variant, and Race Number (if present)
+# Function to parse folder name into Manufacturer, Model, Year, Variant, and Race Number (if present).
+# Results are memoized per normalized name, so each distinct folder name is only parsed once.
 def parse_folder_name(folder_name):
-    # Initialize default values
-    manufacturer, model, year, variant, race_number = 'Unknown', 'Unknown', 'Unknown', 'Unknown', 'Unknown'
-    manufacturer_logo = "_images/brands/Unknown_Logo.png"
-
-    # Process folder name if no override exists
-    folder_name = re.sub(r'(_?slod)$', '', folder_name, flags=re.IGNORECASE)
-    parts = folder_name.split('_')
-    manufacturer_code = parts[0].lower() if len(parts) >= 3 else 'unknown'
-
-    # Check if an override exists for this folder name
-    if folder_name in car_overrides:
-        manufacturer, model, year, variant, race_number = car_overrides[folder_name]
-        # Check if manufacturer is directly in the logos dictionary
-        if manufacturer.lower() in manufacturer_logos:
-            manufacturer_code = manufacturer.lower()
-    else:
-        if len(parts) >= 3:
-            manufacturer_code = parts[0].lower()  # Convert to lowercase
-            manufacturer = manufacturer_codes.get(manufacturer_code, 'Unknown')
-            model = parts[1].title()
-            year = parts[-1]
-
-            # Check for a race number before the model
-            race_number = ''
-            model_start_index = 1
-            if parts[1].isdigit():
-                race_number = parts[1]
-                model_start_index = 2
-        
-            model = parts[model_start_index].title()
-        
-            # Handle year, which should be the last segment
-            year_part = parts[-1]
-            if len(year_part) == 2:
-                current_year_last_two_digits = datetime.now().year % 100
-                year_prefix = '19' if int(year_part) > current_year_last_two_digits else '20'
-                year = year_prefix + year_part
-            else:
-                year = year_part
-        
-            # Variant may include the segments between model and year
-            variant_parts = parts[model_start_index + 1:-1]
-            variant = ' '.join(variant_parts).title() if variant_parts else ''
-            variant = variant_mappings.get(variant, variant)  # Map the variant code to friendly name
-
-    # Fetch the logo using the manufacturer code or name
-    manufacturer_logo = manufacturer_logos.get(manufacturer_code, "_images/brands/Unknown_Logo.png")
-
-    # Fetch the variant logo or use plain text
-    variant_logo = variant_logos.get(variant, variant)  # This will return the image path or plain text
-
-    return manufacturer, manufacturer_logo, model, year, variant, variant_logo, race_number
+    return get_folder_name_parser().parse(folder_name)
 
 # Function to determine the cell color based on the number of occurrences
 # def get_cell_color(occurrences):
@@ -317,69 +724,6 @@ def generate_game_filters_html(parent_folders, folder_to_image):
         '''
     return game_filters_html
 
-print("Building data...")
-
-# Assuming manufacturer_codes is a dictionary mapping codes to names
-name_to_code_mapping = {name.lower(): code for code, name in manufacturer_codes.items()}
-
-# You should now collect paths of the individual subfolders instead of the parent folders
-subfolders_dict = {}
-unique_folder_paths = set()  # This will collect individual car subfolder paths
-
-for folder_path, game_name in parent_folders.items():
-    try:
-        for subfolder in os.listdir(folder_path):
-            original_name = subfolder
-            subfolder_normalized = strip_slod_suffix(subfolder).lower()
-            subfolder_full_path = os.path.join(folder_path, subfolder)  # Full path to the subfolder
-
-            if subfolder_normalized in excluded_subfolders or not re.match(r'^[a-z]{2,3}_', subfolder_normalized):
-                continue
-
-            if os.path.isdir(subfolder_full_path):
-                unique_folder_paths.add(subfolder_full_path)  # Add the path of each car subfolder
-
-                parsed_values = parse_folder_name(subfolder_normalized)
-                comparison_key = parsed_values
-
-                if comparison_key not in subfolders_dict:
-                    subfolders_dict[comparison_key] = [(folder_path, original_name)]
-                else:
-                    if (folder_path, original_name) not in subfolders_dict[comparison_key]:
-                        subfolders_dict[comparison_key].append((folder_path, original_name))
-    except FileNotFoundError:
-        print(f"Warning: The folder {folder_path} was not found or is not accessible.")
-
-# Retrieve folder sizes, using the cache if available
-folder_sizes = calculate_folder_sizes_with_cache(unique_folder_paths)
-
-# After calculating folder sizes
-file_lists = get_file_list_with_cache(unique_folder_paths, 'file_lists_cache.db')
-
-# Initialize total size variables
-total_size_all_cars = 0
-total_size_unique_cars = 0
-
-# Initialize counters
-total_cars = 0
-unique_cars = 0
-
-for comparison_key, occurrences in subfolders_dict.items():
-    is_unique = len(occurrences) == 1  # Flag to check if the car is unique
-    total_cars += len(occurrences)
-
-    for folder_path, original_name in occurrences:
-        subfolder_full_path = os.path.join(folder_path, original_name)
-        size_mb = folder_sizes.get(subfolder_full_path, 0)  # Ensure size is in MB
-        total_size_all_cars += size_mb
-
-        if is_unique:
-            unique_cars += 1
-            total_size_unique_cars += size_mb
-
-# Call the function to generate the HTML for game filters
-game_filters_html = generate_game_filters_html(parent_folders, folder_to_image)
-
 # def generate_model_mappings_csv(subfolders_dict, csv_file='model_mappings.csv'):
 #     with open(csv_file, 'w', newline='', encoding='utf-8') as file:
 #         writer = csv.writer(file)
@@ -397,7 +741,19 @@ game_filters_html = generate_game_filters_html(parent_folders, folder_to_image)
 # Call the function
 # generate_model_mappings_csv(subfolders_dict)
 
-html_output = f"""
+# Function to render the totals lines of the index header. Without sizes (the first index of a
+# progressive build) the sizes read pending, for the page to sum up from the live data file.
+def format_index_totals(total_cars, unique_cars, total_size_all_cars=None, total_size_unique_cars=None):
+    if total_size_all_cars is None:
+        return (f'                <div>Total cars: {total_cars} (Total Size: <span id="total-size-all">pending</span>)</div>\n'
+                f'                <div>Total unique cars: {unique_cars} (Total Size: <span id="total-size-unique">pending</span>)</div>\n'
+                '                <div id="live-status" class="small text-muted">Scanning folders...</div>')
+    return (f"                <div>Total cars: {total_cars} (Total Size: {total_size_all_cars:.2f} MB)</div>\n"
+            f"                <div>Total unique cars: {unique_cars} (Total Size: {total_size_unique_cars:.2f} MB)</div>")
+
+# Function to render the index page up to its table body
+def render_index_head(totals_html, game_filters_html):
+    return f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -535,8 +891,7 @@ span.circle {{
                 <span class="badge badge-danger">Duplicated in > 2 games</span>
             </div>
             <div class="totals">
-                <div>Total cars: {total_cars} (Total Size: {total_size_all_cars:.2f} MB)</div>
-                <div>Total unique cars: {unique_cars} (Total Size: {total_size_unique_cars:.2f} MB)</div>
+{totals_html}
             </div>
         </div>
     </div>
@@ -572,98 +927,9 @@ span.circle {{
         <tbody>
 """
 
-# Pre-generate partial HTML files for each unique folder
-for i, folder_path in enumerate(unique_folder_paths, 1):
-    if folder_path in file_lists:
-        original_name = os.path.basename(folder_path)  # Extract the folder name
-        file_list = file_lists[folder_path]
-        file_list_html = generate_file_list_html(file_list)
-        
-        # Extract parent folder path from the full subfolder path
-        parent_folder_path = os.path.dirname(folder_path)
-        details_file_name = generate_car_details_html(folder_path, original_name, file_list_html, game_folder_codes, parent_folder_path)
-
-        # Print the debug information
-        # debug_game_code = game_folder_codes.get(parent_folder_path, "unknown")
-        # print(f"Debug: Parent Folder Path - {parent_folder_path}, Game Code - {debug_game_code}")
-        
-        # Print progress for partial HTML file generation
-        print(f'Generating partial HTML for car {i}/{len(unique_folder_paths)}')
-
-# Sort and add rows to the table, ensuring sorting by the original internal_name
-sorted_subfolders = sorted(subfolders_dict.items(), key=lambda x: x[1][0][1].lower())  # Sort by the original_name in lowercase
-for i, (comparison_key, occurrences) in enumerate(sorted_subfolders, 1):
-    ## color_class = get_cell_color(occurrences)
-    
-    # Assuming the first occurrence's path determines the game
-    first_folder_path = occurrences[0][0]
-    game_name = parent_folders.get(first_folder_path, "Unknown Game")
-
-    # Add game classes to each row
-    game_classes = [get_game_id(folder_path) for folder_path, _ in occurrences]
-    game_class_str = " ".join(game_classes)
-
-    # Correctly unpack all six values returned by the parse_folder_name function
-    first_folder_path, first_original_name = occurrences[0]
-    manufacturer, manufacturer_logo, model, year, variant, variant_logo, race_number = parse_folder_name(first_original_name)
-
-    # Format first occurrence for display with image
-    first_occurrence_display = format_game_image(first_folder_path, first_original_name)
-    
-    # Replace first_original_name with stripped version
-    first_original_name = strip_slod_suffix(first_original_name)
-    
-    # Get the badge class and text based on occurrences
-    badge_class, badge_text = assign_badge(occurrences)
-
-    # Wrap the first_original_name with the badge span tag
-    first_original_name_display = f'<span class="{badge_class}" data-filter-type="{badge_text}" title="{badge_text}">{first_original_name}</span>'
-
-    # Format all occurrences for display with images and full paths, image left-aligned and path right-aligned
-    # Generate and format all occurrences
-    all_occurrences_display = ""
-    for occ_path, occ_name in occurrences:
-        full_subfolder_path = os.path.join(occ_path, occ_name)
-        if full_subfolder_path in file_lists:
-            file_list = file_lists[full_subfolder_path]
-            file_list_html = generate_file_list_html(file_list)
-
-            # Format the occurrence for display
-            occurrence_display = format_full_path_and_image(
-                full_subfolder_path, occ_name, parent_folders.get(occ_path, "Unknown Game"), 
-                folder_sizes, file_list_html, game_folder_codes
-            )
-            all_occurrences_display += occurrence_display
-
-    # This line checks if race_number is not empty or None and includes circlebehind
-    race_number_html = f'<span class="circlebehind"><span class="circle">{race_number}</span></span>' if race_number else f'<span class="circle">{race_number}</span>'
-
-    row_class = "unique-row" if badge_text == "Unique" else ("duplicate-row" if badge_text == "Duplicated" else "multi-duplicate-row")
-
-    # Determine if variant_logo is an image path or plain text
-    if variant_logo.endswith('.png'):
-        variant_display = f'<img src="{variant_logo}" alt="{variant}" title="{variant}" class="img-fluid" width="150" height="50"><span class="d-none">{variant}</span>  <!-- Hidden text for search -->'
-    else:
-        variant_display = variant  # Plain text
-
-    html_output += f"""
-    <tr class="{row_class} {game_class_str}">
-      <td class="align-middle text-center manufacturer-logo">
-          <img src="{manufacturer_logo}" alt="{manufacturer}" title="{manufacturer}" class="img-fluid">
-          <span class="d-none">{manufacturer}</span>  <!-- Hidden text for search -->
-      </td>
-      <td class="align-middle" style="text-align:center;">{race_number_html}</td>
-      <td class="align-middle" style="text-align:center;">{model}</td>
-      <td class="align-middle" style="text-align:center;">{year}</td>
-      <td class="align-middle" style="text-align:center;">{variant_display}</td>
-      <td class="align-middle" style="text-align:center;">{first_original_name_display}</td>
-      <td class="align-middle" style="text-align:left;">{first_occurrence_display}</td>
-      <td class="align-middle" style="text-align:left;"><ul class="list-unstyled align-items-center mb-0 car-list">{all_occurrences_display}</ul></td>
-    </tr>
-    """
-
-# Close the HTML tags
-html_output += """
+# Function to render the index page after its table body; `scripts` is added after the page's own script
+def render_index_tail(scripts=""):
+    return """
     </tbody>
   </table>
 </div>
@@ -790,25 +1056,781 @@ html_output += """
         });
     });
 </script>
-</body>
+""" + scripts + """</body>
 </html>
 """
 
-# Extract the friendly names from the manufacturer_codes dictionary
-autocomplete_data = {
-    "manufacturers": list(manufacturer_codes.values())
-}
-
-# Writing JSON data to the car_details folder
-json_filename = 'car_details/autocomplete_data.json'
-with open(json_filename, 'w') as json_file:
-    json.dump({"manufacturers": list(manufacturer_codes.values())}, json_file)
-
-print(f"Autocomplete JSON data saved to '{json_filename}'")
+# Function to render the script of the first index of a progressive build. It polls the live data file
+# at `data_url`, fills in folder sizes, the size totals and the scan status and enables File Details
+# buttons as the records come in, and loads the finished index once the build marks the file complete.
+def render_live_script(data_url, poll_ms=2000):
+    return f"""<script>
+    $(document).ready(function() {{
+        var table = $('#carTable').DataTable();
+        var sizeSpans = {{}};
+        var buttons = {{}};
+        $(table.rows().nodes()).find('.folder-size').each(function() {{
+            sizeSpans[$(this).data('page')] = this;
+        }});
+        $(table.rows().nodes()).find('.details-button').each(function() {{
+            buttons[$(this).data('details-url')] = this;
+        }});
+        var firstLine = null, seen = 0, folders = 0, sized = 0, detailed = 0, stopped = false;
+        var totalAll = 0, totalUnique = 0;
+
+        function apply(record) {{
+            if (record.folders !== undefined) {{
+                folders = record.folders;
+            }} else if (record.size !== undefined && sizeSpans[record.page]) {{
+                var span = sizeSpans[record.page];
+                delete sizeSpans[record.page];
+                $(span).text('Folder Size: ' + record.size.toFixed(2) + ' MB');
+                totalAll += record.size;
+                if ($(span).closest('tr').hasClass('unique-row')) {{
+                    totalUnique += record.size;
+                }}
+                sized++;
+            }} else if (record.details !== undefined && buttons['car_details/' + record.page]) {{
+                $(buttons['car_details/' + record.page]).prop('disabled', false).removeAttr('title');
+                delete buttons['car_details/' + record.page];
+                detailed++;
+            }} else if (record.stopped !== undefined) {{
+                stopped = true;
+            }}
+        }}
+
+        function poll() {{
+            $.ajax({{url: {json.dumps(data_url)}, dataType: 'text', cache: false}}).done(function(text) {{
+                var lines = text.split('\\n');
+                // A new build started the file again
+                if (firstLine !== null && lines[0] !== firstLine) {{
+                    location.reload();
+                    return;
+                }}
+                firstLine = lines[0];
+                // The last line is only complete once its newline is written
+                for (; seen < lines.length - 1; seen++) {{
+                    var record = JSON.parse(lines[seen]);
+                    if (record.complete !== undefined) {{
+                        location.reload();
+                        return;
+                    }}
+                    apply(record);
+                }}
+                $('#total-size-all').text(totalAll.toFixed(2) + ' MB so far');
+                $('#total-size-unique').text(totalUnique.toFixed(2) + ' MB so far');
+                if (stopped) {{
+                    $('#live-status').text('The scan stopped after sizing ' + sized + ' of ' + folders + ' folders; run the build again to finish it');
+                    return;
+                }}
+                $('#live-status').text('Scanning folders: ' + sized + ' of ' + folders + ' sized, ' + detailed + ' with file details');
+                setTimeout(poll, {poll_ms});
+            }}).fail(function() {{
+                setTimeout(poll, {poll_ms});
+            }});
+        }}
+        poll();
+    }});
+</script>
+"""
 
-# Write to HTML file
-output_file_path = 'index.html'
-with open(output_file_path, 'w') as file:
-    file.write(html_output)
+# Function to write the first index of a progressive build, from the folder names alone: every car
+# and occurrence is listed, with the sizes pending and the File Details buttons disabled until the
+# live data file at `data_url` says otherwise
+def write_pending_index(subfolders_dict, data_url, output_file_path='index.html'):
+    total_cars = sum(len(occurrences) for occurrences in subfolders_dict.values())
+    unique_cars = sum(1 for occurrences in subfolders_dict.values() if len(occurrences) == 1)
+    sorted_subfolders = sorted(subfolders_dict.items(), key=lambda x: x[1].first.name.lower())
+    rows = [render_index_row(occurrences, dict.fromkeys(occurrence_paths(occurrences), ""), {}, pending=True) for _, occurrences in sorted_subfolders]
+    with open(output_file_path, 'w') as file:
+        file.write(render_index_head(format_index_totals(total_cars, unique_cars), generate_game_filters_html(parent_folders, folder_to_image)))
+        file.write("".join(rows))
+        file.write(render_index_tail(render_live_script(data_url)))
+    return output_file_path
+
+# Function to run the scan and render stages as a pipeline rather than one after the other: the size
+# stage, the file list stage and a renderer run at once in their own threads, joined by bounded
+# channels of `queue_depth` folders. A folder's file list is looked up or walked as soon as its size is
+# settled and its details page is written as soon as its file list is, so rendering overlaps the walks;
+# a car's index row is rendered once all of its occurrences have arrived, and the file list HTML of an
+# occurrence is only kept until then. `scan_sizes(on_result)` and `scan_file_lists(ready, on_result)`
+# run the two scan stages. If a stage fails or the build is interrupted, the others are stopped and
+# the stage's exception (or the KeyboardInterrupt) is raised. `on_size(folder_path, size)` and
+# `on_details(folder_path)` are called as sizes are recorded and details pages written, from the stage
+# threads. Returns (folder sizes, file lists, {car key: index row HTML}, channels).
+def run_pipeline(subfolders_dict, folder_count, scan_sizes, scan_file_lists, progress=None, queue_depth=DEFAULT_QUEUE_DEPTH, output_dir='car_details',
+                 on_size=None, on_details=None, kept=()):
+    progress = progress or ProgressReporter()
+    sizes_out = Channel(queue_depth, 'folder_sizes')
+    lists_out = Channel(queue_depth, 'file_lists')
+    folder_sizes = {}
+    rows = {}
+    # Occurrences of each car still to arrive, and the car of each folder
+    remaining = {}
+    owners = {}
+    for key, occurrences in subfolders_dict.items():
+        paths = occurrence_paths(occurrences)
+        remaining[key] = len(paths)
+        owners.update((path, key) for path in paths)
+
+    def render():
+        fragments = {}
+        details_stage = progress.stage('car_details', folder_count)
+        rows_stage = progress.stage('index_rows', len(subfolders_dict))
+        for folder_path, file_list in lists_out:
+            if file_list is not None and keeps_details(folder_path, kept, output_dir):
+                # The row only needs to know there is a details page
+                fragments[folder_path] = ""
+                if on_details:
+                    on_details(folder_path)
+                details_stage.advance(kept=1)
+            elif file_list is not None:
+                fragments[folder_path] = write_car_details(folder_path, file_list, progress, output_dir)
+                if on_details:
+                    on_details(folder_path)
+                details_stage.detail(f"Generating partial HTML for car {details_stage.done + 1}/{folder_count}")
+                details_stage.advance(written=1)
+            else:
+                details_stage.advance(skipped=1)
+            key = owners.get(folder_path)
+            if key is None:
+                continue
+            remaining[key] -= 1
+            if not remaining[key]:
+                occurrences = subfolders_dict[key]
+                file_list_htmls = {path: fragments.pop(path) for path in occurrence_paths(occurrences) if path in fragments}
+                rows[key] = render_index_row(occurrences, file_list_htmls, folder_sizes)
+                rows_stage.advance()
+        details_stage.finish()
+        rows_stage.finish()
+
+    # Sizes are recorded here, before the folder is passed on, so the renderer sees them
+    def ready():
+        for item in sizes_out.items(idle=POLL_INTERVAL):
+            if item is None:
+                yield None
+                continue
+            folder_path, size = item
+            if size is not None:
+                folder_sizes[folder_path] = size
+            if on_size:
+                on_size(folder_path, size)
+            yield folder_path
+
+    threads = (StageThread('folder_sizes', scan_sizes, lambda folder_path, size: sizes_out.put((folder_path, size)), outputs=(sizes_out,)),
+               StageThread('file_lists', scan_file_lists, ready(), lambda folder_path, file_list: lists_out.put((folder_path, file_list)),
+                           inputs=(sizes_out,), outputs=(lists_out,)),
+               StageThread('render', render, inputs=(lists_out,)))
+    for thread in threads:
+        thread.start()
+    # Every stage has a thread of its own, so a Ctrl-C lands here rather than part way into a submit; the
+    # stages see the channels aborted and wind down as they would on a Ctrl-C of their own
+    try:
+        for thread in threads:
+            thread.wait()
+    except KeyboardInterrupt:
+        sizes_out.abort()
+        lists_out.abort()
+        for thread in threads:
+            thread.wait()
+        raise
+    # The stage that failed says more than the PipelineClosed it caused in the others
+    errors = sorted((thread.error for thread in threads if thread.error is not None), key=lambda error: isinstance(error, PipelineClosed))
+    if errors:
+        raise errors[0]
+    folder_sizes, file_lists = threads[0].value, threads[1].value
+    return folder_sizes, file_lists, rows, (sizes_out, lists_out)
+
+# Function to list the car folders of a game root in natural name order, as (folder name, normalized
+# name); raises FileNotFoundError when the root is missing
+def list_car_folders(folder_path):
+    car_folders = []
+    for subfolder in sorted(os.listdir(folder_path), key=natural_sort_key):
+        subfolder_normalized = strip_slod_suffix(subfolder).lower()
+        subfolder_full_path = os.path.join(folder_path, subfolder)  # Full path to the subfolder
+
+        if subfolder_normalized in excluded_subfolders or not CAR_FOLDER_PATTERN.match(subfolder_normalized):
+            continue
+
+        if os.path.isdir(subfolder_full_path):
+            car_folders.append((subfolder, subfolder_normalized))
+    return car_folders
+
+# Function to list a game root for a build that may be scoped: a root whose game is outside the scope
+# is taken from the catalog of the last build when it is there. Returns (car folders as list_car_folders
+# gives them, whether the root was listed).
+def list_root_in_scope(folder_path, scope, catalog):
+    if scope and not scope.lists_root(folder_path) and folder_path in catalog:
+        return [(name, strip_slod_suffix(name).lower()) for name in catalog[folder_path]], False
+    return list_car_folders(folder_path), True
+
+# Function to tell whether a folder kept from the last build (outside the scope of a scoped build) still
+# has its details page, which is then left as it is
+def keeps_details(folder_path, kept, output_dir='car_details'):
+    return folder_path in kept and os.path.exists(os.path.join(output_dir, details_page_name(os.path.dirname(folder_path), os.path.basename(folder_path), game_folder_codes)))
+
+# Function to scan the parent folders, gather sizes and file lists, and write the HTML output
+def build_database(tracer=None, progress=None, memprofile=None, manifest_file=None, compress_manifest=False, scan_mode='cached',
+                   min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS, folder_timeout=DEFAULT_FOLDER_TIMEOUT,
+                   stage_timeout=DEFAULT_STAGE_TIMEOUT, retries=DEFAULT_RETRIES, resume=False, checkpoint_every=0,
+                   checkpoint_file=DEFAULT_CHECKPOINT_FILE, scan_backend=DEFAULT_SCAN_BACKEND, pipeline=False, queue_depth=DEFAULT_QUEUE_DEPTH,
+                   progressive=False, live_data_file=DEFAULT_LIVE_DATA_FILE, memory_budget=None, scope=None, catalog_file=DEFAULT_CATALOG_FILE):
+    progress = progress or ProgressReporter()
+    cache_stats = {'folder_sizes': CacheStats('folder_sizes'), 'file_lists': CacheStats('file_lists')}
+    throughput = RootThroughput()
+    progress.info("Building data...")
+
+    # With checkpoint_every the scan journals finished folders, so that an interrupted run can be resumed with --resume
+    checkpoint = None
+    if resume:
+        checkpoint = ScanCheckpoint.load(checkpoint_file, batch_size=checkpoint_every or DEFAULT_BATCH_SIZE)
+        if checkpoint is None:
+            progress.info(f"No interrupted scan to resume in '{checkpoint_file}', starting a new one")
+        else:
+            if checkpoint.scan_mode != scan_mode:
+                progress.warning(f"Resuming the interrupted '{checkpoint.scan_mode}' scan instead of a '{scan_mode}' one")
+                scan_mode = checkpoint.scan_mode
+            progress.info(f"Resuming the interrupted scan: {len(checkpoint.finished('folder_sizes'))} folder sizes and "
+                          f"{len(checkpoint.finished('file_lists'))} file lists already done")
+    if checkpoint is None and checkpoint_every:
+        checkpoint = ScanCheckpoint(checkpoint_file, scan_mode, batch_size=checkpoint_every).start()
+    elif checkpoint is None:
+        # A journal left by an earlier scan no longer describes the caches this one updates
+        ScanCheckpoint(checkpoint_file).remove()
+
+    # Folders whose walk timed out in either stage: {folder path: reason}
+    skipped = {}
+    options = ScanOptions(progress=progress, tracer=tracer, scan_mode=scan_mode, scan_backend=scan_backend, min_workers=min_workers, max_workers=max_workers,
+                          folder_timeout=folder_timeout, stage_timeout=stage_timeout, retries=retries, checkpoint=checkpoint, skipped=skipped,
+                          throughput=throughput)
+
+    if memory_budget:
+        for option, used in (('--manifest', manifest_file), ('--pipeline', pipeline), ('--progressive', progressive)):
+            if used:
+                progress.warning(f"{option} is not supported by a streaming build and is ignored")
+        return stream_database(options, cache_stats, memory_budget, memprofile=memprofile, scope=scope, catalog_file=catalog_file)
+
+    # Cars grouped by identity: {identity key: Vehicle}, each Vehicle holding its occurrences in discovery order
+    subfolders_dict = {}
+    # Individual car subfolder paths in a stable order: root order, then natural name order within a root.
+    # Every later stage (sizes, file lists, details pages, the manifest) follows this order.
+    unique_folder_paths = []
+    # A scoped build only lists the roots of the games in scope, taking the other roots' folders from the
+    # catalog of the last build. The folders outside the scope are kept: their sizes and file lists are
+    # taken from the caches without a walk and their details pages are left as they are.
+    catalog = load_catalog(catalog_file) if scope else {}
+    kept = set()
+
+    list_stage = progress.stage('list_roots', len(parent_folders))
+    with CatalogWriter(catalog_file) as catalog_writer:
+        for folder_path, game_name in parent_folders.items():
+            try:
+                car_folders, listed = list_root_in_scope(folder_path, scope, catalog)
+                for original_name, subfolder_normalized in car_folders:
+                    subfolder_full_path = os.path.join(folder_path, original_name)
+                    unique_folder_paths.append(subfolder_full_path)  # Add the path of each car subfolder
+
+                    parsed_values = parse_folder_name(subfolder_normalized)
+                    add_occurrence(subfolders_dict, parsed_values, Occurrence(folder_path, original_name))
+                    if scope and not scope.includes(folder_path, original_name, parsed_values):
+                        kept.add(subfolder_full_path)
+                catalog_writer.add(folder_path, [original_name for original_name, _ in car_folders])
+                if listed:
+                    list_stage.advance()
+                else:
+                    list_stage.advance(catalog=1)
+            except FileNotFoundError:
+                progress.warning(f"Warning: The folder {folder_path} was not found or is not accessible.")
+                list_stage.advance(missing=1)
+    list_stage.finish()
+    if scope:
+        progress.info(f"Scoped build ({scope.describe()}): {len(unique_folder_paths) - len(kept)} of {len(unique_folder_paths)} folders in scope")
+    if memprofile:
+        memprofile.checkpoint('list_roots', len(unique_folder_paths), subfolders_dict=subfolders_dict, unique_folder_paths=unique_folder_paths)
+
+    # A progressive build writes a first index from the folder names straight away. The scan then records
+    # each folder's size and details page in the live data file as it gets to them, for that index to
+    # fill itself in, until the finished index replaces it.
+    live = None
+    on_size = on_details = None
+    if progressive:
+        live = LiveDataFile(live_data_file).start(len(unique_folder_paths))
+        progress.info(f"First index written to '{write_pending_index(subfolders_dict, live_data_file)}' from {len(unique_folder_paths)} folder names; "
+                      f"sizes and file details follow through '{live_data_file}'")
+
+        def live_page(folder_path):
+            return details_page_name(os.path.dirname(folder_path), os.path.basename(folder_path), game_folder_codes)
+
+        def on_size(folder_path, size):
+            if size is not None:
+                live.add(page=live_page(folder_path), size=round(size, 4))
+
+        def on_details(folder_path):
+            live.add(page=live_page(folder_path), details=1)
+
+    # Retrieve folder sizes, using the cache if available
+    game_totals = {}
+    changed_folders = set()
+    options.kept = kept
+    size_options = {'options': options, 'stats': cache_stats['folder_sizes'], 'games': parent_folders, 'game_totals': game_totals,
+                    'changed_folders': changed_folders}
+    # In fast mode only the folders the size stage found changed are listed again; in full mode all are
+    refresh = {'cached': None, 'fast': changed_folders, 'full': set(unique_folder_paths)}[scan_mode]
+    list_options = {'options': options, 'stats': cache_stats['file_lists'], 'refresh': refresh}
+    # Index rows by car key when the pipeline rendered them along with the scan
+    rows = None
+    # Whether the details pages were written along with the scan
+    details_written = pipeline or progressive
+    try:
+        if pipeline:
+            folder_sizes, file_lists, rows, channels = run_pipeline(
+                subfolders_dict, len(unique_folder_paths),
+                lambda on_result: calculate_folder_sizes_with_cache(unique_folder_paths, on_result=on_result, **size_options),
+                lambda ready, on_result: get_file_list_with_cache(unique_folder_paths, 'file_lists_cache.db', ready=ready, on_result=on_result, **list_options),
+                progress=progress, queue_depth=queue_depth, on_size=on_size, on_details=on_details, kept=kept)
+            for channel in channels:
+                progress.debug(f"Pipeline: {channel.count} folders passed on from {channel.name}, at most {channel.peak} of {channel.depth} queued, "
+                               f"{channel.stalls} waits for the next stage")
+        else:
+            folder_sizes = calculate_folder_sizes_with_cache(unique_folder_paths, on_result=on_size, **size_options)
+            if memprofile:
+                memprofile.checkpoint('folder_sizes', len(unique_folder_paths), folder_sizes=folder_sizes)
+
+            # A progressive build writes each details page as soon as the folder's file list is settled
+            on_file_list = None
+            if live:
+                details_stage = progress.stage('car_details', len(unique_folder_paths))
+
+                def on_file_list(folder_path, file_list):
+                    if file_list is None:
+                        details_stage.advance(skipped=1)
+                        return
+                    if keeps_details(folder_path, kept):
+                        details_stage.advance(kept=1)
+                        on_details(folder_path)
+                        return
+                    write_car_details(folder_path, file_list, progress)
+                    details_stage.detail(f'Generating partial HTML for car {details_stage.done + 1}/{len(unique_folder_paths)}')
+                    details_stage.advance(written=1)
+                    on_details(folder_path)
+
+            # After calculating folder sizes
+            file_lists = get_file_list_with_cache(unique_folder_paths, 'file_lists_cache.db', size_hints=folder_sizes, on_result=on_file_list, **list_options)
+            if live:
+                details_stage.finish()
+    except BaseException:
+        # The first index keeps what the scan got to
+        if live:
+            live.finish(complete=False)
+        raise
+    for game_name, game_total in game_totals.items():
+        progress.debug(f"Total size of {game_name}: {game_total / (1024 * 1024 * 1024):.2f} GB")
+    # The scan is complete; nothing is left to resume
+    if checkpoint:
+        checkpoint.remove()
+    if memprofile:
+        memprofile.checkpoint('file_lists', len(unique_folder_paths), file_lists=file_lists)
+
+    if manifest_file:
+        write_scan_manifest(manifest_file, unique_folder_paths, folder_sizes, file_lists, compress=compress_manifest, progress=progress)
+
+    # Initialize total size variables
+    total_size_all_cars = 0
+    total_size_unique_cars = 0
+
+    # Initialize counters
+    total_cars = 0
+    unique_cars = 0
+
+    for occurrences in subfolders_dict.values():
+        is_unique = len(occurrences) == 1  # Flag to check if the car is unique
+        total_cars += len(occurrences)
+
+        for folder_path, original_name in occurrences:
+            subfolder_full_path = os.path.join(folder_path, original_name)
+            size_mb = folder_sizes.get(subfolder_full_path, 0)  # Ensure size is in MB
+            total_size_all_cars += size_mb
+
+            if is_unique:
+                unique_cars += 1
+                total_size_unique_cars += size_mb
+
+    # Call the function to generate the HTML for game filters
+    game_filters_html = generate_game_filters_html(parent_folders, folder_to_image)
+
+    html_output = render_index_head(format_index_totals(total_cars, unique_cars, total_size_all_cars, total_size_unique_cars), game_filters_html)
+
+    # Pre-generate partial HTML files for each unique folder, unless they were written along with the scan
+    if not details_written:
+        details_stage = progress.stage('car_details', len(unique_folder_paths))
+        for i, folder_path in enumerate(unique_folder_paths, 1):
+            if folder_path in file_lists and keeps_details(folder_path, kept):
+                details_stage.advance(kept=1)
+            elif folder_path in file_lists:
+                write_car_details(folder_path, file_lists[folder_path], progress)
+
+                # Report progress for partial HTML file generation
+                details_stage.detail(f'Generating partial HTML for car {i}/{len(unique_folder_paths)}')
+                details_stage.advance(written=1)
+            else:
+                details_stage.advance(skipped=1)
+        details_stage.finish()
+        if memprofile:
+            memprofile.checkpoint('car_details', len(unique_folder_paths))
+
+    # Sort and add rows to the table, ensuring sorting by the original internal_name
+    sorted_subfolders = sorted(subfolders_dict.items(), key=lambda x: x[1].first.name.lower())  # Sort by the original_name in lowercase
+    if rows is None:
+        rows_stage = progress.stage('index_rows', len(sorted_subfolders))
+        for comparison_key, occurrences in sorted_subfolders:
+            file_list_htmls = {path: generate_file_list_html(file_lists[path], progress) for path in occurrence_paths(occurrences) if path in file_lists}
+            html_output += render_index_row(occurrences, file_list_htmls, folder_sizes)
+            rows_stage.advance()
+        rows_stage.finish()
+    else:
+        html_output += "".join(rows[comparison_key] for comparison_key, _ in sorted_subfolders)
+    if memprofile:
+        memprofile.checkpoint('index_rows', len(unique_folder_paths), html_output=html_output)
+
+    # Close the HTML tags
+    html_output += render_index_tail()
+
+    write_autocomplete_data(progress)
+
+    # Write to HTML file
+    output_file_path = 'index.html'
+    with open(output_file_path, 'w') as file:
+        file.write(html_output)
+
+    progress.info(f"The HTML file with a color-coded table of car subfolders has been written to '{output_file_path}'")
+    # The first index loads the finished one once it sees this
+    if live:
+        live.finish()
+
+    counts = {"roots": len(parent_folders), "folders": len(unique_folder_paths), "cars": len(subfolders_dict), "total_cars": total_cars, "unique_cars": unique_cars,
+              "skipped_folders": len(skipped)}
+    return finish_build(progress, cache_stats, skipped, counts, game_totals, output_file_path, throughput)
+
+# Function to build the database in bounded memory (--streaming). The game roots are scanned one game
+# at a time: the game's car folders are listed, sized and listed for files, and each details page is
+# written as soon as its file list is settled, after which the list is dropped. Every car folder then
+# leaves one record (its identity, discovery order, size and whether it has a file list) in an external
+# sort, which brings the occurrences of each car together across games; the car's index row is rendered
+# from them and goes through a second external sort into the index order (by the first occurrence's
+# name, as in build_database). The two sorts share `memory_budget` megabytes and spill to disk past it,
+# and the index is written a row at a time. The output is the same as build_database's. A scope is
+# handled as build_database handles it, one game at a time.
+def stream_database(options, cache_stats, memory_budget, memprofile=None, scope=None, catalog_file=DEFAULT_CATALOG_FILE):
+    progress, checkpoint, skipped = options.progress, options.checkpoint, options.skipped
+    game_totals = {}
+    # Roots of the same game are scanned together, so the game's size total is summed in one go
+    games = {}
+    for folder_path, game_name in parent_folders.items():
+        games.setdefault(game_name, {})[folder_path] = game_name
+    budget = memory_budget * 1024 * 1024 // 2
+    folder_count = 0
+    kept_count = 0
+    catalog = load_catalog(catalog_file) if scope else {}
+
+    with ExternalSorter(lambda record: record[:2], budget, name='cars') as cars, ExternalSorter(lambda record: record[:2], budget, name='rows') as rows, \
+            CatalogWriter(catalog_file) as catalog_writer:
+        list_stage = progress.stage('list_roots', len(parent_folders))
+        details_stage = progress.stage('car_details')
+        for roots in games.values():
+            folder_paths = []
+            parsed = []
+            kept = set()
+            for folder_path in roots:
+                try:
+                    car_folders, listed = list_root_in_scope(folder_path, scope, catalog)
+                    for original_name, subfolder_normalized in car_folders:
+                        folder_paths.append(os.path.join(folder_path, original_name))
+                        parsed.append(parse_folder_name(subfolder_normalized))
+                        if scope and not scope.includes(folder_path, original_name, parsed[-1]):
+                            kept.add(folder_paths[-1])
+                    catalog_writer.add(folder_path, [original_name for original_name, _ in car_folders])
+                    if listed:
+                        list_stage.advance()
+                    else:
+                        list_stage.advance(catalog=1)
+                except FileNotFoundError:
+                    progress.warning(f"Warning: The folder {folder_path} was not found or is not accessible.")
+                    list_stage.advance(missing=1)
+            if not folder_paths:
+                continue
+            kept_count += len(kept)
+
+            changed_folders = set()
+            game_options = options.replace(kept=kept)
+            folder_sizes = calculate_folder_sizes_with_cache(folder_paths, options=game_options, stats=cache_stats['folder_sizes'], games=roots,
+                                                             game_totals=game_totals, changed_folders=changed_folders)
+            # Folders with a file list, whose details page was written (or kept)
+            listed = set()
+
+            def write_details(folder_path, file_list):
+                if file_list is None:
+                    details_stage.advance(skipped=1)
+                    return
+                if keeps_details(folder_path, kept):
+                    listed.add(folder_path)
+                    details_stage.advance(kept=1)
+                    return
+                write_car_details(folder_path, file_list, progress)
+                listed.add(folder_path)
+                details_stage.detail(f'Generating partial HTML for car {details_stage.done + 1}')
+                details_stage.advance(written=1)
+
+            refresh = {'cached': None, 'fast': changed_folders, 'full': set(folder_paths)}[options.scan_mode]
+            get_file_list_with_cache(folder_paths, 'file_lists_cache.db', options=game_options, stats=cache_stats['file_lists'], refresh=refresh,
+                                     size_hints=folder_sizes, on_result=write_details, retain=False)
+            for folder_path, parsed_values in zip(folder_paths, parsed):
+                cars.add((identity_key(parsed_values), folder_count, os.path.dirname(folder_path), os.path.basename(folder_path), parsed_values,
+                          folder_sizes.get(folder_path), folder_path in listed))
+                folder_count += 1
+            # Parsed names are only needed again for the cars' first occurrences, which are in the records
+            get_folder_name_parser().clear()
+        list_stage.finish()
+        details_stage.finish()
+        if scope:
+            progress.info(f"Scoped build ({scope.describe()}): {folder_count - kept_count} of {folder_count} folders in scope")
+        for game_name, game_total in game_totals.items():
+            progress.debug(f"Total size of {game_name}: {game_total / (1024 * 1024 * 1024):.2f} GB")
+        # The scan is complete; nothing is left to resume
+        if checkpoint:
+            checkpoint.remove()
+        if memprofile:
+            memprofile.checkpoint('file_lists', folder_count)
+
+        # Each car's records come out together, its first occurrence first
+        total_size_all_cars = 0
+        total_size_unique_cars = 0
+        total_cars = 0
+        unique_cars = 0
+        car_count = 0
+        rows_stage = progress.stage('index_rows')
+        for _, records in groupby(cars.sorted(), key=lambda record: record[0]):
+            records = list(records)
+            _, first_index, root, original_name, parsed_values, _, _ = records[0]
+            occurrences = Vehicle(parsed_values, Occurrence(root, original_name))
+            folder_sizes = {}
+            file_list_htmls = {}
+            for _, _, folder_path, name, _, size_mb, has_file_list in records:
+                occurrences.add(Occurrence(folder_path, name))
+                subfolder_full_path = os.path.join(folder_path, name)
+                if size_mb is not None:
+                    folder_sizes[subfolder_full_path] = size_mb
+                # The details page is linked by name; the row only needs to know there is one
+                if has_file_list:
+                    file_list_htmls[subfolder_full_path] = ""
+                total_size_all_cars += size_mb or 0
+                if len(records) == 1:
+                    unique_cars += 1
+                    total_size_unique_cars += size_mb or 0
+            total_cars += len(records)
+            car_count += 1
+            rows.add((original_name.lower(), first_index, render_index_row(occurrences, file_list_htmls, folder_sizes)))
+            rows_stage.advance()
+        rows_stage.finish()
+        for sorter in (cars, rows):
+            progress.debug(f"Streaming: {sorter.count} {sorter.name} records sorted, {sorter.spilled} spilled to disk in {sorter.runs} runs, "
+                           f"at most {sorter.peak_buffered / (1024 * 1024):.1f} of {budget / (1024 * 1024):.1f} MB buffered")
+        if memprofile:
+            memprofile.checkpoint('index_rows', folder_count)
+
+        # Call the function to generate the HTML for game filters
+        game_filters_html = generate_game_filters_html(parent_folders, folder_to_image)
+
+        # The finished table goes straight from the row sort to the file
+        output_file_path = 'index.html'
+        with open(output_file_path, 'w') as file:
+            file.write(render_index_head(format_index_totals(total_cars, unique_cars, total_size_all_cars, total_size_unique_cars), game_filters_html))
+            for _, _, row_html in rows.sorted():
+                file.write(row_html)
+            file.write(render_index_tail())
+
+    write_autocomplete_data(progress)
+    progress.info(f"The HTML file with a color-coded table of car subfolders has been written to '{output_file_path}'")
+
+    counts = {"roots": len(parent_folders), "folders": folder_count, "cars": car_count, "total_cars": total_cars, "unique_cars": unique_cars,
+              "skipped_folders": len(skipped)}
+    return finish_build(progress, cache_stats, skipped, counts, game_totals, output_file_path, options.throughput)
+
+# Function to write the manufacturer names the index search autocompletes
+def write_autocomplete_data(progress):
+    # Extract the friendly names from the manufacturer_codes dictionary
+    autocomplete_data = {
+        "manufacturers": list(mappings.manufacturer_codes.values())
+    }
+
+    # Writing JSON data to the car_details folder
+    json_filename = 'car_details/autocomplete_data.json'
+    with open(json_filename, 'w') as json_file:
+        json.dump(autocomplete_data, json_file)
+
+    progress.info(f"Autocomplete JSON data saved to '{json_filename}'")
+
+# Function to report the cache statistics and the folders that could not be walked; returns the build summary
+def finish_build(progress, cache_stats, skipped, counts, game_totals, output_file_path, throughput=None):
+    progress.info("Cache statistics:")
+    for stats in cache_stats.values():
+        progress.info(f"  {stats.format()}")
+
+    if skipped:
+        progress.warning(f"{len(skipped)} folders could not be walked; they show their last cached size and files, if any, and are rescanned next run:")
+        for folder_path, reason in skipped.items():
+            progress.warning(f"  {folder_path}: {reason}")
+
+    return {
+        "counts": counts,
+        "outputs": [output_file_path, 'car_details'],
+        "cache": {name: stats.as_dict() for name, stats in cache_stats.items()},
+        "games": game_totals,
+        "skipped": skipped,
+        "roots": throughput.as_dict() if throughput else {},
+    }
+
+# Function to plan a scan without walking any car folder (the plan command). The game roots are listed
+# as a build would list them, each car folder in scope is checked against the caches, and the walk
+# time is estimated from the rates recorded in the run history.
+def show_scan_plan(progress, scan_mode, scope=None, history_file=DEFAULT_HISTORY_FILE, catalog_file=DEFAULT_CATALOG_FILE):
+    catalog = load_catalog(catalog_file) if scope else {}
+    stats = CacheStats('plan')
+    roots = []
+    kept = 0
+    # A dry run: the caches are only read, and one that does not exist yet is not created
+    size_cache, file_cache = (InstrumentedCache(cache_file, stats, flag='r') if dbm.whichdb(cache_file) else None
+                              for cache_file in ('folder_sizes_cache.db', 'file_lists_cache.db'))
+    try:
+        file_store = FileListStore(file_cache) if file_cache else None
+        for folder_path in parent_folders:
+            try:
+                car_folders, _ = list_root_in_scope(folder_path, scope, catalog)
+            except FileNotFoundError:
+                progress.warning(f"Warning: The folder {folder_path} was not found or is not accessible.")
+                continue
+            folder_paths = []
+            for original_name, subfolder_normalized in car_folders:
+                if scope and not scope.includes(folder_path, original_name, parse_folder_name(subfolder_normalized)):
+                    kept += 1
+                    continue
+                folder_paths.append(os.path.join(folder_path, original_name))
+            if folder_paths or not scope:
+                roots.append((folder_path, *inspect_root(folder_paths, size_cache, file_store)))
+    finally:
+        for cache in (size_cache, file_cache):
+            if cache:
+                cache.close()
+    rates = walk_rates(load_runs(history_file))
+    plans, totals = plan_scan(roots, scan_mode, rates)
+    names = {folder_path: f"{game_name} ({game_folder_codes.get(folder_path, 'unknown')})" for folder_path, game_name in parent_folders.items()}
+    print(format_plan(plans, totals, scan_mode, rates, names))
+    if scope:
+        print(f"{kept} folders outside the scope ({scope.describe()}) would be kept as they are")
+    return 0
+
+# Function to print a scan manifest summary, or the files of the given folders
+def show_manifest(manifest_file, folder_paths=()):
+    with ScanManifest(manifest_file) as manifest:
+        if not folder_paths:
+            print(f"{manifest_file}: {manifest.folder_count} folders, {manifest.file_count} files, {manifest.string_count} strings, "
+                  f"{manifest.block_count} {'compressed ' if manifest.compressed else ''}blocks")
+            return 0
+        status = 0
+        for folder_path in folder_paths:
+            entry = manifest.get(folder_path)
+            if entry is None:
+                print(f"{folder_path}: not in manifest")
+                status = 1
+                continue
+            size, _, files = entry
+            print(f"{folder_path}: {len(files)} files, {size / (1024 * 1024):.2f} MB")
+            for file_name, file_size in files:
+                print(f"  {file_name}  {file_size / (1024 * 1024):.2f} MB")
+        return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the Forza vehicle database HTML.")
+    parser.add_argument('--trace', metavar='FILE', help="Write a Chrome trace-event JSON of the thread-pool scan tasks to FILE (open in about://tracing or Perfetto)")
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='info', help="'quiet' only reports warnings, 'debug' adds a line per folder and car (default: info)")
+    parser.add_argument('--progress-format', choices=OUTPUT_FORMATS, default='text', help="'json' emits progress and messages as JSON lines for automation (default: text)")
+    parser.add_argument('--memprofile', nargs='?', const='', metavar='FILE', help="Profile memory with tracemalloc at each stage boundary and print a report; also write it as JSON to FILE if given")
+    parser.add_argument('--scan-mode', choices=SCAN_MODES, default='cached', help="'fast' skips car folders whose directory mtimes are unchanged and relists the rest, logging each decision at debug level; 'full' rescans everything (default: cached)")
+    parser.add_argument('--min-workers', type=int, default=DEFAULT_MIN_WORKERS, help=f"Lowest number of concurrent folder walks per game root (default: {DEFAULT_MIN_WORKERS})")
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, help=f"Highest number of concurrent folder walks per game root; the scan adapts between the two (default: {DEFAULT_MAX_WORKERS})")
+    parser.add_argument('--folder-timeout', type=float, default=DEFAULT_FOLDER_TIMEOUT, metavar='SECONDS', help=f"Abandon a folder walk that takes longer than this, e.g. on a hung network share; 0 disables (default: {DEFAULT_FOLDER_TIMEOUT:g})")
+    parser.add_argument('--stage-timeout', type=float, default=DEFAULT_STAGE_TIMEOUT, metavar='SECONDS', help="Give up on the folders a scan stage has not walked after this long (default: no limit)")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help=f"Walk a folder again this many times after a timeout or I/O error (default: {DEFAULT_RETRIES})")
+    parser.add_argument('--scan-backend', choices=SCAN_BACKENDS, default=DEFAULT_SCAN_BACKEND, help="'asyncio' walks folders as coroutines on an event loop, listing their subdirectories concurrently over a small thread pool; 'processes' walks chunks of folders in one worker process per core, for fast local disks (default: threads)")
+    parser.add_argument('--pipeline', action='store_true', help="Overlap the scan stages and the rendering: list each folder's files as soon as its size is known and write its details page as soon as its file list is")
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH, metavar='N', help=f"With --pipeline, folders queued between two stages before the earlier one waits (default: {DEFAULT_QUEUE_DEPTH})")
+    parser.add_argument('--progressive', action='store_true', help=f"Write index.html from the folder names as soon as the game roots are listed, with sizes pending; it fills in sizes and file details from '{DEFAULT_LIVE_DATA_FILE}' as the scan gets to them")
+    parser.add_argument('--streaming', action='store_true', help="Build in bounded memory for very large trees: scan one game at a time and sort the cars and index rows on disk past --memory-budget (no --manifest, --pipeline or --progressive)")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET, metavar='MB', help=f"With --streaming, megabytes of car records and index rows held in memory before they are spilled to disk (default: {DEFAULT_MEMORY_BUDGET})")
+    parser.add_argument('--games', action='append', metavar='CODES', help=f"Scan only the car folders of these games, by game code (comma-separated, e.g. fh5,fm7); the rest of the index is kept from the last build, with the game roots outside the scope taken from '{DEFAULT_CATALOG_FILE}'")
+    parser.add_argument('--manufacturer', action='append', metavar='NAMES', help="Scan only the car folders of these manufacturers, by folder name prefix or name (comma-separated, e.g. POR,Ferrari); the rest of the index is kept from the last build")
+    parser.add_argument('--match', action='append', metavar='PATTERN', help="Scan only the car folders whose names match this shell-style pattern (e.g. 'POR_*'; case-insensitive, repeatable); the rest of the index is kept from the last build")
+    parser.add_argument('--resume', action='store_true', help=f"Continue an interrupted scan from its checkpoint in '{DEFAULT_CHECKPOINT_FILE}', without walking the folders it finished again")
+    parser.add_argument('--checkpoint', action='store_true', help=f"Make the scan resumable: journal finished folders to '{DEFAULT_CHECKPOINT_FILE}', syncing the caches before each batch (on with --resume)")
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_BATCH_SIZE, metavar='N', help=f"With --checkpoint or --resume, folders per checkpoint batch; a batch is also written every 30s (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--manifest', metavar='FILE', help="Also export the scan (folder sizes, mtimes and file lists) to a binary scan manifest FILE, for the manifest command and other tools")
+    parser.add_argument('--compress-manifest', action='store_true', help="zlib-compress the file records in the scan manifest")
+    parser.add_argument('--history', metavar='FILE', default=DEFAULT_HISTORY_FILE, help=f"Append stage timings, counts, cache hit rates and output sizes of each run to FILE (default: {DEFAULT_HISTORY_FILE})")
+    parser.add_argument('--no-history', action='store_true', help="Do not record this run in the history store")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    # bench is only imported when it is the command; until then its parser is an empty stub
+    subparsers.add_parser('bench', help="Benchmark the scan stages and compare recorded runs", add_help=False)
+    subparsers.add_parser('compile-mappings', help="Compile mappings.py into the fast-loading lookup artifact")
+    manifest_parser = subparsers.add_parser('manifest', help="Summarize a scan manifest, or list the files of some of its folders")
+    manifest_parser.add_argument('manifest_file', metavar='FILE', help="Scan manifest written with --manifest")
+    manifest_parser.add_argument('folders', nargs='*', metavar='FOLDER', help="Car folder paths to list")
+    plan_parser = subparsers.add_parser('plan', help="Estimate what a build would walk and how long it would take, from the caches and the run history, without walking any car folder")
+    plan_parser.add_argument('--scan-mode', dest='plan_scan_mode', choices=SCAN_MODES, help="Scan mode to plan for (default: the --scan-mode given before the command)")
+    if parser.parse_known_args(argv)[0].command == 'bench':
+        from bench import add_bench_parser, run_bench_command
+        subparsers.choices['bench'] = add_bench_parser(argparse.ArgumentParser(prog=parser.prog).add_subparsers())
+        return run_bench_command(parser.parse_args(argv))
+    args = parser.parse_args(argv)
+
+    if args.command == 'compile-mappings':
+        compiled = compile_mappings()
+        print(f"Compiled {len(compiled.section_names)} mapping tables ({compiled.fingerprint[:12]}): {', '.join(compiled.section_names)}")
+        return 0
+    if args.command == 'manifest':
+        return show_manifest(args.manifest_file, args.folders)
 
-print(f"The HTML file with a color-coded table of car subfolders has been written to '{output_file_path}'")
\ No newline at end of file
+    try:
+        scope = ScanScope.from_selectors(split_values(args.games), split_values(args.manufacturer), args.match or (), game_folder_codes)
+    except ValueError as e:
+        parser.error(str(e))
+
+    progress = ProgressReporter(level=args.log_level, output_format=args.progress_format)
+    if args.command == 'plan':
+        return show_scan_plan(progress, args.plan_scan_mode or args.scan_mode, scope, args.history)
+
+    tracer = TaskTracer() if args.trace else None
+    memprofile = MemoryProfiler() if args.memprofile is not None else None
+    if memprofile:
+        memprofile.start()
+    try:
+        summary = build_database(tracer=tracer, progress=progress, memprofile=memprofile, manifest_file=args.manifest, compress_manifest=args.compress_manifest,
+                                 scan_mode=args.scan_mode, min_workers=args.min_workers, max_workers=args.max_workers, folder_timeout=args.folder_timeout or None,
+                                 stage_timeout=args.stage_timeout, retries=args.retries, resume=args.resume,
+                                 checkpoint_every=max(1, args.checkpoint_every) if args.checkpoint or args.resume else 0,
+                                 scan_backend=args.scan_backend, pipeline=args.pipeline, queue_depth=max(1, args.queue_depth),
+                                 progressive=args.progressive, memory_budget=max(1, args.memory_budget) if args.streaming else None, scope=scope)
+        if not args.no_history:
+            record = make_run_record('build', stage_metrics(progress.stages), counts=summary["counts"], outputs=get_output_sizes(summary["outputs"]), cache=summary["cache"],
+                                     extra={"roots": summary["roots"]} if summary["roots"] else None)
+            append_run(record, args.history)
+            progress.debug(f"Recorded run {record['id']} in '{args.history}'")
+    finally:
+        if tracer:
+            progress.info(f"Scan trace written to '{tracer.write(args.trace)}'")
+        if memprofile:
+            memprofile.stop()
+            progress.info(memprofile.format_report())
+            if args.memprofile:
+                progress.info(f"Memory profile written to '{memprofile.write(args.memprofile)}'")
+
+if __name__ == "__main__":
+    sys.exit(main())
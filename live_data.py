@@ -0,0 +1,64 @@
+# live_data.py
+
+import json
+import os
+import threading
+import time
+
+DEFAULT_LIVE_DATA_FILE = 'car_details/live_data.jsonl'
+# Seconds records are held before they are appended to the file
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+# Data file of a progressive build (--progressive), which the index written from the folder names
+# polls to fill in folder sizes and enable File Details buttons as the scan gets to them. One JSON
+# record per line, appended as the scan goes:
+#
+#   {"started": "2024-05-01T12:00:00", "folders": 1234}
+#   {"page": "ALF_8C_08_fh5.html", "size": 512.25}
+#   {"page": "ALF_8C_08_fh5.html", "details": 1}
+#   {"complete": 1}
+#
+# Records are buffered and appended as whole lines every `interval` seconds, so the page only has to
+# drop a last line that has no newline yet. The file is started afresh by every build; the last
+# record is "complete" once the finished index is written, or "stopped" when the build failed or was
+# interrupted. add() may be called from any stage thread.
+class LiveDataFile:
+    def __init__(self, path=DEFAULT_LIVE_DATA_FILE, interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.records = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Start a new data file for a build of `folder_count` folders, replacing any previous one
+    def start(self, folder_count):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as data_file:
+            data_file.write(json.dumps({"started": time.strftime('%Y-%m-%dT%H:%M:%S'), "folders": folder_count}) + "\n")
+        self._last_flush = time.monotonic()
+        return self
+
+    def add(self, **record):
+        with self._lock:
+            self._buffer.append(json.dumps(record, separators=(',', ':')))
+            self.records += 1
+            if time.monotonic() - self._last_flush >= self.interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    # Called with the lock held
+    def _flush(self):
+        if self._buffer:
+            with open(self.path, 'a', encoding='utf-8') as data_file:
+                data_file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    # Append the last record: complete, or stopped part way
+    def finish(self, complete=True):
+        self.add(**({"complete": 1} if complete else {"stopped": 1}))
+        self.flush()
@@ -0,0 +1,120 @@
+# mappings_cache.py
+
+import ast
+import hashlib
+import json
+import marshal
+import os
+import runpy
+import struct
+import sys
+
+# Bump when the artifact layout or the derived indexes change
+ARTIFACT_VERSION = 1
+MAPPINGS_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mappings.py')
+DEFAULT_ARTIFACT = os.path.join(os.path.dirname(MAPPINGS_SOURCE), '__pycache__', 'mappings.compiled')
+_MAGIC = b'FZMAP\x00'
+_HEADER_LENGTH = struct.Struct('<I')
+
+# Function to fingerprint the mappings source together with everything the artifact depends on
+# (layout version, marshal format and Python version)
+def source_fingerprint(source_bytes):
+    digest = hashlib.sha256(source_bytes)
+    digest.update(f"{ARTIFACT_VERSION}:{marshal.version}:{sys.version_info[0]}.{sys.version_info[1]}".encode())
+    return digest.hexdigest()
+
+# Function to read the mapping tables from mappings.py. The file is plain literals, so it is
+# evaluated with ast.literal_eval; if it ever contains code, it is executed as a module instead.
+def read_mapping_tables(source_path=MAPPINGS_SOURCE):
+    with open(source_path, 'rb') as source_file:
+        source = source_file.read()
+    tables = {}
+    try:
+        for node in ast.parse(source, filename=source_path).body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                tables[node.targets[0].id] = ast.literal_eval(node.value)
+            elif not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant)):
+                raise ValueError(f"unsupported statement on line {node.lineno}")
+    except ValueError:
+        namespace = runpy.run_path(source_path)
+        tables = {name: value for name, value in namespace.items() if not name.startswith('_') and isinstance(value, (dict, list, tuple, str))}
+    return source, tables
+
+# Function to compute the lookup indexes the build derives from the mapping tables
+def derive_indexes(tables):
+    from folder_parser import build_override_index
+
+    return {
+        'override_index': build_override_index(tables.get('car_overrides', {})),
+        'name_to_code_mapping': {name.lower(): code for code, name in tables.get('manufacturer_codes', {}).items()},
+    }
+
+# The loaded artifact. Each table is marshalled separately and only unpacked on first attribute
+# access, so e.g. car_overrides costs nothing until the folder name parser needs it.
+class CompiledMappings:
+    def __init__(self, data):
+        data = memoryview(data)
+        if bytes(data[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError("not a compiled mappings artifact")
+        header_start = len(_MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(data, len(_MAGIC))
+        self._header = json.loads(bytes(data[header_start:header_start + header_length]))
+        self._body = data[header_start + header_length:]
+
+    @property
+    def fingerprint(self):
+        return self._header["fingerprint"]
+
+    @property
+    def section_names(self):
+        return list(self._header["sections"])
+
+    def __getattr__(self, name):
+        sections = self.__dict__.get('_header', {}).get("sections", {})
+        if name not in sections:
+            raise AttributeError(f"compiled mappings have no table '{name}'")
+        offset, length = sections[name]
+        value = marshal.loads(self._body[offset:offset + length])
+        setattr(self, name, value)
+        return value
+
+# Function to serialize the mapping tables and derived indexes into the artifact format
+def build_artifact(source, tables):
+    sections = dict(tables)
+    sections.update(derive_indexes(tables))
+    blobs, offsets, position = [], {}, 0
+    for name, value in sections.items():
+        blob = marshal.dumps(value)
+        offsets[name] = [position, len(blob)]
+        blobs.append(blob)
+        position += len(blob)
+    header = json.dumps({"version": ARTIFACT_VERSION, "fingerprint": source_fingerprint(source), "sections": offsets}).encode()
+    return _MAGIC + _HEADER_LENGTH.pack(len(header)) + header + b"".join(blobs)
+
+# Function to compile mappings.py into the artifact. The file is replaced atomically; if it cannot be
+# written (read-only checkout) the compiled tables are still returned from memory.
+def compile_mappings(source_path=MAPPINGS_SOURCE, artifact_path=DEFAULT_ARTIFACT):
+    source, tables = read_mapping_tables(source_path)
+    data = build_artifact(source, tables)
+    try:
+        os.makedirs(os.path.dirname(artifact_path) or '.', exist_ok=True)
+        temp_path = f"{artifact_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as artifact_file:
+            artifact_file.write(data)
+        os.replace(temp_path, artifact_path)
+    except OSError:
+        pass
+    return CompiledMappings(data)
+
+# Function to load the compiled mappings, recompiling whenever mappings.py (or the format) changed
+def load_mappings(source_path=MAPPINGS_SOURCE, artifact_path=DEFAULT_ARTIFACT):
+    with open(source_path, 'rb') as source_file:
+        fingerprint = source_fingerprint(source_file.read())
+    try:
+        with open(artifact_path, 'rb') as artifact_file:
+            compiled = CompiledMappings(artifact_file.read())
+        if compiled._header.get("version") == ARTIFACT_VERSION and compiled.fingerprint == fingerprint:
+            return compiled
+    except (OSError, ValueError, KeyError, struct.error):
+        pass
+    return compile_mappings(source_path, artifact_path)
@@ -0,0 +1,158 @@
+# memprofile.py
+
+import json
+import os
+import sys
+import tracemalloc
+
+# Frames from these modules are bookkeeping, not allocations made by the build
+_IGNORED_FILES = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+# Function to read the process peak resident set size in bytes (None if the platform gives no way to read it)
+def peak_rss_bytes():
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Function to measure the total size of a container and everything it references (shared objects counted once)
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, '__slots__'):
+            stack.extend(getattr(current, slot) for slot in current.__slots__ if hasattr(current, slot))
+        elif hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+    return total
+
+def _format_bytes(size):
+    if size is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+# Takes a tracemalloc snapshot at each stage boundary and records the traced peak, the
+# allocation sites that grew the most during the stage, and the deep size of the structures
+# handed in (e.g. file_lists, html_output) per car folder
+class MemoryProfiler:
+    def __init__(self, top_sites=10, frames=1):
+        self.top_sites = top_sites
+        self.frames = frames
+        self.checkpoints = []
+        self._previous = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self._previous = self._snapshot()
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, name) for name in _IGNORED_FILES])
+
+    # Record a stage boundary; keyword arguments are the structures to size, car_count is used for bytes per car
+    def checkpoint(self, stage, car_count=0, **structures):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._snapshot()
+        growth = snapshot.compare_to(self._previous, 'lineno') if self._previous else snapshot.statistics('lineno')
+
+        sites = []
+        for stat in growth[:self.top_sites]:
+            frame = stat.traceback[0]
+            sites.append({
+                "site": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                "size_diff": getattr(stat, 'size_diff', stat.size),
+                "count_diff": getattr(stat, 'count_diff', stat.count),
+                "size": stat.size,
+            })
+
+        sizes = {}
+        for name, structure in structures.items():
+            size = deep_sizeof(structure)
+            sizes[name] = {
+                "bytes": size,
+                "bytes_per_car": round(size / car_count, 1) if car_count else None,
+            }
+
+        self.checkpoints.append({
+            "stage": stage,
+            "traced_current": current,
+            "traced_peak": peak,
+            "peak_rss": peak_rss_bytes(),
+            "car_count": car_count,
+            "structures": sizes,
+            "top_sites": sites,
+        })
+        self._previous = snapshot
+        tracemalloc.reset_peak()
+
+    def report(self):
+        return {"checkpoints": self.checkpoints, "peak_rss": peak_rss_bytes()}
+
+    def format_report(self):
+        lines = ["Memory profile (tracemalloc, per stage):"]
+        for checkpoint in self.checkpoints:
+            lines.append(
+                f"  [{checkpoint['stage']}] traced now {_format_bytes(checkpoint['traced_current'])}, "
+                f"stage peak {_format_bytes(checkpoint['traced_peak'])}, peak RSS {_format_bytes(checkpoint['peak_rss'])}"
+            )
+            for name, size in checkpoint["structures"].items():
+                per_car = f", {_format_bytes(size['bytes_per_car'])} per car" if size["bytes_per_car"] is not None else ""
+                lines.append(f"      {name}: {_format_bytes(size['bytes'])}{per_car}")
+            for site in checkpoint["top_sites"][:5]:
+                lines.append(f"      {site['site']}: {_format_bytes(site['size_diff'])} ({site['count_diff']:+d} blocks)")
+        lines.append(f"  Process peak RSS: {_format_bytes(peak_rss_bytes())}")
+        return "\n".join(lines)
+
+    def write(self, output_path):
+        with open(output_path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+        return output_path
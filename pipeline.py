@@ -0,0 +1,112 @@
+# pipeline.py
+
+import threading
+from collections import deque
+
+# Items a channel holds before its producer has to wait for the consumer
+DEFAULT_QUEUE_DEPTH = 64
+# Seconds a consumer waits for an item before it gets an idle tick
+POLL_INTERVAL = 0.05
+
+# Raised in a pipeline stage when a stage on the other side of one of its channels failed or was
+# interrupted, so it stops like on a Ctrl-C
+class PipelineClosed(Exception):
+    pass
+
+# Bounded queue between two pipeline stages. put() blocks while `depth` items wait, so a producer is
+# held to the pace of its consumer; close() ends the consumer's iteration once it has taken
+# everything, abort() makes both ends raise PipelineClosed. The consumer takes all the items waiting at
+# once and a producer only wakes it when the queue was empty, so a busy channel costs a thread switch
+# per batch rather than per item; at most twice `depth` items are in flight.
+class Channel:
+    def __init__(self, depth=DEFAULT_QUEUE_DEPTH, name='channel'):
+        self.name = name
+        self.depth = max(1, depth)
+        self.count = 0
+        self.peak = 0
+        # Puts that found the channel full and had to wait for the consumer
+        self.stalls = 0
+        self._items = deque()
+        self._closed = False
+        self._aborted = False
+        self._changed = threading.Condition()
+
+    def put(self, item):
+        with self._changed:
+            if len(self._items) >= self.depth:
+                self.stalls += 1
+            while len(self._items) >= self.depth and not self._aborted:
+                self._changed.wait()
+            if self._aborted:
+                raise PipelineClosed(f"{self.name} channel closed")
+            self._items.append(item)
+            self.count += 1
+            self.peak = max(self.peak, len(self._items))
+            if len(self._items) == 1:
+                self._changed.notify_all()
+
+    # End of the items; nothing is put after this
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def abort(self):
+        with self._changed:
+            self._aborted = True
+            self._changed.notify_all()
+
+    # Iterate over the items until the channel is closed. With `idle`, None is yielded whenever no item
+    # came for that many seconds, so the consumer can get on with other work meanwhile.
+    def items(self, idle=None):
+        while True:
+            with self._changed:
+                if not self._items and not self._closed and not self._aborted:
+                    self._changed.wait(idle)
+                if self._aborted:
+                    raise PipelineClosed(f"{self.name} channel closed")
+                batch, self._items = self._items, deque()
+                if len(batch) >= self.depth:
+                    self._changed.notify_all()
+                done = self._closed and not batch
+            if done:
+                return
+            if not batch and idle is not None:
+                yield None
+            yield from batch
+
+    def __iter__(self):
+        return self.items()
+
+# Runs one pipeline stage, fn(*args), in a thread of its own. On success the `outputs` channels are
+# closed; when fn raises, every channel in `inputs` and `outputs` is aborted, so the stages on either
+# side stop instead of waiting forever. Once wait() returns, `value` holds what fn returned, or
+# `error` what it raised.
+class StageThread(threading.Thread):
+    def __init__(self, name, fn, *args, inputs=(), outputs=()):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.value = None
+        self.error = None
+        self._finished = threading.Event()
+
+    def run(self):
+        try:
+            self.value = self.fn(*self.args)
+        except BaseException as e:
+            self.error = e
+            for channel in self.inputs + self.outputs:
+                channel.abort()
+        else:
+            for channel in self.outputs:
+                channel.close()
+        finally:
+            self._finished.set()
+
+    # Unlike join(), safe to call again after a Ctrl-C interrupted it: before Python 3.13 an interrupted
+    # join() can leave the thread looking finished while it still runs
+    def wait(self):
+        self._finished.wait()
@@ -0,0 +1,269 @@
+# process_scan.py
+
+import inspect
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from file_list_store import CompactFileList, StringTable
+from scan_scheduler import DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS, DEFAULT_RETRY_DELAY, PERMANENT_ERRORS, StageTimeout, WalkTimeout
+
+# Folders sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 8
+# Seconds the dispatcher waits for more submissions before sending a chunk that is not full
+_FLUSH_DELAY = 0.01
+# Longest the dispatcher sleeps between timeout checks
+_MONITOR_INTERVAL = 0.5
+
+# Worker processes leave Ctrl-C to the parent, which lets the chunks they are on finish
+def _ignore_interrupt():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Function to walk a chunk of folders in a worker process. File lists (lists of (path, size)) come back
+# as compact file list records over one string table for the whole chunk, so the parent unpickles a
+# few strings and byte blobs rather than a tuple per file; other results come back as they are.
+# Returns (table stamp, strings, [(kind, result or exception, seconds)]), kind being 'files',
+# 'value' or 'error'.
+def walk_chunk(fn, items):
+    table = StringTable()
+    results = []
+    for folder_path, args in items:
+        start = time.perf_counter()
+        try:
+            result = fn(folder_path, *args)
+            if isinstance(result, list):
+                results.append(('files', CompactFileList.from_list(result, table).to_record(), time.perf_counter() - start))
+            else:
+                results.append(('value', result, time.perf_counter() - start))
+        except Exception as e:
+            results.append(('error', e, time.perf_counter() - start))
+    return table.stamp, table.strings, results
+
+# One submitted folder and its attempts
+class _Item:
+    __slots__ = ('future', 'fn', 'folder_path', 'args', 'attempts', 'not_before', 'alone')
+
+    def __init__(self, future, fn, folder_path, args):
+        self.future = future
+        self.fn = fn
+        self.folder_path = folder_path
+        self.args = args
+        self.attempts = 0
+        self.not_before = None
+        # Retried after its chunk timed out: sent on its own, so a hung folder only holds up itself
+        self.alone = False
+
+# Folders sent to one worker process together
+class _Chunk:
+    __slots__ = ('items', 'started')
+
+    def __init__(self, items, started):
+        self.items = items
+        self.started = started
+
+# Runs per-folder tasks in a pool of worker processes, for local trees where the walk is CPU-bound
+# (path joins, relpath, tuples) and the GIL caps the thread backends. Consecutive submissions are
+# partitioned into chunks of `chunk_size` folders; at most one chunk per process is out at a time, so
+# the largest-first order holds and the last chunks spread over the free processes. Walk functions
+# are sent by reference, unwrapped from time_fs and tracer wrappers, which cannot run in a worker: the
+# walk time measured in the workers is kept in `worker_seconds` instead, and in `folder_seconds` by
+# folder. Processes are started with 'spawn' on every platform, only once there is something to walk.
+#
+# A chunk running past `timeout` is abandoned and the pool restarted, which ends the stuck process; a
+# single folder that times out is retried or fails with WalkTimeout. Retries and the `stage_timeout`
+# behave as in AdaptiveScheduler. Per-root limits do not apply.
+class ProcessScheduler:
+    def __init__(self, name='scan', min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS, root_of=os.path.dirname, log=None,
+                 timeout=None, stage_timeout=None, retries=0, retry_delay=DEFAULT_RETRY_DELAY, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.name = name
+        self.log = log
+        self.timeout = timeout
+        self.stage_timeout = stage_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.deadline = time.monotonic() + stage_timeout if stage_timeout else None
+        self.chunks = 0
+        self.walked = 0
+        self.worker_seconds = 0.0
+        self.folder_seconds = {}
+        self.timed_out = 0
+        self.retried = 0
+        self._queue = deque()
+        self._delayed = []
+        self._running = set()
+        # A pool with a stuck process, for the dispatcher to terminate
+        self._stuck = None
+        self._last_submit = 0.0
+        self._closed = False
+        self._pool = None
+        self._lock = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch, name=f"{name}-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, fn, folder_path, *args):
+        item = _Item(Future(), inspect.unwrap(fn), folder_path, args)
+        with self._lock:
+            self._queue.append(item)
+            self._last_submit = time.monotonic()
+            self._lock.notify_all()
+        return item.future
+
+    # Take the next chunk off the queue when a process is free and the chunk is full, or submissions
+    # have paused; called with the lock held
+    def _next_chunk(self, now):
+        if not self._queue or len(self._running) >= self.processes:
+            return None
+        if len(self._queue) < self.chunk_size and now - self._last_submit < _FLUSH_DELAY and not self._closed:
+            return None
+        items = [self._queue.popleft()]
+        while self._queue and len(items) < self.chunk_size and not items[0].alone and not self._queue[0].alone and self._queue[0].fn is items[0].fn:
+            items.append(self._queue.popleft())
+        for item in items:
+            item.attempts += 1
+        chunk = _Chunk(items, now)
+        self._running.add(chunk)
+        self.chunks += 1
+        return chunk
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._check(now)
+                stuck, self._stuck = self._stuck, None
+                chunk = None if stuck else self._next_chunk(now)
+                if chunk is None and stuck is None:
+                    if self._closed and not self._queue and not self._delayed and not self._running:
+                        return
+                    self._lock.wait(_FLUSH_DELAY if self._queue else _MONITOR_INTERVAL)
+                    continue
+            if stuck is not None:
+                stuck.terminate()
+                continue
+            if self._pool is None:
+                self._pool = multiprocessing.get_context('spawn').Pool(self.processes, initializer=_ignore_interrupt)
+            self._pool.apply_async(walk_chunk, (chunk.items[0].fn, [(item.folder_path, item.args) for item in chunk.items]),
+                                   callback=lambda result, chunk=chunk: self._finished(chunk, result),
+                                   error_callback=lambda error, chunk=chunk: self._failed(chunk, error))
+
+    # Results of a chunk, in the pool's result thread
+    def _finished(self, chunk, result):
+        stamp, strings, results = result
+        table = StringTable(strings, stamp=stamp)
+        with self._lock:
+            if chunk not in self._running:
+                return
+            self._running.discard(chunk)
+            for item, (kind, value, seconds) in zip(chunk.items, results):
+                self.worker_seconds += seconds
+                self.folder_seconds[item.folder_path] = seconds
+                if kind == 'error':
+                    self._fail(item, value)
+                    continue
+                self.walked += 1
+                item.future.set_result(CompactFileList.from_record(value, table) if kind == 'files' else value)
+            self._lock.notify_all()
+
+    # A chunk whose results could not be sent back (an unpicklable result, a worker that died)
+    def _failed(self, chunk, error):
+        with self._lock:
+            if chunk not in self._running:
+                return
+            self._running.discard(chunk)
+            for item in chunk.items:
+                self._fail(item, error)
+            self._lock.notify_all()
+
+    # Retry a folder or fail its Future; called with the lock held
+    def _fail(self, item, error):
+        retry = (isinstance(error, OSError) and not isinstance(error, (StageTimeout,) + PERMANENT_ERRORS)
+                 and item.attempts <= self.retries and not self._closed)
+        if not retry:
+            if isinstance(error, WalkTimeout) and self.log:
+                self.log(f"{self.name}: giving up on '{item.folder_path}': {error}")
+            item.future.set_exception(error)
+            return
+        delay = self.retry_delay * 2 ** (item.attempts - 1)
+        self.retried += 1
+        if self.log:
+            self.log(f"{self.name}: retrying '{item.folder_path}' in {delay:g}s (attempt {item.attempts + 1} of {self.retries + 1}) after: {error}")
+        item.not_before = time.monotonic() + delay
+        self._delayed.append(item)
+
+    # Abandon chunks past the timeout, expire everything past the stage deadline and requeue due
+    # retries; called with the lock held
+    def _check(self, now):
+        if self.deadline is not None and now >= self.deadline:
+            if self._running:
+                self._stuck, self._pool = self._pool, None
+            for item in list(self._queue) + self._delayed + [item for chunk in self._running for item in chunk.items]:
+                item.future.set_exception(StageTimeout(item.folder_path, self.stage_timeout))
+            self._queue.clear()
+            self._delayed = []
+            self._running = set()
+            return
+        expired = [chunk for chunk in self._running if self.timeout is not None and now - chunk.started >= self.timeout]
+        if expired:
+            # A pool cannot replace a stuck process, so the whole pool is restarted. The chunks of the
+            # other processes, and the folders of a timed-out chunk of several (which one hung is not
+            # known), are sent again without counting an attempt, the latter each on its own.
+            self._stuck, self._pool = self._pool, None
+            again = []
+            for chunk in self._running:
+                if chunk in expired and len(chunk.items) == 1:
+                    item = chunk.items[0]
+                    self.timed_out += 1
+                    self._fail(item, WalkTimeout(item.folder_path, self.timeout, item.attempts))
+                    continue
+                for item in chunk.items:
+                    item.attempts -= 1
+                    item.alone = item.alone or chunk in expired
+                    again.append(item)
+            self._running = set()
+            self._queue.extendleft(reversed(again))
+        due = [item for item in self._delayed if item.not_before <= now]
+        if due:
+            self._delayed = [item for item in self._delayed if item.not_before > now]
+            self._queue.extendleft(reversed(due))
+
+    def snapshot(self):
+        return {"processes": self.processes, "chunks": self.chunks, "walked": self.walked, "worker_seconds": round(self.worker_seconds, 4)}
+
+    def summary_lines(self):
+        lines = [f"{self.name}: {self.walked} folders walked in {self.chunks} chunks over {self.processes} processes ({self.worker_seconds:.2f}s of walks)"]
+        if self.timed_out or self.retried:
+            lines.append(f"{self.name}: {self.timed_out} walks timed out, {self.retried} retries")
+        return lines
+
+    # Queued folders are cancelled with `cancel_futures`; chunks already out are let finish
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._closed = True
+            if cancel_futures:
+                for item in list(self._queue) + self._delayed:
+                    item.future.cancel()
+                self._queue.clear()
+                self._delayed = []
+            self._lock.notify_all()
+        if wait:
+            self._dispatcher.join()
+        if self._pool is not None:
+            if not wait:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
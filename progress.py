@@ -0,0 +1,187 @@
+# progress.py
+
+import json
+import sys
+import threading
+import time
+
+# Output verbosity, from least to most chatty. Per-item detail is only shown at 'debug'.
+LOG_LEVELS = {'quiet': 0, 'info': 1, 'debug': 2}
+OUTPUT_FORMATS = ('text', 'json')
+
+# Function to format a number of seconds as h:mm:ss / m:ss for ETA display
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+# Aggregated counters for a single stage (done, total, rate, ETA plus named counters such as cached/walked)
+class StageProgress:
+    def __init__(self, reporter, name, total):
+        self.reporter = reporter
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if not self.total or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    # Count finished items; keyword arguments bump named counters (e.g. cached=1)
+    def advance(self, count=1, **counters):
+        with self.reporter._lock:
+            self.done += count
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+        self.reporter._maybe_draw(self)
+
+    # Per-item message, only emitted at the 'debug' log level
+    def detail(self, message):
+        self.reporter.debug(message, stage=self.name)
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            self.reporter._finish_stage(self)
+
+    def snapshot(self):
+        return {
+            "stage": self.name,
+            "done": self.done,
+            "total": self.total,
+            "elapsed": round(self.elapsed, 3),
+            "rate": round(self.rate, 1),
+            "eta": None if self.eta is None else round(self.eta, 1),
+            "counters": dict(self.counters),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+# Rate-limited progress reporter: redraws a stage line at most every min_interval seconds,
+# instead of printing one line per folder
+class ProgressReporter:
+    def __init__(self, level='info', output_format='text', stream=None, min_interval=0.25):
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level '{level}', expected one of {', '.join(LOG_LEVELS)}")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown progress format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.level = LOG_LEVELS[level]
+        self.output_format = output_format
+        self.stream = stream or sys.stdout
+        self.min_interval = min_interval
+        self.stages = []
+        self._lock = threading.RLock()
+        self._last_draw = 0.0
+        self._live_width = 0
+        self._is_tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+    def stage(self, name, total=None):
+        stage = StageProgress(self, name, total)
+        with self._lock:
+            self.stages.append(stage)
+            if self.output_format == 'json' and self.level:
+                self._emit_json({"event": "stage_start", "stage": name, "total": total})
+        return stage
+
+    def info(self, message):
+        self._message('info', message)
+
+    def warning(self, message):
+        self._message('warning', message)
+
+    def debug(self, message, stage=None):
+        if self.level >= LOG_LEVELS['debug']:
+            self._message('debug', message, stage)
+
+    def _message(self, level, message, stage=None):
+        if level != 'warning' and self.level < LOG_LEVELS['info']:
+            return
+        with self._lock:
+            if self.output_format == 'json':
+                event = {"event": "message", "level": level, "message": message}
+                if stage:
+                    event["stage"] = stage
+                self._emit_json(event)
+            else:
+                self._clear_live_line()
+                stream = sys.stderr if level == 'warning' and self.level < LOG_LEVELS['info'] else self.stream
+                stream.write(message + "\n")
+                stream.flush()
+
+    def _maybe_draw(self, stage):
+        if self.level < LOG_LEVELS['info']:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if now - self._last_draw < self.min_interval:
+                return
+            self._last_draw = now
+            self._draw(stage, final=False)
+
+    def _finish_stage(self, stage):
+        if self.level < LOG_LEVELS['info']:
+            return
+        with self._lock:
+            self._draw(stage, final=True)
+
+    def _draw(self, stage, final):
+        if self.output_format == 'json':
+            event = {"event": "stage_end" if final else "progress"}
+            event.update(stage.snapshot())
+            self._emit_json(event)
+            return
+
+        line = self._format_line(stage, final)
+        if self._is_tty and not final:
+            self.stream.write("\r" + line.ljust(self._live_width))
+            self._live_width = len(line)
+        else:
+            self._clear_live_line()
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def _format_line(self, stage, final):
+        total = stage.total if stage.total is not None else "?"
+        parts = [f"[{stage.name}] {stage.done}/{total}"]
+        if stage.total:
+            parts.append(f"({stage.done / stage.total:.0%})")
+        parts.append(f"{stage.rate:.1f}/s")
+        if final:
+            parts.append(f"in {stage.elapsed:.2f}s")
+        elif stage.eta is not None:
+            parts.append(f"ETA {format_duration(stage.eta)}")
+        parts.extend(f"{key}={value}" for key, value in stage.counters.items())
+        return " ".join(parts)
+
+    def _clear_live_line(self):
+        if self._live_width:
+            self.stream.write("\r" + " " * self._live_width + "\r")
+            self._live_width = 0
+
+    def _emit_json(self, event):
+        event["time"] = round(time.time(), 3)
+        self.stream.write(json.dumps(event) + "\n")
+        self.stream.flush()
@@ -0,0 +1,241 @@
+# run_history.py
+
+import json
+import os
+import subprocess
+import threading
+from datetime import datetime
+
+DEFAULT_HISTORY_FILE = 'run_history.jsonl'
+# Build runs whose walk rates the scan planner averages
+DEFAULT_RATE_RUNS = 10
+
+# Function to describe the current git checkout so runs from different branches can be told apart
+def get_git_info():
+    info = {}
+    for key, command in (("branch", ["git", "rev-parse", "--abbrev-ref", "HEAD"]), ("commit", ["git", "rev-parse", "--short", "HEAD"])):
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+        except (OSError, subprocess.SubprocessError):
+            continue
+        if result.returncode == 0:
+            info[key] = result.stdout.strip()
+    return info
+
+# Function to total the size of output files/directories (directories are summed one level deep, like car_details)
+def get_output_sizes(output_paths):
+    sizes = {}
+    for path in output_paths:
+        if os.path.isdir(path):
+            total, count = 0, 0
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+                        count += 1
+            sizes[path] = {"bytes": total, "files": count}
+        elif os.path.isfile(path):
+            sizes[path] = {"bytes": os.path.getsize(path), "files": 1}
+    return sizes
+
+# Function to turn finished progress stages into {stage: {elapsed, done, total, counters}}. A stage run
+# more than once (once per game with --streaming) is summed into one entry.
+def stage_metrics(stages):
+    metrics = {}
+    for stage in stages:
+        entry = metrics.get(stage.name)
+        if entry is None:
+            metrics[stage.name] = {
+                "elapsed": round(stage.elapsed, 4),
+                "done": stage.done,
+                "total": stage.total,
+                "counters": dict(stage.counters),
+            }
+            continue
+        entry["elapsed"] = round(entry["elapsed"] + stage.elapsed, 4)
+        entry["done"] += stage.done
+        entry["total"] = None if entry["total"] is None or stage.total is None else entry["total"] + stage.total
+        for name, count in stage.counters.items():
+            entry["counters"][name] = entry["counters"].get(name, 0) + count
+    return metrics
+
+# Function to derive cache hit rates from the 'cached'/'walked' counters of the scan stages
+def cache_hit_rates(stages):
+    rates = {}
+    for name, metrics in stages.items():
+        counters = metrics.get("counters", {})
+        if "cached" not in counters and "walked" not in counters:
+            continue
+        hits, misses = counters.get("cached", 0), counters.get("walked", 0)
+        rates[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return rates
+
+# Files, bytes and walk time of the car folders a build listed for files, per game root, kept with the
+# run record so the scan planner can tell how fast each root walks. Walk times are summed over the
+# workers, so a root's rate is that of one worker. add() may be called from any stage thread.
+class RootThroughput:
+    def __init__(self):
+        self.roots = {}
+        self._lock = threading.Lock()
+
+    def add(self, folder_path, files, size, seconds):
+        with self._lock:
+            entry = self.roots.setdefault(os.path.dirname(folder_path), {"folders": 0, "files": 0, "bytes": 0, "seconds": 0.0})
+            entry["folders"] += 1
+            entry["files"] += files
+            entry["bytes"] += size
+            entry["seconds"] += seconds
+
+    def as_dict(self):
+        with self._lock:
+            return {root: {**entry, "seconds": round(entry["seconds"], 4)} for root, entry in self.roots.items()}
+
+# Function to build a history record for a build or bench run; cache holds full CacheStats
+# dictionaries when available, otherwise hit rates are derived from the stage counters
+def make_run_record(kind, stages, counts=None, outputs=None, label=None, extra=None, cache=None):
+    timestamp = datetime.now()
+    git = get_git_info()
+    record = {
+        "id": timestamp.strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}",
+        "kind": kind,
+        "timestamp": timestamp.isoformat(timespec='seconds'),
+        "git": git,
+        "label": label,
+        "stages": stages,
+        "cache": cache if cache is not None else cache_hit_rates(stages),
+        "counts": counts or {},
+        "outputs": outputs or {},
+    }
+    if extra:
+        record.update(extra)
+    return record
+
+# Function to append a run record to the local history store (one JSON object per line)
+def append_run(record, history_file=DEFAULT_HISTORY_FILE):
+    with open(history_file, 'a') as history:
+        history.write(json.dumps(record) + "\n")
+    return record
+
+def load_runs(history_file=DEFAULT_HISTORY_FILE):
+    runs = []
+    if not os.path.exists(history_file):
+        return runs
+    with open(history_file) as history:
+        for line in history:
+            line = line.strip()
+            if line:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+    return runs
+
+# Function to derive walk rates from the last `limit` build runs that walked folders: files per second
+# (per worker) for each root and over all roots, and the concurrency the file list walks reached (walk
+# time summed over the workers per second of the stage). Rates are None without such runs.
+def walk_rates(runs, limit=DEFAULT_RATE_RUNS):
+    recent = [run for run in runs if run.get("kind") == "build" and run.get("roots")][-limit:]
+    roots = {}
+    walk_seconds = stage_seconds = 0.0
+    for run in recent:
+        for root, entry in run["roots"].items():
+            totals = roots.setdefault(root, [0, 0.0])
+            totals[0] += entry.get("files", 0)
+            totals[1] += entry.get("seconds", 0.0)
+        fs_io_seconds = run.get("cache", {}).get("file_lists", {}).get("fs_io_seconds")
+        elapsed = run.get("stages", {}).get("file_lists", {}).get("elapsed")
+        if fs_io_seconds and elapsed:
+            walk_seconds += fs_io_seconds
+            stage_seconds += elapsed
+    files = sum(totals[0] for totals in roots.values())
+    seconds = sum(totals[1] for totals in roots.values())
+    return {
+        "runs": len(recent),
+        "roots": {root: files_walked / seconds_walked for root, (files_walked, seconds_walked) in roots.items() if files_walked and seconds_walked > 0},
+        "overall": files / seconds if files and seconds > 0 else None,
+        "concurrency": max(1.0, walk_seconds / stage_seconds) if stage_seconds else 1.0,
+    }
+
+# Function to resolve a run selector: a run id (or unique prefix), 'latest', 'previous',
+# 'branch:<name>' for the newest run on a branch, or a path to an exported run/bench JSON file
+def resolve_run(selector, history_file=DEFAULT_HISTORY_FILE, kind=None):
+    if os.path.isfile(selector) and not selector.endswith('.jsonl'):
+        with open(selector) as run_file:
+            return json.load(run_file)
+
+    runs = [run for run in load_runs(history_file) if kind is None or run.get("kind") == kind]
+    if not runs:
+        raise LookupError(f"No {kind + ' ' if kind else ''}runs recorded in '{history_file}'")
+
+    if selector == 'latest':
+        return runs[-1]
+    if selector == 'previous':
+        if len(runs) < 2:
+            raise LookupError("Only one run recorded, there is no previous run")
+        return runs[-2]
+    if selector.startswith('branch:'):
+        branch = selector.split(':', 1)[1]
+        matches = [run for run in runs if run.get("git", {}).get("branch") == branch]
+        if not matches:
+            raise LookupError(f"No runs recorded on branch '{branch}'")
+        return matches[-1]
+
+    matches = [run for run in runs if run.get("id", "").startswith(selector)]
+    if len(matches) != 1:
+        raise LookupError(f"Run selector '{selector}' matched {len(matches)} runs")
+    return matches[0]
+
+# Function to compare the stage timings of two runs; a stage regresses when it is slower by more
+# than threshold (fraction) and by more than min_delta seconds, so tiny stages do not flap. Runs with
+# no stage in common (such as two different benchmarks) cannot be compared and raise ValueError.
+def compare_runs(baseline, candidate, threshold=0.10, min_delta=0.05):
+    rows = []
+    base_stages, cand_stages = baseline.get("stages", {}), candidate.get("stages", {})
+    if not any(name in cand_stages for name in base_stages):
+        raise ValueError(f"Runs {baseline.get('id', '?')} and {candidate.get('id', '?')} have no stage in common; compare runs of the same kind")
+    for name in list(base_stages) + [name for name in cand_stages if name not in base_stages]:
+        before = base_stages.get(name, {}).get("elapsed")
+        after = cand_stages.get(name, {}).get("elapsed")
+        change = None
+        regression = False
+        if before is not None and after is not None:
+            change = (after - before) / before if before > 0 else None
+            regression = after - before > min_delta and (change is None or change > threshold)
+        rows.append({"stage": name, "baseline": before, "candidate": after, "change": change, "regression": regression})
+    return rows
+
+def format_comparison(baseline, candidate, rows):
+    def describe(run):
+        git = run.get("git", {})
+        where = f"{git.get('branch', '?')}@{git.get('commit', '?')}"
+        return f"{run.get('id', '?')} ({run.get('kind', '?')}, {where}{', ' + run['label'] if run.get('label') else ''})"
+
+    lines = [f"Baseline:  {describe(baseline)}", f"Candidate: {describe(candidate)}", ""]
+    lines.append(f"{'stage':<24}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for row in rows:
+        before = f"{row['baseline']:.3f}s" if row["baseline"] is not None else "-"
+        after = f"{row['candidate']:.3f}s" if row["candidate"] is not None else "-"
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(f"{row['stage']:<24}{before:>12}{after:>12}{change:>10}{flag}")
+
+    for section in ("counts", "cache", "outputs"):
+        before, after = baseline.get(section, {}), candidate.get(section, {})
+        changed = [key for key in sorted(set(before) | set(after)) if before.get(key) != after.get(key)]
+        for key in changed:
+            lines.append(f"{section}.{key}: {before.get(key)} -> {after.get(key)}")
+    return "\n".join(lines)
+
+def format_history(runs):
+    lines = []
+    for run in runs:
+        git = run.get("git", {})
+        total = sum(stage.get("elapsed", 0) for stage in run.get("stages", {}).values())
+        where = f"{git.get('branch', '?')}@{git.get('commit', '?')}"
+        label = f"  {run['label']}" if run.get("label") else ""
+        lines.append(f"{run.get('id', '?'):<24}{run.get('kind', '?'):<7}{where:<28}{total:>9.2f}s{label}")
+    return "\n".join(lines)
@@ -0,0 +1,61 @@
+# scan_catalog.py
+
+import json
+import os
+
+DEFAULT_CATALOG_FILE = 'scan_catalog.jsonl'
+
+# Function to read the car folders each game root held at the last build: {root: [folder names]}.
+# Empty when there is no catalog; a line cut short is skipped, leaving its root to be listed again.
+def load_catalog(path=DEFAULT_CATALOG_FILE):
+    catalog = {}
+    if not os.path.exists(path):
+        return catalog
+    with open(path, encoding='utf-8', errors='surrogateescape') as catalog_file:
+        for line in catalog_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and "root" in entry:
+                catalog[entry["root"]] = entry.get("folders", [])
+    return catalog
+
+# Writes the catalog of a build, one line per game root with its car folder names in natural order:
+#
+#   {"root": "W:\\Forza\\Horizon 5\\...\\cars", "folders": ["ALF_8C_08", ...]}
+#
+# Roots are added as they are listed (or taken from the last catalog, by a scoped build) and the
+# catalog only replaces the previous one on commit(), so an interrupted build leaves it as it was.
+class CatalogWriter:
+    def __init__(self, path=DEFAULT_CATALOG_FILE):
+        self.path = path
+        self.roots = 0
+        self._temp_path = f"{path}.tmp"
+        self._file = open(self._temp_path, 'w', encoding='utf-8', errors='surrogateescape')
+
+    def add(self, root, folder_names):
+        self._file.write(json.dumps({"root": root, "folders": list(folder_names)}) + "\n")
+        self.roots += 1
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    # Drop what was written, keeping the previous catalog
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
@@ -0,0 +1,112 @@
+# scan_checkpoint.py
+
+import json
+import os
+import threading
+import time
+
+DEFAULT_CHECKPOINT_FILE = 'scan_checkpoint.jsonl'
+# Folders per checkpoint batch; a batch is also written once it is this many seconds old
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BATCH_SECONDS = 30.0
+
+# Journal of the car folders a scan has finished, so an interrupted scan can be resumed without
+# walking them again. The first line records the scan mode; each later line is one batch:
+#
+#   {"scan_mode": "full", "started": "2024-05-01T12:00:00"}
+#   {"stage": "folder_sizes", "folders": [...], "changed": [...]}
+#
+# A batch is only appended (and fsync'ed) after the caches holding its results were synced, so every
+# folder in the journal has its result on disk. A line cut short by a crash is ignored on load. Each
+# stage's batch is kept and committed apart, so stages running at once (--pipeline) only journal the
+# folders of the cache they synced.
+class ScanCheckpoint:
+    def __init__(self, path=DEFAULT_CHECKPOINT_FILE, scan_mode=None, batch_size=DEFAULT_BATCH_SIZE, batch_seconds=DEFAULT_BATCH_SECONDS):
+        self.path = path
+        self.scan_mode = scan_mode
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.completed = {}
+        self.changed = set()
+        self.batches = 0
+        self._pending = {}
+        self._pending_changed = {}
+        self._batch_start = {}
+        self._lock = threading.Lock()
+
+    # Function to read a journal left by an interrupted scan; None when there is none
+    @classmethod
+    def load(cls, path=DEFAULT_CHECKPOINT_FILE, **options):
+        if not os.path.exists(path):
+            return None
+        checkpoint = None
+        with open(path, encoding='utf-8', errors='surrogateescape') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if checkpoint is None:
+                    if "scan_mode" not in entry:
+                        return None
+                    checkpoint = cls(path, entry["scan_mode"], **options)
+                    continue
+                checkpoint.completed.setdefault(entry.get("stage"), set()).update(entry.get("folders", ()))
+                checkpoint.changed.update(entry.get("changed", ()))
+                checkpoint.batches += 1
+        return checkpoint
+
+    # Start a new journal for this scan, replacing any previous one
+    def start(self):
+        self._write({"scan_mode": self.scan_mode, "started": time.strftime('%Y-%m-%dT%H:%M:%S')}, mode='w')
+        return self
+
+    # Folders of a stage finished by the interrupted scan
+    def finished(self, stage):
+        return self.completed.get(stage, set())
+
+    # Record a finished folder; it is journaled with the next batch of its stage
+    def add(self, stage, folder_path, changed=False):
+        with self._lock:
+            self._batch_start.setdefault(stage, time.monotonic())
+            self._pending.setdefault(stage, []).append(folder_path)
+            if changed:
+                self._pending_changed.setdefault(stage, []).append(folder_path)
+
+    # True when the pending batch of `stage` (of any stage by default) is big or old enough to be written
+    def due(self, stage=None):
+        with self._lock:
+            for name in [stage] if stage is not None else list(self._pending):
+                if name not in self._batch_start:
+                    continue
+                if len(self._pending[name]) >= self.batch_size or time.monotonic() - self._batch_start[name] >= self.batch_seconds:
+                    return True
+            return False
+
+    # Append the pending batch of `stage`, or of every stage. Call it only after the caches holding
+    # these folders were synced.
+    def commit(self, stage=None):
+        with self._lock:
+            for name in [stage] if stage is not None else list(self._pending):
+                folders = self._pending.pop(name, None)
+                changed = self._pending_changed.pop(name, [])
+                self._batch_start.pop(name, None)
+                if not folders:
+                    continue
+                self._write({"stage": name, "folders": folders, "changed": changed})
+                self.completed.setdefault(name, set()).update(folders)
+                self.changed.update(changed)
+                self.batches += 1
+
+    def _write(self, entry, mode='a'):
+        with open(self.path, mode, encoding='utf-8', errors='surrogateescape') as journal:
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    # Remove the journal once the scan it describes has completed
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
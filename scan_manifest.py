@@ -0,0 +1,248 @@
+# scan_manifest.py
+
+import mmap
+import os
+import struct
+import zlib
+from bisect import bisect_left
+
+# Binary snapshot of a scan: every car folder with its size and mtime, and every file in it.
+#
+#   header     magic, version, flags, counts and the offset of each section
+#   strings    u32 end offsets, then the UTF-8 data (folder paths and relative file paths, each stored once)
+#   folders    fixed-width records sorted by path: path id, file count, first file, block, size, mtime
+#   blocks     per block of file records: offset, stored length, first file, record count
+#   files      fixed-width records: folder id, name id, size, mtime; blocks are zlib-compressed
+#              when FLAG_COMPRESSED is set
+#
+# All integers are little-endian, mtimes are nanoseconds (0 when unknown: the build's file lists carry
+# no file mtimes). The manifest is written for export and inspection; the build does not read it back.
+MANIFEST_VERSION = 1
+FLAG_COMPRESSED = 1
+_MAGIC = b'FZSCAN'
+_HEADER = struct.Struct('<6sHHIIIIQQQQQ')
+_STRING_OFFSET = struct.Struct('<I')
+_FOLDER = struct.Struct('<IIIIQq')
+_BLOCK = struct.Struct('<QIII')
+_FILE = struct.Struct('<IIQq')
+
+# Paths are stored as UTF-8; undecodable names from the filesystem round-trip via surrogateescape
+def _encode(string):
+    return string.encode('utf-8', 'surrogateescape')
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogateescape')
+
+# Function to write a scan manifest. `folders` yields (folder_path, size, mtime_ns, file_list) with
+# file_list items (relative_path, size) or (relative_path, size, mtime_ns). The file is replaced atomically.
+def write_manifest(manifest_path, folders, compress=False, block_files=4096):
+    folders = sorted(folders, key=lambda folder: _encode(folder[0]))
+    strings, string_ids = [], {}
+
+    def intern(string):
+        index = string_ids.get(string)
+        if index is None:
+            index = string_ids[string] = len(strings)
+            strings.append(_encode(string))
+        return index
+
+    folder_records, blocks, block_data = bytearray(), bytearray(), []
+    current, block_first, file_count, files_offset = bytearray(), 0, 0, 0
+
+    def flush_block():
+        nonlocal current, block_first, files_offset
+        stored = zlib.compress(bytes(current)) if compress else bytes(current)
+        blocks.extend(_BLOCK.pack(files_offset, len(stored), block_first, (file_count - block_first)))
+        block_data.append(stored)
+        files_offset += len(stored)
+        current, block_first = bytearray(), file_count
+
+    for folder_id, (folder_path, size, mtime_ns, file_list) in enumerate(folders):
+        if current and file_count - block_first + len(file_list) > block_files:
+            flush_block()
+        folder_records.extend(_FOLDER.pack(intern(folder_path), len(file_list), file_count, len(blocks) // _BLOCK.size, size, mtime_ns or 0))
+        for entry in file_list:
+            file_mtime = entry[2] if len(entry) > 2 else 0
+            current.extend(_FILE.pack(folder_id, intern(entry[0]), entry[1], file_mtime))
+            file_count += 1
+    flush_block()
+
+    string_offsets, end = bytearray(), 0
+    for data in strings:
+        end += len(data)
+        string_offsets.extend(_STRING_OFFSET.pack(end))
+    string_offsets_at = _HEADER.size
+    string_data_at = string_offsets_at + len(string_offsets)
+    folders_at = string_data_at + end
+    blocks_at = folders_at + len(folder_records)
+    files_at = blocks_at + len(blocks)
+    header = _HEADER.pack(_MAGIC, MANIFEST_VERSION, FLAG_COMPRESSED if compress else 0, len(folders), file_count, len(strings),
+                          len(blocks) // _BLOCK.size, string_offsets_at, string_data_at, folders_at, blocks_at, files_at)
+
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as manifest_file:
+        manifest_file.write(header)
+        manifest_file.write(string_offsets)
+        for data in strings:
+            manifest_file.write(data)
+        manifest_file.write(folder_records)
+        manifest_file.write(blocks)
+        for data in block_data:
+            manifest_file.write(data)
+    os.replace(temp_path, manifest_path)
+    return len(folders), file_count
+
+# A folder's files, read from the manifest as they are accessed. Iterates as (relative_path, size)
+# like the cached file lists, so it can be rendered directly.
+class ManifestFileList:
+    __slots__ = ('manifest', 'block', 'start', 'count')
+
+    def __init__(self, manifest, block, start, count):
+        self.manifest = manifest
+        self.block = block
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    # Return (relative_path, size, mtime_ns) of the index-th file
+    def entry(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        _, name_id, size, mtime_ns = _FILE.unpack_from(self.manifest._block(self.block), (self.start + index) * _FILE.size)
+        return self.manifest.string(name_id), size, mtime_ns
+
+    def __getitem__(self, index):
+        return self.entry(index)[:2]
+
+    def __iter__(self):
+        data = self.manifest._block(self.block)
+        string = self.manifest.string
+        for index in range(self.start, self.start + self.count):
+            _, name_id, size, _ = _FILE.unpack_from(data, index * _FILE.size)
+            yield string(name_id), size
+
+    def total_size(self):
+        return sum(size for _, size in self)
+
+    def __repr__(self):
+        return f"ManifestFileList({self.count} files)"
+
+# A memory-mapped scan manifest. Opening reads only the header; folder lookups binary-search the
+# sorted folder records and file records are unpacked straight from the mapping (or from one
+# decompressed block), so nothing is deserialized up front.
+class ScanManifest:
+    def __init__(self, manifest_path, cached_blocks=8):
+        self.path = manifest_path
+        with open(manifest_path, 'rb') as manifest_file:
+            self._mmap = mmap.mmap(manifest_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        try:
+            (magic, version, self.flags, self.folder_count, self.file_count, self.string_count, self.block_count,
+             self._string_offsets_at, self._string_data_at, self._folders_at, self._blocks_at, self._files_at) = _HEADER.unpack_from(self._view)
+        except struct.error:
+            self.close()
+            raise ValueError(f"{manifest_path} is not a scan manifest")
+        if magic != _MAGIC or version != MANIFEST_VERSION:
+            self.close()
+            raise ValueError(f"{manifest_path} is not a version {MANIFEST_VERSION} scan manifest")
+        self._cached_blocks = cached_blocks
+        self._blocks = {}
+
+    @property
+    def compressed(self):
+        return bool(self.flags & FLAG_COMPRESSED)
+
+    def string(self, index):
+        return _decode(self.string_bytes(index).tobytes())
+
+    # Zero-copy view of a string's UTF-8 bytes
+    def string_bytes(self, index):
+        end = _STRING_OFFSET.unpack_from(self._view, self._string_offsets_at + index * _STRING_OFFSET.size)[0]
+        start = _STRING_OFFSET.unpack_from(self._view, self._string_offsets_at + (index - 1) * _STRING_OFFSET.size)[0] if index else 0
+        return self._view[self._string_data_at + start:self._string_data_at + end]
+
+    def _folder_record(self, folder_id):
+        return _FOLDER.unpack_from(self._view, self._folders_at + folder_id * _FOLDER.size)
+
+    def _block(self, block_id):
+        data = self._blocks.get(block_id)
+        if data is None:
+            offset, length, _, _ = _BLOCK.unpack_from(self._view, self._blocks_at + block_id * _BLOCK.size)
+            data = self._view[self._files_at + offset:self._files_at + offset + length]
+            if self.compressed:
+                data = zlib.decompress(data)
+                # Keep the last few decompressed blocks; folders are usually read in order
+                if len(self._blocks) >= self._cached_blocks:
+                    self._blocks.pop(next(iter(self._blocks)))
+                self._blocks[block_id] = data
+        return data
+
+    # Function to find a folder's record index, or -1
+    def folder_id(self, folder_path):
+        key = _encode(folder_path)
+        # bisect over a lazy sequence of the sorted folder paths
+        index = bisect_left(_FolderKeys(self), key)
+        if index < self.folder_count and self.string_bytes(self._folder_record(index)[0]) == key:
+            return index
+        return -1
+
+    def __contains__(self, folder_path):
+        return self.folder_id(folder_path) >= 0
+
+    def __len__(self):
+        return self.folder_count
+
+    # Return (size, mtime_ns, files) for a folder, files being a lazy ManifestFileList
+    def folder(self, folder_path):
+        folder_id = self.folder_id(folder_path)
+        if folder_id < 0:
+            raise KeyError(folder_path)
+        return self._folder(folder_id)
+
+    def _folder(self, folder_id):
+        _, file_count, first_file, block_id, size, mtime_ns = self._folder_record(folder_id)
+        block_first = _BLOCK.unpack_from(self._view, self._blocks_at + block_id * _BLOCK.size)[2]
+        return size, mtime_ns, ManifestFileList(self, block_id, first_file - block_first, file_count)
+
+    def files(self, folder_path):
+        return self.folder(folder_path)[2]
+
+    def get(self, folder_path, default=None):
+        try:
+            return self.folder(folder_path)
+        except KeyError:
+            return default
+
+    # Iterate (folder_path, size, mtime_ns, files) in path order
+    def __iter__(self):
+        for folder_id in range(self.folder_count):
+            yield (self.string(self._folder_record(folder_id)[0]),) + self._folder(folder_id)
+
+    def close(self):
+        self._blocks.clear()
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # A file list is still being iterated; the mapping is closed when it is collected
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+# Sorted folder paths (as bytes) for bisect, read on access
+class _FolderKeys:
+    def __init__(self, manifest):
+        self.manifest = manifest
+
+    def __len__(self):
+        return self.manifest.folder_count
+
+    def __getitem__(self, index):
+        return self.manifest.string_bytes(self.manifest._folder_record(index)[0]).tobytes()
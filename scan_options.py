@@ -0,0 +1,45 @@
+# scan_options.py
+
+import copy
+
+from progress import ProgressReporter
+from scan_scheduler import (DEFAULT_FOLDER_TIMEOUT, DEFAULT_MAX_WORKERS, DEFAULT_MIN_WORKERS, DEFAULT_RETRIES, DEFAULT_SCAN_BACKEND, DEFAULT_STAGE_TIMEOUT,
+                            create_scheduler)
+
+# Options of a build shared by both scan stages: how folders are walked (scan mode, backend, worker
+# limits, timeouts and retries) and what the stages report into (progress, tracer, checkpoint, the
+# folders skipped after a timeout, and per-root throughput). `kept` holds the folders outside the scope
+# of a scoped build, which are taken from the caches as they are.
+class ScanOptions:
+    def __init__(self, progress=None, tracer=None, scan_mode='cached', scan_backend=DEFAULT_SCAN_BACKEND, min_workers=DEFAULT_MIN_WORKERS,
+                 max_workers=DEFAULT_MAX_WORKERS, folder_timeout=DEFAULT_FOLDER_TIMEOUT, stage_timeout=DEFAULT_STAGE_TIMEOUT, retries=DEFAULT_RETRIES,
+                 checkpoint=None, skipped=None, kept=(), throughput=None):
+        self.progress = progress or ProgressReporter()
+        self.tracer = tracer
+        self.scan_mode = scan_mode
+        self.scan_backend = scan_backend
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.folder_timeout = folder_timeout
+        self.stage_timeout = stage_timeout
+        self.retries = retries
+        self.checkpoint = checkpoint
+        self.skipped = {} if skipped is None else skipped
+        self.kept = kept
+        self.throughput = throughput
+
+    # A copy with some options changed, sharing the rest (such as `skipped`)
+    def replace(self, **changes):
+        options = copy.copy(self)
+        for name, value in changes.items():
+            setattr(options, name, value)
+        return options
+
+    # Scheduler for one stage's folder walks
+    def create_scheduler(self, stage_name):
+        return create_scheduler(self.scan_backend, stage_name, self.min_workers, self.max_workers, log=self.progress.debug, timeout=self.folder_timeout,
+                                stage_timeout=self.stage_timeout, retries=self.retries)
+
+    # Wrap a stage's per-folder task for the tracer, if there is one
+    def trace(self, stage_name, task):
+        return self.tracer.wrap(stage_name, task) if self.tracer else task
@@ -0,0 +1,137 @@
+# scan_plan.py
+
+import math
+import os
+import time
+from collections import namedtuple
+
+from progress import format_duration
+from size_tree import collect_cached_nodes
+
+# Files per second one worker is taken to walk when no build has recorded a rate yet
+DEFAULT_FILES_PER_SECOND = 2000
+
+# What the caches say about one car folder, read without walking it: its state against the size cache
+# ('new', 'changed' or 'unchanged'), its cached total in bytes, the bytes of its directories whose
+# mtime moved (the size stage lists those again), its cached file count, and whether its file list
+# would be taken from the cache. The numbers are None where the caches have none.
+FolderState = namedtuple('FolderState', ['state', 'total', 'changed_bytes', 'file_count', 'listed'])
+
+# Function to tell what a build would find in a car folder. Only the directories of its cached nodes
+# are stat'ed, as the size stage does in fast mode; nothing is listed. A cache that does not exist is None.
+def inspect_folder(folder_path, size_cache, file_store):
+    file_count = file_store.file_count(folder_path) if file_store else None
+    listed = file_count is not None and not file_store.is_stale(folder_path)
+    nodes = collect_cached_nodes(folder_path, size_cache) if size_cache is not None else {}
+    if folder_path not in nodes:
+        return FolderState('new', None, None, file_count, listed)
+    changed, changed_bytes = False, 0
+    for path, node in nodes.items():
+        try:
+            if os.stat(path).st_mtime_ns == node.mtime_ns:
+                continue
+        except OSError:
+            # Removed; its parent's mtime moved with it
+            continue
+        changed = True
+        changed_bytes += node.own_size
+    return FolderState('changed' if changed else 'unchanged', nodes[folder_path].total, changed_bytes, file_count, listed)
+
+# Function to inspect the car folders of a root; returns their FolderStates and the seconds it took
+def inspect_root(folder_paths, size_cache, file_store):
+    start = time.perf_counter()
+    folders = [inspect_folder(folder_path, size_cache, file_store) for folder_path in folder_paths]
+    return folders, time.perf_counter() - start
+
+# Function to work out the files and bytes the two scan stages would walk in a folder in `scan_mode`:
+# the size stage walks a new folder whole and, in fast mode, only the directories that changed of a
+# known one (cached mode takes a known folder's size as it is); the file list stage walks the folders with no list cached (and, in fast mode, the changed ones). Full
+# mode walks everything in both. A folder's missing counts are filled in from `bytes_per_file` and,
+# for a new folder, the `average` (files, bytes) of a folder of its root; returns (files, bytes,
+# whether they are estimated).
+def walk_cost(folder, scan_mode, bytes_per_file, average):
+    estimated = folder.total is None or folder.file_count is None
+    total = average[1] if folder.total is None else folder.total
+    files = folder.file_count
+    if files is None:
+        files = average[0] if folder.total is None else total / bytes_per_file
+    if scan_mode == 'full' or folder.state == 'new':
+        files_walked, bytes_walked = files, total
+    elif folder.state == 'changed' and scan_mode == 'fast':
+        bytes_walked = folder.changed_bytes
+        files_walked = math.ceil(files * bytes_walked / total) if total else files
+    else:
+        files_walked, bytes_walked = 0, 0
+    if scan_mode == 'full' or not folder.listed or (scan_mode == 'fast' and folder.state == 'changed'):
+        files_walked, bytes_walked = files_walked + files, bytes_walked + total
+    return files_walked, bytes_walked, estimated
+
+# Function to average the cached folders of a root: (files, bytes) per folder and bytes per file, each
+# None when no folder has both counts cached
+def root_averages(folders):
+    known = [folder for folder in folders if folder.total is not None and folder.file_count is not None]
+    files = sum(folder.file_count for folder in known)
+    size = sum(folder.total for folder in known)
+    return (files / len(known), size / len(known)) if known else None, size / files if files and size else None
+
+# Function to plan a scan from the inspected folders of each root, `roots` being (root, [FolderState],
+# seconds their directory checks took): how many folders are new, changed or unchanged, the files and
+# bytes that would be walked and how long that would take at the walk `rates` (as given by
+# run_history.walk_rates), as many walks running at once as in those builds. A root with nothing
+# cached borrows the averages of all roots. Returns the root plans and their totals, with the
+# estimated wall time, directory checks included, in 'wall_seconds'.
+def plan_scan(roots, scan_mode, rates):
+    averages = [root_averages(folders) for _, folders, _ in roots]
+    known = [average for average, _ in averages if average is not None]
+    overall_average = (sum(files for files, _ in known) / len(known), sum(size for _, size in known) / len(known)) if known else (0, 0)
+    ratios = [bytes_per_file for _, bytes_per_file in averages if bytes_per_file]
+    overall_bytes_per_file = sum(ratios) / len(ratios) if ratios else 1
+    plans = []
+    totals = {"folders": 0, "new": 0, "changed": 0, "unchanged": 0, "files": 0, "bytes": 0, "estimated": 0, "walk_seconds": 0.0, "stat_seconds": 0.0}
+    for (root, folders, stat_seconds), (average, bytes_per_file) in zip(roots, averages):
+        plan = {"root": root, "folders": len(folders), "new": 0, "changed": 0, "unchanged": 0, "estimated": 0, "stat_seconds": stat_seconds}
+        files = size = 0
+        for folder in folders:
+            plan[folder.state] += 1
+            folder_files, folder_bytes, estimated = walk_cost(folder, scan_mode, bytes_per_file or overall_bytes_per_file, average or overall_average)
+            files += folder_files
+            size += folder_bytes
+            plan["estimated"] += estimated
+        plan["files"], plan["bytes"] = round(files), round(size)
+        rate = rates["roots"].get(root)
+        plan["rate_source"] = 'root' if rate else ('overall' if rates["overall"] else 'assumed')
+        plan["walk_seconds"] = plan["files"] / (rate or rates["overall"] or DEFAULT_FILES_PER_SECOND) / rates["concurrency"]
+        for key in totals:
+            totals[key] += plan[key]
+        plans.append(plan)
+    # Only fast mode makes the same directory checks; cached mode trusts the cache and full mode walks instead
+    totals["wall_seconds"] = totals["walk_seconds"] + (totals["stat_seconds"] if scan_mode == 'fast' else 0)
+    return plans, totals
+
+# Function to format a scan plan as a table of roots with the totals and the estimate below
+def format_plan(plans, totals, scan_mode, rates, names=None):
+    names = names or {}
+    lines = [f"Scan plan ({scan_mode} mode), from the caches without walking the car folders:", "",
+             f"{'root':<40}{'folders':>9}{'new':>7}{'changed':>9}{'unchanged':>11}{'files':>11}{'GB':>9}{'est. time':>11}"]
+    for plan in plans:
+        name = names.get(plan["root"], plan["root"])
+        name = name if len(name) <= 38 else "..." + name[-35:]
+        marker = "*" if plan["estimated"] else ""
+        lines.append(f"{name:<40}{plan['folders']:>9}{plan['new']:>7}{plan['changed']:>9}{plan['unchanged']:>11}{plan['files']:>10}{marker:1}"
+                     f"{plan['bytes'] / (1024 ** 3):>9.2f}{format_duration(plan['walk_seconds']):>11}")
+    lines.append(f"{'total':<40}{totals['folders']:>9}{totals['new']:>7}{totals['changed']:>9}{totals['unchanged']:>11}{totals['files']:>10} "
+                 f"{totals['bytes'] / (1024 ** 3):>9.2f}{format_duration(totals['walk_seconds']):>11}")
+    lines.append("")
+    if totals["estimated"]:
+        lines.append(f"* estimated for {totals['estimated']} folders with no cached size or file count, from the averages of their root")
+    if rates["overall"]:
+        lines.append(f"Walk rates from the last {rates['runs']} recorded builds: {rates['overall']:.0f} files/s per worker overall, "
+                     f"{rates['concurrency']:.1f} walks at a time")
+    else:
+        lines.append(f"No recorded build has walked folders yet; assuming {DEFAULT_FILES_PER_SECOND} files/s and one walk at a time")
+    assumed = [plan for plan in plans if plan["files"] and plan["rate_source"] != 'root']
+    if rates["overall"] and assumed:
+        lines.append(f"{len(assumed)} roots to walk have no rate of their own and use the overall one")
+    lines.append(f"Estimated scan time: {format_duration(totals['wall_seconds'])} "
+                 f"({totals['files']} files, {totals['bytes'] / (1024 ** 3):.2f} GB to walk; directory checks took {totals['stat_seconds']:.2f}s here)")
+    return "\n".join(lines)
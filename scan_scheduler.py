@@ -0,0 +1,460 @@
+# scan_scheduler.py
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_INITIAL_WORKERS = 4
+# Seconds a single folder walk may take before it is abandoned (a hung network share); the scan
+# stages have no overall deadline unless one is given
+DEFAULT_FOLDER_TIMEOUT = 300.0
+DEFAULT_STAGE_TIMEOUT = None
+DEFAULT_RETRIES = 1
+# Seconds before the first retry of a folder; doubled for each further attempt
+DEFAULT_RETRY_DELAY = 1.0
+# Errors that another attempt will not fix: the folder is gone or unreadable
+PERMANENT_ERRORS = (FileNotFoundError, NotADirectoryError, PermissionError)
+# How folder walks are run: 'threads' walks each folder on a worker thread (AdaptiveScheduler),
+# 'asyncio' runs coroutine walks on an event loop (async_scan.AsyncScheduler), 'processes' walks
+# chunks of folders in worker processes (process_scan.ProcessScheduler)
+SCAN_BACKENDS = ('threads', 'asyncio', 'processes')
+DEFAULT_SCAN_BACKEND = 'threads'
+# Longest the monitor sleeps between deadline checks
+_MONITOR_INTERVAL = 1.0
+
+# Raised from a folder's Future when its walk ran past the per-folder timeout on every attempt
+class WalkTimeout(TimeoutError):
+    def __init__(self, folder_path, seconds, attempts):
+        super().__init__(f"walk of '{folder_path}' timed out after {seconds:g}s ({attempts} attempt{'s' if attempts != 1 else ''})")
+        self.folder_path = folder_path
+        self.seconds = seconds
+        self.attempts = attempts
+
+# Raised from the Futures of folders still queued or running when the stage deadline passed
+class StageTimeout(TimeoutError):
+    def __init__(self, folder_path, seconds):
+        super().__init__(f"stage deadline of {seconds:g}s passed before '{folder_path}' was walked")
+        self.folder_path = folder_path
+        self.seconds = seconds
+
+# Function to estimate each folder's walk cost, in files: its cached file count where known, otherwise
+# its recorded size over the mean bytes per file of the folders that have both. With no file counts at
+# all the sizes are used as they are. Folders with neither are left out (unknown).
+def estimate_costs(folder_paths, sizes, file_counts=None):
+    file_counts = {path: count for path, count in (file_counts or {}).items() if count is not None}
+    pairs = [(sizes[path], file_counts[path]) for path in folder_paths if sizes.get(path) is not None and file_counts.get(path)]
+    bytes_per_file = sum(size for size, _ in pairs) / sum(count for _, count in pairs) if pairs else None
+    costs = {}
+    for path in folder_paths:
+        if file_counts.get(path) is not None:
+            costs[path] = file_counts[path]
+        elif sizes.get(path) is not None:
+            if bytes_per_file:
+                costs[path] = sizes[path] / bytes_per_file
+            elif not file_counts:
+                costs[path] = sizes[path]
+    return costs
+
+# Function to order folders for submission, largest estimated cost first, so the biggest walks are not
+# left to run alone at the end of a stage. Folders without an estimate are spread evenly through the
+# known ones, starting with the first slot: one of them may well be the largest of all. Equal costs
+# keep their original order.
+def largest_first(folder_paths, costs):
+    known = sorted((path for path in folder_paths if costs.get(path) is not None), key=lambda path: -costs[path])
+    unknown = [path for path in folder_paths if costs.get(path) is None]
+    if not known or not unknown:
+        return known + unknown
+    ordered, taken = [], 0
+    step = len(known) / len(unknown)
+    for index, path in enumerate(unknown):
+        upto = int(index * step)
+        ordered.extend(known[taken:upto])
+        ordered.append(path)
+        taken = upto
+    ordered.extend(known[taken:])
+    return ordered
+
+# Per-root concurrency controlled AIMD-style. Completions are grouped into windows of about `limit`
+# tasks; after each window the mean task latency and the throughput are compared with the root's best
+# latency and the previous window. Latency well above the best seen (seek thrashing on a spinning
+# disk) or a throughput drop halves the limit; otherwise the limit grows by one, so a high-latency
+# network share that keeps scaling climbs to max_workers.
+class RootLimiter:
+    LATENCY_FACTOR = 2.0
+    THROUGHPUT_TOLERANCE = 0.25
+    MIN_WINDOW = 4
+
+    def __init__(self, root, min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS, initial_workers=None):
+        self.root = root
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.limit = min(self.max_workers, max(self.min_workers, initial_workers or DEFAULT_INITIAL_WORKERS))
+        self.in_flight = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.best_latency = None
+        self.last_latency = None
+        self.last_throughput = None
+        self.adjustments = 0
+        self._window_start = None
+        self._window_count = 0
+        self._window_latency = 0.0
+
+    def started(self, now):
+        if self._window_start is None:
+            self._window_start = now
+        self.in_flight += 1
+
+    # Record one finished task; returns (old limit, new limit) when the window closed with a change
+    def finished(self, latency, now):
+        self.in_flight -= 1
+        self.completed += 1
+        self.busy_seconds += latency
+        self._window_count += 1
+        self._window_latency += latency
+        if self._window_count < max(self.limit, self.MIN_WINDOW):
+            return None
+
+        elapsed = max(now - self._window_start, 1e-9)
+        throughput = self._window_count / elapsed
+        latency = self._window_latency / self._window_count
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        congested = latency > self.best_latency * self.LATENCY_FACTOR or (
+            self.last_throughput is not None and throughput < self.last_throughput * (1 - self.THROUGHPUT_TOLERANCE))
+        old_limit = self.limit
+        if congested:
+            self.limit = max(self.min_workers, self.limit // 2)
+        else:
+            self.limit = min(self.max_workers, self.limit + 1)
+        self.last_latency, self.last_throughput = latency, throughput
+        self._window_start, self._window_count, self._window_latency = now, 0, 0.0
+        if self.limit != old_limit:
+            self.adjustments += 1
+            return old_limit, self.limit
+        return None
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "completed": self.completed,
+            "latency": None if self.last_latency is None else round(self.last_latency, 6),
+            "throughput": None if self.last_throughput is None else round(self.last_throughput, 2),
+            "adjustments": self.adjustments,
+        }
+
+# One submitted folder: its Future, the call, and the state of its current attempt
+class _Task:
+    __slots__ = ('future', 'fn', 'args', 'kwargs', 'root', 'attempts', 'started', 'not_before', 'error')
+
+    def __init__(self, future, fn, args, kwargs, root):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.root = root
+        self.attempts = 0
+        self.started = None
+        self.not_before = None
+        self.error = None
+
+    @property
+    def folder_path(self):
+        return self.args[0]
+
+# Daemon worker threads of one root, reused between tasks. A worker stuck in an abandoned walk is not
+# counted as idle, so another one is started in its place; it rejoins the idle ones if the walk ever
+# returns. `idle` is guarded by the scheduler's lock.
+class _RootWorkers:
+    def __init__(self, name, run):
+        self.name = name
+        self.run = run
+        self.jobs = queue.SimpleQueue()
+        self.idle = 0
+        self.threads = 0
+
+    # Hand a task to an idle worker, starting a new one if none is; called with the lock held
+    def start(self, task, attempt):
+        if self.idle:
+            self.idle -= 1
+        else:
+            self.threads += 1
+            threading.Thread(target=self._work, name=f"{self.name}_{self.threads}", daemon=True).start()
+        self.jobs.put((task, attempt))
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            self.run(*job)
+
+    def stop(self):
+        for _ in range(self.threads):
+            self.jobs.put(None)
+
+# Runs per-folder tasks with a concurrency limit per storage root (by default the folder's parent,
+# i.e. the game root in parent_folders). submit() returns a Future at once; the task starts when its
+# root is below its limit. Each root has its own queue and its own threads, so a slow or sleeping
+# drive only holds up its own folders, and queued tasks are started round-robin across the roots.
+#
+# A walk that hangs cannot be interrupted, so with a `timeout` the monitor thread abandons it instead:
+# its worker (a daemon thread, which never holds up interpreter exit) is left to finish on its own and
+# its result is dropped, its slot is freed and the folder is retried or fails with WalkTimeout. I/O errors
+# other than PERMANENT_ERRORS are retried too, `retries` times, after a doubling `retry_delay`. Past the
+# `stage_timeout` every unfinished folder fails with StageTimeout. Drop-in for the ThreadPoolExecutor
+# the scan stages used.
+class AdaptiveScheduler:
+    def __init__(self, name='scan', min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS, root_of=os.path.dirname, log=None,
+                 timeout=None, stage_timeout=None, retries=0, retry_delay=DEFAULT_RETRY_DELAY):
+        self.name = name
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.root_of = root_of
+        self.log = log
+        self.timeout = timeout
+        self.stage_timeout = stage_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.deadline = time.perf_counter() + stage_timeout if stage_timeout else None
+        self.timed_out = 0
+        self.retried = 0
+        self.limiters = {}
+        self._queues = {}
+        self._workers = {}
+        self._running = set()
+        self._delayed = []
+        self._next_root = 0
+        self._expired = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._wakeup = threading.Condition(self._lock)
+        self._monitor = None
+        if timeout or stage_timeout or retries:
+            self._monitor = threading.Thread(target=self._watch, name=f"{name}-monitor", daemon=True)
+            self._monitor.start()
+
+    def _limiter(self, root):
+        limiter = self.limiters.get(root)
+        if limiter is None:
+            limiter = self.limiters[root] = RootLimiter(root, self.min_workers, self.max_workers)
+            self._queues[root] = deque()
+            self._workers[root] = _RootWorkers(f"{self.name}-{len(self.limiters)}", self._run)
+        return limiter
+
+    def submit(self, fn, folder_path, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            root = self.root_of(folder_path)
+            self._limiter(root)
+            task = _Task(future, fn, (folder_path,) + args, kwargs, root)
+            if self._expired:
+                future.set_running_or_notify_cancel()
+                future.set_exception(StageTimeout(folder_path, self.stage_timeout))
+                return future
+            self._queues[root].append(task)
+            self._dispatch()
+        return future
+
+    # Start queued tasks on every root that is below its limit, one task per root per pass and
+    # beginning with a different root each time; called with the lock held
+    def _dispatch(self):
+        now = time.perf_counter()
+        roots = list(self._queues)
+        start = self._next_root % len(roots)
+        self._next_root += 1
+        roots = roots[start:] + roots[:start]
+        while roots:
+            ready = []
+            for root in roots:
+                queue, limiter = self._queues[root], self.limiters[root]
+                while queue and limiter.in_flight < limiter.limit:
+                    task = queue.popleft()
+                    if task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                        continue
+                    task.attempts += 1
+                    task.started = now
+                    limiter.started(now)
+                    self._running.add(task)
+                    self._workers[root].start(task, task.attempts)
+                    ready.append(root)
+                    break
+            roots = ready
+
+    def _run(self, task, attempt):
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = task.fn(*task.args, **task.kwargs)
+        except BaseException as e:
+            error = e
+        end = time.perf_counter()
+        messages = []
+        with self._lock:
+            self._workers[task.root].idle += 1
+            if task.attempts != attempt or task not in self._running:
+                # Abandoned after a timeout or the stage deadline; the folder was retried or failed already
+                return
+            self._running.discard(task)
+            limiter = self.limiters[task.root]
+            change = limiter.finished(end - start, end)
+            if change:
+                messages.append(f"{self.name}: concurrency for '{task.root}' {change[0]} -> {change[1]} "
+                                f"({limiter.last_throughput:.1f} folders/s, {limiter.last_latency * 1000:.1f} ms per folder)")
+            if error is not None and self._should_retry(task, error):
+                messages.append(self._retry(task, error, end))
+            elif error is not None:
+                task.future.set_exception(error)
+            else:
+                task.future.set_result(result)
+            self._dispatch()
+            self._notify_idle()
+        self._emit(messages)
+
+    def _should_retry(self, task, error):
+        return (isinstance(error, OSError) and not isinstance(error, PERMANENT_ERRORS) and task.attempts <= self.retries
+                and not self._expired)
+
+    # Queue another attempt after the backoff delay; called with the lock held, returns a log message
+    def _retry(self, task, error, now):
+        delay = self.retry_delay * 2 ** (task.attempts - 1)
+        task.error = error
+        task.not_before = now + delay
+        self._delayed.append(task)
+        self.retried += 1
+        self._wakeup.notify_all()
+        return f"{self.name}: retrying '{task.folder_path}' in {delay:g}s (attempt {task.attempts + 1} of {self.retries + 1}) after: {error}"
+
+    # Monitor thread: abandons walks past the folder timeout, fails everything past the stage
+    # deadline, and queues delayed retries once they are due
+    def _watch(self):
+        with self._lock:
+            while not self._closed:
+                now = time.perf_counter()
+                messages = self._check(now)
+                if messages:
+                    self._lock.release()
+                    try:
+                        self._emit(messages)
+                    finally:
+                        self._lock.acquire()
+                    continue
+                wakeups = [task.started + self.timeout for task in self._running] if self.timeout else []
+                wakeups += [task.not_before for task in self._delayed]
+                if self.deadline and not self._expired:
+                    wakeups.append(self.deadline)
+                self._wakeup.wait(min([_MONITOR_INTERVAL] + [max(0.0, wakeup - now) for wakeup in wakeups]))
+
+    def _check(self, now):
+        messages = []
+        if self.deadline and not self._expired and now >= self.deadline:
+            self._expired = True
+            unfinished = [task for queue in self._queues.values() for task in queue] + self._delayed + list(self._running)
+            for queue in self._queues.values():
+                queue.clear()
+            self._delayed = []
+            for task in unfinished:
+                if task in self._running:
+                    self._running.discard(task)
+                    self.limiters[task.root].in_flight -= 1
+                elif task.attempts == 0 and not task.future.set_running_or_notify_cancel():
+                    continue
+                task.future.set_exception(StageTimeout(task.folder_path, self.stage_timeout))
+            if unfinished:
+                messages.append(f"{self.name}: stage deadline of {self.stage_timeout:g}s passed, {len(unfinished)} folders left unfinished")
+        if self.timeout:
+            for task in [task for task in self._running if now - task.started >= self.timeout]:
+                self._running.discard(task)
+                self.timed_out += 1
+                # Counted as a slow completion, so a share that keeps hanging gets fewer walks
+                self.limiters[task.root].finished(self.timeout, now)
+                error = WalkTimeout(task.folder_path, self.timeout, task.attempts)
+                if self._should_retry(task, error):
+                    messages.append(self._retry(task, error, now))
+                else:
+                    task.future.set_exception(error)
+                    messages.append(f"{self.name}: giving up on '{task.folder_path}': {error}")
+        due = [task for task in self._delayed if task.not_before <= now]
+        if due:
+            self._delayed = [task for task in self._delayed if task.not_before > now]
+            for task in due:
+                self._queues[task.root].appendleft(task)
+        if messages or due:
+            self._dispatch()
+            self._notify_idle()
+        return messages
+
+    def _emit(self, messages):
+        if self.log:
+            for message in messages:
+                self.log(message)
+
+    def _notify_idle(self):
+        if not self._pending():
+            self._idle.notify_all()
+
+    # One line per root with its final concurrency, throughput and latency
+    def summary_lines(self):
+        lines = []
+        for root, state in self.snapshot().items():
+            rate = "n/a" if state["throughput"] is None else f"{state['throughput']:.1f} folders/s"
+            latency = "n/a" if state["latency"] is None else f"{state['latency'] * 1000:.1f} ms per folder"
+            lines.append(f"{self.name}: '{root}' finished at {state['limit']} workers after {state['adjustments']} adjustments "
+                         f"({state['completed']} folders, {rate}, {latency})")
+        if self.timed_out or self.retried:
+            lines.append(f"{self.name}: {self.timed_out} walks timed out, {self.retried} retries")
+        return lines
+
+    def _pending(self):
+        return any(self._queues.values()) or bool(self._running) or bool(self._delayed)
+
+    def snapshot(self):
+        with self._lock:
+            return {root: limiter.snapshot() for root, limiter in self.limiters.items()}
+
+    # Like ThreadPoolExecutor.shutdown: with wait, queued tasks still run (they are dispatched as
+    # running ones finish); cancel_futures drops the ones that have not started. Walks abandoned
+    # after a timeout are never waited for.
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            if cancel_futures:
+                for queue in self._queues.values():
+                    for task in queue:
+                        if task.attempts == 0:
+                            task.future.cancel()
+                        else:
+                            task.future.set_exception(CancelledError())
+                    queue.clear()
+                for task in self._delayed:
+                    task.future.set_exception(CancelledError())
+                self._delayed = []
+            if wait:
+                while self._pending():
+                    self._idle.wait()
+            self._closed = True
+            self._wakeup.notify_all()
+            for workers in self._workers.values():
+                workers.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
+
+# Function to create the scheduler of a scan backend; both take the same options and return Futures
+# from submit(). async_scan and process_scan are only imported when they are used.
+def create_scheduler(backend, name, *args, **kwargs):
+    if backend == 'asyncio':
+        from async_scan import AsyncScheduler
+        return AsyncScheduler(name, *args, **kwargs)
+    if backend == 'processes':
+        from process_scan import ProcessScheduler
+        return ProcessScheduler(name, *args, **kwargs)
+    return AdaptiveScheduler(name, *args, **kwargs)
@@ -0,0 +1,56 @@
+# scan_scope.py
+
+from fnmatch import fnmatchcase
+
+# Function to split comma-separated selector values ('fh5,fm7') into a list, dropping empty ones
+def split_values(values):
+    return [value.strip() for text in values or () for value in text.split(',') if value.strip()]
+
+# The part of the catalog a scoped build refreshes (--games, --manufacturer, --match). `games` are
+# game codes (game_folder_codes values, such as 'fh5'); `manufacturers` are folder name prefixes
+# ('POR') or manufacturer names ('Porsche'); `patterns` are shell-style patterns on the folder name
+# ('POR_*'). All are case-insensitive. A folder is in scope when it matches every kind of selector
+# given, and any value of each. Only the roots of the selected games are listed; the folders outside
+# the scope are taken from the caches as the last build left them.
+class ScanScope:
+    def __init__(self, games=(), manufacturers=(), patterns=(), game_codes=None):
+        self.games = {game.lower() for game in games}
+        self.manufacturers = {manufacturer.lower() for manufacturer in manufacturers}
+        self.patterns = [pattern.lower() for pattern in patterns]
+        # {game root: game code}
+        self.game_codes = game_codes or {}
+        unknown = self.games - {code.lower() for code in self.game_codes.values()}
+        if unknown:
+            raise ValueError(f"Unknown game code(s): {', '.join(sorted(unknown))}; expected one of {', '.join(sorted(set(self.game_codes.values())))}")
+
+    # None when no selector is given, so the build is not scoped at all
+    @classmethod
+    def from_selectors(cls, games=(), manufacturers=(), patterns=(), game_codes=None):
+        if not (games or manufacturers or patterns):
+            return None
+        return cls(games, manufacturers, patterns, game_codes)
+
+    # Whether a game root is listed (it may hold folders in scope)
+    def lists_root(self, root):
+        return not self.games or self.game_codes.get(root, '').lower() in self.games
+
+    # Whether a car folder of a listed root is in scope; `parsed` is its ParsedName
+    def includes(self, root, folder_name, parsed):
+        if not self.lists_root(root):
+            return False
+        name = folder_name.lower()
+        if self.manufacturers and name.split('_', 1)[0] not in self.manufacturers and parsed.manufacturer.lower() not in self.manufacturers:
+            return False
+        if self.patterns and not any(fnmatchcase(name, pattern) for pattern in self.patterns):
+            return False
+        return True
+
+    def describe(self):
+        parts = []
+        if self.games:
+            parts.append(f"games {', '.join(sorted(self.games))}")
+        if self.manufacturers:
+            parts.append(f"manufacturers {', '.join(sorted(self.manufacturers))}")
+        if self.patterns:
+            parts.append(f"folders matching {', '.join(self.patterns)}")
+        return "; ".join(parts)
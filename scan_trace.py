@@ -0,0 +1,84 @@
+# scan_trace.py
+
+import json
+import functools
+import inspect
+import os
+import threading
+import time
+
+# Records one span per thread-pool task and writes them as Chrome trace-event JSON,
+# which can be loaded in about://tracing or https://ui.perfetto.dev
+class TaskTracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    # Convert a perf_counter reading to microseconds since the tracer was created
+    def _timestamp(self, seconds):
+        return (seconds - self._origin) * 1_000_000
+
+    # Record a finished task span for the calling thread
+    def record(self, stage, folder_path, start, end, **extra_args):
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+        args = {"folder": folder_path, "root": os.path.dirname(folder_path)}
+        args.update(extra_args)
+        event = {
+            "name": os.path.basename(folder_path),
+            "cat": stage,
+            "ph": "X",
+            "ts": self._timestamp(start),
+            "dur": (end - start) * 1_000_000,
+            "pid": self._pid,
+            "tid": tid,
+            "args": args,
+        }
+        with self._lock:
+            self._events.append(event)
+            self._thread_names.setdefault(tid, thread.name)
+
+    # Wrap a per-folder task function so every call is recorded as a span. Coroutine tasks (the asyncio
+    # backend) all record on the event loop thread, so their spans overlap on that one track.
+    def wrap(self, stage, func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def traced_async(folder_path, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(folder_path, *args, **kwargs)
+                finally:
+                    self.record(stage, folder_path, start, time.perf_counter())
+            return traced_async
+
+        @functools.wraps(func)
+        def traced(folder_path, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(folder_path, *args, **kwargs)
+            finally:
+                self.record(stage, folder_path, start, time.perf_counter())
+        return traced
+
+    # Build the trace-event document, including thread name metadata so workers are labelled
+    def to_dict(self):
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": "forza_vehicle_db"}}
+        ]
+        for tid, name in sorted(thread_names.items()):
+            metadata.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+
+        events.sort(key=lambda event: event["ts"])
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write(self, output_path):
+        with open(output_path, 'w') as trace_file:
+            json.dump(self.to_dict(), trace_file)
+        return output_path
@@ -0,0 +1,106 @@
+# size_tree.py
+
+import os
+from collections import namedtuple
+
+# One directory in the size cache: its mtime when last listed, the bytes of the files directly in it,
+# its subdirectory names and the total of the whole subtree
+DirectoryNode = namedtuple('DirectoryNode', ['mtime_ns', 'own_size', 'subdirs', 'total'])
+
+# Keys of the aggregate nodes kept next to the directory nodes
+GAME_KEY_PREFIX = 'game:'
+
+# Function to check a cached node; nodes written by older versions carry a fifth field, a fingerprint
+# that is no longer used, and are read without it
+def is_valid_node(value):
+    return (isinstance(value, tuple) and len(value) in (4, 5) and isinstance(value[1], int) and value[1] >= 0
+            and isinstance(value[2], tuple) and isinstance(value[3], int) and value[3] >= 0)
+
+# Function to read a valid cached node
+def load_node(value):
+    return DirectoryNode(*value[:4])
+
+# Function to list one directory: the bytes of the files in it and its subdirectory names. Like
+# os.walk, symlinked directories are neither counted nor followed, and unreadable files are skipped.
+def scan_directory(path):
+    own_size, subdirs = 0, []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.name)
+                else:
+                    own_size += entry.stat().st_size
+            except OSError:
+                continue
+    return own_size, tuple(sorted(subdirs))
+
+# Function to read the total a cache recorded for a folder, from a node or an older plain byte count;
+# None when there is none. Used as a hint even where the entry itself is no longer trusted.
+def cached_total(cache, path):
+    try:
+        value = cache.get(path)
+    except Exception:
+        return None
+    if is_valid_node(value):
+        return value[3]
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    return None
+
+# Function to gather the cached nodes of a subtree (the directory and, recursively, the subdirectories
+# its node lists) from a cache, without touching the disk
+def collect_cached_nodes(path, cache):
+    nodes, pending = {}, [path]
+    while pending:
+        current = pending.pop()
+        try:
+            node = cache.get(current)
+        except Exception:
+            node = None
+        if not is_valid_node(node):
+            continue
+        node = load_node(node)
+        nodes[current] = node
+        pending.extend(os.path.join(current, name) for name in node.subdirs)
+    return nodes
+
+# Function to bring a subtree up to date. Each directory is stat'ed; one whose mtime still matches its
+# cached node keeps its own size and subdirectory list, anything else is listed again. Totals are
+# re-summed upward. Returns (node, changed nodes by path, paths of the directories
+# listed again, number of directories checked).
+def refresh_tree(path, cached_nodes):
+    changed = {}
+    listed = []
+    checked = 0
+
+    def refresh(current):
+        nonlocal checked
+        mtime_ns = os.stat(current).st_mtime_ns
+        checked += 1
+        node = cached_nodes.get(current)
+        if node is not None and node.mtime_ns == mtime_ns:
+            own_size, subdirs = node.own_size, node.subdirs
+        else:
+            own_size, subdirs = scan_directory(current)
+            listed.append(current)
+        children = []
+        for name in subdirs:
+            try:
+                children.append((name, refresh(os.path.join(current, name))))
+            except FileNotFoundError:
+                # Removed since the parent was listed; its parent's mtime changed too, so it is relisted next time
+                continue
+        new_node = DirectoryNode(mtime_ns, own_size, subdirs, own_size + sum(child.total for _, child in children))
+        if node != new_node:
+            changed[current] = new_node
+        return new_node
+
+    return refresh(path), changed, listed, checked
+
+# Function to build an aggregate node (a game root over its car folders, a game over its roots)
+# from child nodes; it only reads their totals
+def aggregate_node(children):
+    children = sorted(children.items())
+    return DirectoryNode(0, 0, tuple(name for name, _ in children), sum(child.total for _, child in children))
@@ -0,0 +1,93 @@
+# vehicle_records.py
+
+import os
+
+# Function to build the grouping key of a parsed folder name. Only the identity fields count;
+# logo paths are derived from them and are not part of what makes two folders the same car.
+def identity_key(parsed):
+    return (parsed.manufacturer, parsed.model, parsed.year, parsed.variant, parsed.race_number)
+
+# One car folder inside a game root. Unpacks like the (folder_path, original_name) tuples it replaces.
+class Occurrence:
+    __slots__ = ('root', 'name')
+
+    def __init__(self, root, name):
+        self.root = root
+        self.name = name
+
+    @property
+    def path(self):
+        return os.path.join(self.root, self.name)
+
+    def __iter__(self):
+        yield self.root
+        yield self.name
+
+    def __eq__(self, other):
+        return isinstance(other, Occurrence) and self.root == other.root and self.name == other.name
+
+    def __hash__(self):
+        return hash((self.root, self.name))
+
+    def __repr__(self):
+        return f"Occurrence({self.root!r}, {self.name!r})"
+
+# A car and every folder it occurs in, in the order they were found. The occurrences form an
+# insertion-ordered set: the first occurrence is stored inline as two slots; the others sit
+# in a short list (a car is in at most one folder per game) that becomes a dict if it ever grows past
+# SMALL_SET_LIMIT, so adding stays O(1) without paying for a dict per car.
+class Vehicle:
+    __slots__ = ('parsed', '_root', '_name', '_others')
+
+    SMALL_SET_LIMIT = 16
+
+    def __init__(self, parsed, first):
+        self.parsed = parsed
+        self._root, self._name = first
+        self._others = None
+
+    @property
+    def first(self):
+        return Occurrence(self._root, self._name)
+
+    # Add an occurrence; returns False if it was already recorded
+    def add(self, occurrence):
+        if occurrence.root == self._root and occurrence.name == self._name:
+            return False
+        others = self._others
+        if others is None:
+            self._others = [occurrence]
+            return True
+        if occurrence in others:
+            return False
+        if isinstance(others, list) and len(others) >= self.SMALL_SET_LIMIT:
+            others = self._others = dict.fromkeys(others)
+        if isinstance(others, dict):
+            others[occurrence] = None
+        else:
+            others.append(occurrence)
+        return True
+
+    @property
+    def occurrences(self):
+        return list(self)
+
+    def __len__(self):
+        return 1 + (len(self._others) if self._others else 0)
+
+    def __iter__(self):
+        yield self.first
+        if self._others:
+            yield from self._others
+
+    def __repr__(self):
+        return f"Vehicle({self.parsed.manufacturer!r}, {self.parsed.model!r}, {len(self)} occurrences)"
+
+# Function to group an occurrence under its car, creating the Vehicle on first sight
+def add_occurrence(vehicles, parsed, occurrence):
+    key = identity_key(parsed)
+    vehicle = vehicles.get(key)
+    if vehicle is None:
+        vehicles[key] = Vehicle(parsed, occurrence)
+        return True
+    return vehicle.add(occurrence)